@@ -26,8 +26,36 @@ def create_app(config_class=Config):
     from app.routes.admin import admin as admin_blueprint
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
     
+    # Armazenamento dos bloqueios temporários de horário (HOLD_STORE)
+    from app.services.hold_store import init_hold_store
+    init_hold_store(app)
+    
+    # Configurações do site em memória (SiteSettings)
+    from app.services.settings_store import init_settings_store
+    init_settings_store(app)
+    
+    # Cache do usuário logado (user_loader do Flask-Login)
+    from app.services.identity_cache import init_identity_cache
+    init_identity_cache(app)
+    
+    # Consultas SQL por requisição (Server-Timing e detecção de N+1)
+    from app.services.query_stats import init_query_stats
+    init_query_stats(app)
+    
+    # Diário das consultas lentas, com o plano de execução (painel do admin)
+    from app.services.slow_query_journal import init_slow_query_journal
+    init_slow_query_journal(app)
+    
+    # Gravação em lote do log de auditoria (AUDIT_LOG_MODE)
+    from app.services.audit_writer import init_audit_writer
+    init_audit_writer(app)
+    
     # Registrar a função como filtro global do Jinja2
     from app.routes.main import get_youtube_id  # Importando a função do main.py
     app.jinja_env.filters['youtube_id'] = get_youtube_id
     
+    # Chave de idempotência dos formulários de reserva
+    from app.services.idempotency import new_idempotency_key
+    app.jinja_env.globals['new_idempotency_key'] = new_idempotency_key
+    
     return app
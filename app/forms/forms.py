@@ -66,8 +66,15 @@ class BlockedTimeForm(FlaskForm):
     ], validators=[DataRequired()])
     start_time = TimeField('Hora de Início', format='%H:%M', validators=[DataRequired()])
     end_time = TimeField('Hora de Fim', format='%H:%M', validators=[DataRequired()])
+    valid_from = DateField('Válido a partir de', format='%Y-%m-%d', validators=[Optional()])
+    valid_until = DateField('Válido até', format='%Y-%m-%d', validators=[Optional()])
     submit = SubmitField('Bloquear Horário')
 
+# Formulário para liberar um bloqueio recorrente em uma data específica
+class BlockedTimeExceptionForm(FlaskForm):
+    date = DateField('Data', format='%Y-%m-%d', validators=[DataRequired()])
+    submit = SubmitField('Liberar nesta data')
+
 # Formulário para agendar aumento de preço
 class PriceIncreaseForm(FlaskForm):
     new_price_2h30 = FloatField('Novo Preço 2h30', validators=[DataRequired()])
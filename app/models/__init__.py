@@ -1,2 +1,3 @@
-from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserTutorialPreference, TempLock, ParkingSpot, ParkingReservation
-from app.models.equipment import RentableEquipment, EquipmentReservation
+from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserStats, UserTutorialPreference, TempLock, IdempotencyKey, ParkingSpot, ParkingReservation
+from app.models.equipment import RentableEquipment, EquipmentReservation, EquipmentDayUsage
+from app.models.availability import RoomDayGrid, ReservationSlot
@@ -0,0 +1,34 @@
+from app import db
+import datetime
+
+class RoomDayGrid(db.Model):
+    """Grade de ocupação materializada de uma sala em um dia (mantida pelas rotas de escrita)."""
+    __tablename__ = 'room_day_grid'
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    # Lista JSON de [status, início_min, fim_min, rótulo, id_origem, expira_em]
+    entries = db.Column(db.Text, nullable=False, default='[]')
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Expiração mais próxima entre os bloqueios temporários vivos (a grade muda sozinha nesse instante)
+    next_expiry = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    # A versão serve de trava otimista: duas escritas concorrentes na mesma grade não se sobrescrevem
+    __mapper_args__ = {'version_id_col': version}
+    
+    def __repr__(self):
+        return f"RoomDayGrid(Room: {self.room_id}, Date: {self.date}, v{self.version})"
+
+class ReservationSlot(db.Model):
+    """Quarto de hora de uma sala ocupado por uma reserva (a chave primária impede reserva dupla no banco)."""
+    __tablename__ = 'reservation_slot'
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), primary_key=True)
+    reservation_date = db.Column(db.Date, primary_key=True)
+    # Índice do quarto de hora no dia (0 = 00h00, 28 = 07h00, ...)
+    slot = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservation.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    reservation = db.relationship('Reservation', backref=db.backref('slot_claims', lazy=True, cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f"ReservationSlot(Room: {self.room_id}, Date: {self.reservation_date}, Slot: {self.slot})"
@@ -15,8 +15,34 @@ class RentableEquipment(db.Model):
 
 class EquipmentReservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Primeiro dia do aluguel
     reservation_date = db.Column(db.Date, nullable=False, index=True)
+    # Último dia do aluguel (inclusive); nulo nas reservas antigas de um dia só
+    end_date = db.Column(db.Date, nullable=True)
     is_paid = db.Column(db.Boolean, default=False)
     price = db.Column(db.Float)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     equipment_id = db.Column(db.Integer, db.ForeignKey('rentable_equipment.id'), nullable=False)
+    
+    # Reservas de um equipamento a partir de uma data e linha do tempo do usuário
+    __table_args__ = (
+        db.Index('ix_equipment_reservation_equipment_date', 'equipment_id', 'reservation_date'),
+        db.Index('ix_equipment_reservation_user_date', 'user_id', 'reservation_date'),
+    )
+    
+    @property
+    def last_date(self):
+        return self.end_date or self.reservation_date
+    
+    @property
+    def days(self):
+        return (self.last_date - self.reservation_date).days + 1
+
+class EquipmentDayUsage(db.Model):
+    """Unidades de um equipamento já reservadas em um dia (mantido pela rota de reserva)."""
+    __tablename__ = 'equipment_day_usage'
+    equipment_id = db.Column(db.Integer, db.ForeignKey('rentable_equipment.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    reserved_units = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.CheckConstraint('reserved_units >= 0', name='ck_equipment_day_usage_non_negative'),)
@@ -8,34 +8,37 @@ from flask import current_app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Colunas usadas pela autorização e pelos templates, em cache por alguns segundos
+    from app.services.identity_cache import load_identity
+    return load_identity(int(user_id))
 
 # --- Modelos ---
 class User(db.Model, UserMixin):
+    # Colunas em grupos adiados ('personal', 'vehicle', 'kyc') só são lidas quando usadas (app/services/list_queries.py)
     id = db.Column(db.Integer, primary_key=True)
     nome_completo = db.Column(db.String(150), nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     cro = db.Column(db.String(20), unique=True, nullable=False)
-    whatsapp = db.Column(db.String(20), unique=True, nullable=False)
-    cpf = db.Column(db.String(20), unique=True, nullable=False)
-    data_nascimento = db.Column(db.Date, nullable=False)
+    whatsapp = db.deferred(db.Column(db.String(20), unique=True, nullable=False), group='personal')
+    cpf = db.deferred(db.Column(db.String(20), unique=True, nullable=False), group='personal')
+    data_nascimento = db.deferred(db.Column(db.Date, nullable=False), group='personal')
     genero = db.Column(db.String(10), nullable=False)
     uf_cro = db.Column(db.String(2), nullable=False)
-    num_cro = db.Column(db.String(10), nullable=False)
+    num_cro = db.deferred(db.Column(db.String(10), nullable=False), group='personal')
     profile_image = db.Column(db.String(20), nullable=False, default="default.jpg")
     score = db.Column(db.Integer, default=0)
     is_admin = db.Column(db.Boolean, default=False)
     last_seen = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     fobs_balance = db.Column(db.Float, default=0.0)
     contract_accepted_version = db.Column(db.Integer, default=0)
-    veiculo_modelo = db.Column(db.String(100))
-    veiculo_placa = db.Column(db.String(10))
+    veiculo_modelo = db.deferred(db.Column(db.String(100)), group='vehicle')
+    veiculo_placa = db.deferred(db.Column(db.String(10)), group='vehicle')
     is_vip = db.Column(db.Boolean, default=False)
-    ip_address = db.Column(db.String(45))
-    selfie_filename = db.Column(db.String(255))
-    document_filename = db.Column(db.String(255))
-    signature_filename = db.Column(db.String(255))
+    ip_address = db.deferred(db.Column(db.String(45)), group='kyc')
+    selfie_filename = db.deferred(db.Column(db.String(255)), group='kyc')
+    document_filename = db.deferred(db.Column(db.String(255)), group='kyc')
+    signature_filename = db.deferred(db.Column(db.String(255)), group='kyc')
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     reservations = db.relationship("Reservation", backref="booker", lazy=True)
     temp_locks = db.relationship('TempLock', backref='user', lazy='dynamic')
@@ -69,24 +72,40 @@ class BlockedTime(db.Model):
     day_of_week = db.Column(db.String(10), nullable=False)
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
+    # Período de validade opcional (bloqueio recorrente só entre essas datas)
+    valid_from = db.Column(db.Date, nullable=True)
+    valid_until = db.Column(db.Date, nullable=True)
     room = db.relationship('Room', backref=db.backref('blocked_times', lazy=True))
+    exceptions = db.relationship('BlockedTimeException', backref='blocked_time', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_blocked_time_room_day', 'room_id', 'day_of_week'),)
+    
+# Datas em que um bloqueio recorrente não vale (ex.: feriado, liberação pontual)
+class BlockedTimeException(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    blocked_time_id = db.Column(db.Integer, db.ForeignKey('blocked_time.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('blocked_time_id', 'date', name='uq_blocked_time_exception_date'),)
     
 class Room(db.Model):
+    # Vídeos ('media') e textos ('notes') são grupos adiados: as listas não os carregam (app/services/list_queries.py)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
-    description = db.Column(db.Text, nullable=True)
+    description = db.deferred(db.Column(db.Text, nullable=True), group='notes')
     price_2h30 = db.Column(db.Float, nullable=False)
     price_1h15 = db.Column(db.Float, nullable=False)
-    video_url = db.Column(db.String(200), nullable=True)
-    video_tutorial_url = db.Column(db.String(200), nullable=True)
-    video_tutorial_autoclave_url = db.Column(db.String(200), nullable=True)
-    video_tutorial_raiox_url = db.Column(db.String(200), nullable=True)
-    video_tutorial_plastificadora_url = db.Column(db.String(200), nullable=True)
+    video_url = db.deferred(db.Column(db.String(200), nullable=True), group='media')
+    video_tutorial_url = db.deferred(db.Column(db.String(200), nullable=True), group='media')
+    video_tutorial_autoclave_url = db.deferred(db.Column(db.String(200), nullable=True), group='media')
+    video_tutorial_raiox_url = db.deferred(db.Column(db.String(200), nullable=True), group='media')
+    video_tutorial_plastificadora_url = db.deferred(db.Column(db.String(200), nullable=True), group='media')
     image_file = db.Column(db.String(20), nullable=False, default="default_room.jpg")
     is_active = db.Column(db.Boolean, default=True)
-    admin_notice = db.Column(db.Text)
+    admin_notice = db.deferred(db.Column(db.Text), group='notes')
     allow_1h15_rental = db.Column(db.Boolean, default=True)
     is_visible = db.Column(db.Boolean, default=True)
+    info_version = db.Column(db.Integer, nullable=False, default=1)  # Incrementada a cada edição e mudança de bloqueios (ETag de /get-room-info)
     
     reservations = db.relationship("Reservation", backref="room", lazy=True)
     temp_locks = db.relationship('TempLock', backref='room', lazy='dynamic')
@@ -110,6 +129,12 @@ class Reservation(db.Model):
     is_paid = db.Column(db.Boolean, default=False, index=True)
     total_price = db.Column(db.Float)
     
+    # Grade de uma sala no período e linha do tempo / métricas de um usuário
+    __table_args__ = (
+        db.Index('ix_reservation_room_date_start', 'room_id', 'reservation_date', 'start_time'),
+        db.Index('ix_reservation_user_date', 'user_id', 'reservation_date'),
+    )
+    
     def __repr__(self):
         return f"Reservation(User: {self.user_id}, Room: {self.room_id}, Start: {self.start_time}, End: {self.end_time})"
 class Tutorial(db.Model):
@@ -137,6 +162,18 @@ class ApiLog(db.Model):
     details = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     ip_address = db.Column(db.String(45))
+    
+    # Cancelamentos de um usuário (reconciliação de user_stats)
+    __table_args__ = (db.Index('ix_api_log_user_event', 'user_id', 'event_type'),)
+class UserStats(db.Model):
+    """Métricas do painel do usuário, atualizadas junto com as reservas (ver app/services/user_stats.py)."""
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    paid_reservations = db.Column(db.Integer, nullable=False, default=0)
+    cancellations = db.Column(db.Integer, nullable=False, default=0)
+    lifetime_spend = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 class UserTutorialPreference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -152,7 +189,27 @@ class TempLock(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    # Consultas de disponibilidade filtram por sala, data e expiração
+    __table_args__ = (db.Index('ix_temp_lock_room_date_expires', 'room_id', 'date', 'expires_at'),)
+class IdempotencyKey(db.Model):
+    """Resposta guardada de um POST com Idempotency-Key, repetida nas retentativas do mesmo usuário."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(128), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    # Hash do corpo da requisição: a mesma chave com outro conteúdo é recusada
+    request_hash = db.Column(db.String(64), nullable=False)
+    # Nulo enquanto a primeira requisição ainda está sendo processada
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    # JSON com mimetype, Location e mensagens flash da resposta original
+    response_meta = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),)
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
@@ -163,3 +220,12 @@ class ParkingReservation(db.Model):
     reservation_date = db.Column(db.Date, nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    # Janela de uso da vaga (a das reservas de sala do usuário no dia); nula nas reservas antigas de dia inteiro
+    start_time = db.Column(db.Time, nullable=True)
+    end_time = db.Column(db.Time, nullable=True)
+    
+    # Ocupação de uma vaga no dia e a reserva única do usuário no dia
+    __table_args__ = (
+        db.Index('ix_parking_reservation_spot_date', 'spot_id', 'reservation_date'),
+        db.Index('ix_parking_reservation_user_date', 'user_id', 'reservation_date'),
+    )
@@ -1,8 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserTutorialPreference, TempLock, ParkingSpot, ParkingReservation, BlockedTime
+from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserTutorialPreference, TempLock, ParkingSpot, ParkingReservation, BlockedTime, BlockedTimeException
 from app.models.equipment import RentableEquipment, EquipmentReservation, Equipment
-from app.forms.forms import AdminEditUserForm, RoomForm, BlockedTimeForm, PriceIncreaseForm, EquipmentForm, RentableEquipmentForm, TutorialForm, SettingsForm, DefaultPricesForm
+from app.models.availability import RoomDayGrid, ReservationSlot
+from app.services.availability_grid import refresh_blocks
+from app.services.block_schedule import duplicate_block_query
+from app.services.temp_lock_reaper import lock_metrics
+from app.services.audit_writer import audit_metrics
+from app.services.query_stats import query_budget
+from app.services.slow_query_journal import slow_query_journal
+from app.services.settings_store import current_settings, update_settings
+from app.services.user_stats import record_payment
+from app.services.list_queries import ROOM_DETAIL_OPTIONS, rooms_for_admin_list, reservations_for_day, unpaid_reservations as unpaid_reservations_list
+from app.services.user_search import search_users, TYPEAHEAD_LIMIT
+from app.forms.forms import AdminEditUserForm, RoomForm, BlockedTimeForm, BlockedTimeExceptionForm, PriceIncreaseForm, EquipmentForm, RentableEquipmentForm, TutorialForm, SettingsForm, DefaultPricesForm
 from app import db
 import datetime
 from functools import wraps
@@ -54,10 +65,24 @@ def dashboard():
 # --- Rotas de Gerenciamento de Usuários ---
 @admin.route('/users')
 @admin_required
+@query_budget(3)
 def users_list():
-    page = request.args.get('page', 1, type=int)
-    users = User.query.order_by(User.nome_completo).paginate(page=page, per_page=15)
-    return render_template('admin_users_list.html', users=users)
+    q = request.args.get('q', '').strip()
+    try:
+        users, next_cursor = search_users(q, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('admin.users_list', q=q or None))
+    return render_template('admin_users_list.html', users=users, q=q, next_cursor=next_cursor)
+@admin.route('/users/search')
+@admin_required
+def users_search():
+    # Autocompletar da busca de usuários
+    users, _ = search_users(request.args.get('q', ''), limit=TYPEAHEAD_LIMIT)
+    return jsonify([
+        {'id': user.id, 'nome_completo': user.nome_completo, 'email': user.email, 'cro': f'{user.cro}/{user.uf_cro}',
+         'url': url_for('admin.edit_user', user_id=user.id)}
+        for user in users
+    ])
     
 @admin.route('/garage')
 @admin_required
@@ -90,8 +115,9 @@ def edit_user(user_id):
 # --- Rotas de Gerenciamento de Salas e Equipamentos ---
 @admin.route('/manage_rooms')
 @admin_required
+@query_budget(2)
 def rooms_list():
-    rooms = Room.query.order_by(Room.name).all()
+    rooms = rooms_for_admin_list()
     return render_template('admin_rooms_list.html', rooms=rooms)
 
 @admin.route('/default-prices', methods=['GET', 'POST'])
@@ -99,31 +125,21 @@ def rooms_list():
 def default_prices():
     form = DefaultPricesForm()
     
-    # Buscar preços padrão atuais
-    price_2h30_setting = SiteSettings.query.filter_by(key='default_price_2h30').first()
-    price_1h15_setting = SiteSettings.query.filter_by(key='default_price_1h15').first()
-    
     if form.validate_on_submit():
         # Salvar ou atualizar preços padrão
-        if not price_2h30_setting:
-            price_2h30_setting = SiteSettings(key='default_price_2h30')
-            db.session.add(price_2h30_setting)
-        price_2h30_setting.value = str(form.default_price_2h30.data)
-        
-        if not price_1h15_setting:
-            price_1h15_setting = SiteSettings(key='default_price_1h15')
-            db.session.add(price_1h15_setting)
-        price_1h15_setting.value = str(form.default_price_1h15.data)
-        
-        db.session.commit()
+        update_settings(
+            default_price_2h30=form.default_price_2h30.data,
+            default_price_1h15=form.default_price_1h15.data
+        )
         flash('Preços padrão atualizados com sucesso!', 'success')
         return redirect(url_for('admin.default_prices'))
     
     # Preencher formulário com valores atuais
-    if price_2h30_setting:
-        form.default_price_2h30.data = float(price_2h30_setting.value)
-    if price_1h15_setting:
-        form.default_price_1h15.data = float(price_1h15_setting.value)
+    settings = current_settings()
+    if settings.values.get('default_price_2h30') is not None:
+        form.default_price_2h30.data = settings.get('default_price_2h30')
+    if settings.values.get('default_price_1h15') is not None:
+        form.default_price_1h15.data = settings.get('default_price_1h15')
     
     return render_template('admin_default_prices.html', form=form)
 
@@ -135,16 +151,9 @@ def add_room():
     price_increase_form = PriceIncreaseForm()
     
     # Buscar preços padrão
-    default_price_2h30 = 90.0
-    default_price_1h15 = 55.0
-    
-    price_2h30_setting = SiteSettings.query.filter_by(key='default_price_2h30').first()
-    price_1h15_setting = SiteSettings.query.filter_by(key='default_price_1h15').first()
-    
-    if price_2h30_setting:
-        default_price_2h30 = float(price_2h30_setting.value)
-    if price_1h15_setting:
-        default_price_1h15 = float(price_1h15_setting.value)
+    settings = current_settings()
+    default_price_2h30 = settings.get('default_price_2h30')
+    default_price_1h15 = settings.get('default_price_1h15')
     
     if form.validate_on_submit():
         with session_management():
@@ -208,20 +217,13 @@ def add_room():
 @admin.route('/room/<int:room_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def edit_room(room_id):
-    room = Room.query.get_or_404(room_id)
+    room = Room.query.options(*ROOM_DETAIL_OPTIONS).get_or_404(room_id)
     form = RoomForm(obj=room)
     
     # Buscar preços padrão
-    default_price_2h30 = 90.0
-    default_price_1h15 = 55.0
-    
-    price_2h30_setting = SiteSettings.query.filter_by(key='default_price_2h30').first()
-    price_1h15_setting = SiteSettings.query.filter_by(key='default_price_1h15').first()
-    
-    if price_2h30_setting:
-        default_price_2h30 = float(price_2h30_setting.value)
-    if price_1h15_setting:
-        default_price_1h15 = float(price_1h15_setting.value)
+    settings = current_settings()
+    default_price_2h30 = settings.get('default_price_2h30')
+    default_price_1h15 = settings.get('default_price_1h15')
     
     if request.method == 'GET':
         # Preencher tags personalizadas (excluindo as padrão)
@@ -246,6 +248,7 @@ def edit_room(room_id):
             room.admin_notice = form.admin_notice.data
             room.allow_1h15_rental = form.allow_1h15_rental.data
             room.is_visible = form.is_visible.data
+            room.info_version = (room.info_version or 0) + 1  # Invalida o ETag de /get-room-info
             
             # Limpar todas as tags existentes
             room.equipments.clear()
@@ -288,6 +291,8 @@ def edit_room(room_id):
 def delete_room(room_id):
     with session_management():
         room = Room.query.get_or_404(room_id)
+        RoomDayGrid.query.filter_by(room_id=room.id).delete()
+        ReservationSlot.query.filter_by(room_id=room.id).delete()
         db.session.delete(room)
         flash(f'Sala "{room.name}" deletada com sucesso!', 'success')
         return redirect(url_for('admin.rooms_list'))
@@ -299,25 +304,58 @@ def block_time(room_id):
     if form.validate_on_submit():
         with session_management():
             room = Room.query.get_or_404(room_id)
-            existing_block = BlockedTime.query.filter_by(
-                room_id=room.id,
-                day_of_week=form.day_of_week.data,
-                start_time=form.start_time.data,
-                end_time=form.end_time.data
-            ).first()
+            existing_block = db.session.scalars(duplicate_block_query(
+                room.id, form.day_of_week.data, form.start_time.data, form.end_time.data,
+                form.valid_from.data, form.valid_until.data
+            )).first()
             if existing_block:
                 flash('Este bloqueio já existe para esta sala.', 'warning')
+            elif form.end_time.data <= form.start_time.data or (
+                    form.valid_from.data and form.valid_until.data and form.valid_until.data < form.valid_from.data):
+                flash('Período do bloqueio inválido.', 'danger')
             else:
                 new_blocked_time = BlockedTime(
                     room_id=room.id,
                     day_of_week=form.day_of_week.data,
                     start_time=form.start_time.data,
-                    end_time=form.end_time.data
+                    end_time=form.end_time.data,
+                    valid_from=form.valid_from.data,
+                    valid_until=form.valid_until.data
                 )
                 db.session.add(new_blocked_time)
+                db.session.flush()
+                # Recompila a agenda de bloqueios e atualiza as grades materializadas na mesma transação
+                refresh_blocks(room.id)
                 flash('Horário bloqueado com sucesso!', 'success')
     return redirect(url_for('admin.edit_room', room_id=room_id))
 
+@admin.route('/room/<int:room_id>/block-time/<int:block_id>/delete', methods=['POST'])
+@admin_required
+def delete_blocked_time(room_id, block_id):
+    with session_management():
+        blocked_time = BlockedTime.query.filter_by(id=block_id, room_id=room_id).first_or_404()
+        db.session.delete(blocked_time)
+        db.session.flush()
+        refresh_blocks(room_id)
+        flash('Bloqueio removido com sucesso!', 'success')
+    return redirect(url_for('admin.edit_room', room_id=room_id))
+
+@admin.route('/room/<int:room_id>/block-time/<int:block_id>/exception', methods=['POST'])
+@admin_required
+def blocked_time_exception(room_id, block_id):
+    form = BlockedTimeExceptionForm()
+    if form.validate_on_submit():
+        with session_management():
+            blocked_time = BlockedTime.query.filter_by(id=block_id, room_id=room_id).first_or_404()
+            if any(exception.date == form.date.data for exception in blocked_time.exceptions):
+                flash('Este bloqueio já está liberado nesta data.', 'warning')
+            else:
+                blocked_time.exceptions.append(BlockedTimeException(date=form.date.data))
+                db.session.flush()
+                refresh_blocks(room_id)
+                flash('Bloqueio liberado na data informada!', 'success')
+    return redirect(url_for('admin.edit_room', room_id=room_id))
+
 @admin.route('/settings/price-increase', methods=['POST'])
 @admin_required
 def price_increase():
@@ -354,6 +392,9 @@ def add_equipment():
 def delete_equipment(equipment_id):
     with session_management():
         equipment = Equipment.query.get_or_404(equipment_id)
+        # As salas com a tag perdem um item da lista de equipamentos: invalida o ETag de /get-room-info
+        for room in equipment.rooms:
+            room.info_version = (room.info_version or 0) + 1
         db.session.delete(equipment)
         flash('Equipamento/Tag removido com sucesso!', 'success')
     return redirect(url_for('admin.equipment_list'))
@@ -434,43 +475,31 @@ def delete_tutorial(tutorial_id):
 @admin_required
 def site_settings():
     form = SettingsForm()
-    contract = SiteSettings.query.filter_by(key='contract_text').first()
-    video_url = SiteSettings.query.filter_by(key='login_video_url').first()
     if form.validate_on_submit():
         with session_management():
-            if not contract:
-                contract = SiteSettings(key='contract_text', value=form.contract_text.data)
-                db.session.add(contract)
-            else:
-                contract.value = form.contract_text.data
-            if not video_url:
-                video_url = SiteSettings(key='login_video_url', value=form.login_video_url.data)
-                db.session.add(video_url)
-            else:
-                video_url.value = form.login_video_url.data
+            update_settings(contract_text=form.contract_text.data, login_video_url=form.login_video_url.data)
             flash('Configurações salvas com sucesso!', 'success')
             return redirect(url_for('admin.site_settings'))
-    if contract:
-        form.contract_text.data = contract.value
-    if video_url:
-        form.login_video_url.data = video_url.value
-    else:
-        form.login_video_url.data = "https://www.youtube.com/embed/Z0u9_xUv0ms"
+    settings = current_settings()
+    form.contract_text.data = settings.get('contract_text')
+    form.login_video_url.data = settings.get('login_video_url')
     return render_template('admin_settings.html', form=form)
 
 # --- Rotas Financeiras e de Reservas ---
 @admin.route('/reservas', methods=['GET', 'POST'])
 @admin_required
+@query_budget(3)
 def view_reservations():
     selected_date_str = request.form.get('selected_date', datetime.date.today().strftime('%Y-%m-%d'))
     selected_date = datetime.datetime.strptime(selected_date_str, '%Y-%m-%d').date()
-    reservations = Reservation.query.filter_by(reservation_date=selected_date).order_by(Reservation.start_time).all()
+    reservations = reservations_for_day(selected_date)
     return render_template('admin_reservations.html', reservations=reservations, selected_date=selected_date)
 
 @admin.route('/financial')
 @admin_required
+@query_budget(3)
 def financial_panel():
-    unpaid_reservations = Reservation.query.filter_by(is_paid=False).order_by(Reservation.reservation_date).all()
+    unpaid_reservations = unpaid_reservations_list()
     return render_template('admin_financials.html', unpaid=unpaid_reservations)
 
 @admin.route('/mark-as-paid/<int:reservation_id>', methods=['POST'])
@@ -480,7 +509,32 @@ def mark_as_paid(reservation_id):
         reservation = Reservation.query.get_or_404(reservation_id)
         if not reservation.is_paid:
             reservation.is_paid = True
-            user = reservation.user
+            user = reservation.booker
             user.score = (user.score or 0) + 8
+            record_payment(reservation)
             flash(f'Reserva de {user.nome_completo} marcada como paga. Score atualizado!', 'success')
         return redirect(url_for('admin.financial_panel'))
+
+# --- Métricas dos bloqueios temporários ---
+@admin.route('/temp-locks/metrics')
+@admin_required
+def temp_lock_metrics():
+    return jsonify(lock_metrics())
+# --- Métricas do log de auditoria ---
+@admin.route('/audit-log/metrics')
+@admin_required
+def audit_log_metrics():
+    return jsonify(audit_metrics(current_app))
+# --- Diário das consultas lentas ---
+@admin.route('/slow-queries')
+@admin_required
+def slow_queries():
+    return render_template('admin_slow_queries.html', groups=slow_query_journal.summary(),
+                           threshold_ms=slow_query_journal.threshold_ms, recorded=slow_query_journal.recorded,
+                           enabled=current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 100) > 0)
+@admin.route('/slow-queries/clear', methods=['POST'])
+@admin_required
+def clear_slow_queries():
+    slow_query_journal.clear()
+    flash('Diário de consultas lentas esvaziado.', 'success')
+    return redirect(url_for('admin.slow_queries'))
@@ -4,6 +4,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, current_user
 from app.models.user import User, SiteSettings
 from app.services.validation_service import verify_dentist_credentials, log_event
+from app.services.settings_store import get_setting
 from markupsafe import Markup
 from app.extensions import db
 from flask_wtf import FlaskForm
@@ -39,8 +40,7 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
     
-    video_setting = SiteSettings.query.filter_by(key='login_video_url').first()
-    video_url = video_setting.value if video_setting else "https://www.youtube.com/embed/Z0u9_xUv0ms"
+    video_url = get_setting('login_video_url')
     
     if request.method == 'POST':
         email = request.form.get('email')
@@ -62,8 +62,7 @@ def login():
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
     form = RegistrationForm()
-    video_setting = SiteSettings.query.filter_by(key='login_video_url').first()
-    video_url = video_setting.value if video_setting else "https://www.youtube.com/embed/Z0u9_xUv0ms"
+    video_url = get_setting('login_video_url')
 
     if request.method == 'POST':
         # --- LÓGICA DE VERIFICAÇÃO DE DUPLICIDADE ---
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, session
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, session, make_response, Response
 from flask_login import login_required, current_user, logout_user, login_user
 from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserTutorialPreference, TempLock, ParkingSpot, ParkingReservation, BlockedTime
-from app.models.equipment import RentableEquipment, EquipmentReservation
+from app.models.equipment import Equipment, RentableEquipment, EquipmentReservation
 from .. import db
 from datetime import datetime, timedelta, date, time
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 import os
 import requests
 import random
@@ -19,7 +22,28 @@ from io import BytesIO
 from werkzeug.utils import secure_filename
 from flask import current_app
 from app.services.validation_service import log_event
+from app.services.availability_service import WEEKDAYS, date_range, day_from_entries, to_minutes
+from app.services.slot_events import bus as slot_bus
+from app.services.equipment_service import reserve_units, free_units, usage_calendar, capacity as equipment_capacity, MAX_RENTAL_DAYS
+from app.services.parking_service import (
+    allocate_spot, best_fit_spot, day_allocations, minutes_to_time, parking_window, room_reservation_window, widen_parking_window,
+    spot_overlaps, user_parking_query, PARKING_OPEN_MINUTES, PARKING_CLOSE_MINUTES
+)
+from app.services.timeline_service import timeline_page
+from app.services.booking_service import claim_slots, reservation_price, weekly_occurrences, MAX_RECURRING_WEEKS
+from app.services.temp_lock_reaper import count_event as count_lock_event
+from app.services.hold_store import hold_store, holds_signature
+from app.services.idempotency import idempotent
+from app.services.query_stats import query_budget
+from app.services.settings_store import current_settings, get_setting
+from app.services.user_stats import record_booking, user_stats
+from app.services.list_queries import ROOM_DETAIL_OPTIONS, rooms_for_rent
+from app.services.opening_search import find_openings, parse_weekdays, parse_window
+from app.services.availability_grid import grid_snapshot, grid_versions, grid_for_update, grid_entries, load_grids, record_reservation
 import re
+import hashlib
+import json
+from time import monotonic
 # Removemos a importação de get_youtube_id de utils pois vamos usar a função local
 main = Blueprint('main', __name__)
 # --- FUNÇÃO AUXILIAR PARA EXTRAIR ID DO YouTube ---
@@ -61,85 +85,65 @@ def check_contract(f):
     @wraps(f)
     @login_required
     def decorated_function(*args, **kwargs):
-        current_contract_setting = SiteSettings.query.filter_by(key='contract_version').first()
-        current_version = int(current_contract_setting.value) if current_contract_setting else 1
+        current_version = get_setting('contract_version')
         if not current_user.is_admin and current_user.contract_accepted_version < current_version:
             return redirect(url_for('main.accept_contract'))
         return f(*args, **kwargs)
     return decorated_function
-# --- FUNÇÃO AUXILIAR PARA GERAR SLOTS (MODIFICADA) ---
-def generate_time_slots(date, all_unavailable):
-    slots = { '2h30': [], '1h15': [] }
-    base_slots_2h30 = [
-        (time(7, 0), time(9, 30)), (time(9, 30), time(12, 0)),
-        (time(12, 0), time(14, 30)), (time(14, 30), time(17, 0)),
-        (time(17, 0), time(19, 30)), (time(19, 30), time(22, 0))
-    ]
-    base_slots_1h15 = [
-        (time(7, 0), time(8, 15)), (time(8, 15), time(9, 30)),
-        (time(9, 30), time(10, 45)), (time(10, 45), time(12, 0)),
-        (time(12, 0), time(13, 15)), (time(13, 15), time(14, 30)),
-        (time(14, 30), time(15, 45)), (time(15, 45), time(17, 0)),
-        (time(17, 0), time(18, 15)), (time(18, 15), time(19, 30)),
-        (time(19, 30), time(20, 45)), (time(20, 45), time(22, 0))
-    ]
-    
-    def is_slot_occupied(start, end):
-        for (res_start, res_end), slot_info in all_unavailable.items():
-            # Verifica se há qualquer sobreposição
-            if max(start, res_start) < min(end, res_end):
-                return slot_info
+# --- FUNÇÃO AUXILIAR PARA SERIALIZAR UMA SALA ---
+def serialize_room(room):
+    return {
+        'id': room.id,
+        'name': room.name,
+        'description': room.description,
+        'price_2h30': room.price_2h30,
+        'price_1h15': room.price_1h15,
+        'video_url': room.video_url,
+        'video_tutorial_url': room.video_tutorial_url,
+        'video_tutorial_autoclave_url': room.video_tutorial_autoclave_url,
+        'video_tutorial_raiox_url': room.video_tutorial_raiox_url,
+        'video_tutorial_plastificadora_url': room.video_tutorial_plastificadora_url,
+        'admin_notice': room.admin_notice,
+        'allow_1h15_rental': room.allow_1h15_rental,
+        'is_visible': room.is_visible,
+        'equipments': [{'id': e.id, 'name': e.name} for e in room.equipments]
+    }
+# --- FUNÇÕES AUXILIARES DE GET CONDICIONAL (ETag) ---
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # O navegador guarda a resposta, mas sempre revalida com If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+def not_modified(etag):
+    """Retorna uma resposta 304 se o cliente já possui a representação com este ETag."""
+    if etag is None or not request.if_none_match.contains(etag):
         return None
-        
-    for start, end in base_slots_2h30:
-        slot_info = is_slot_occupied(start, end)
-        if slot_info:
-            status = slot_info['status']
-            user_name = slot_info.get('user_name', '')
-        else:
-            status = 'available'
-            user_name = ''
-            
-        slots['2h30'].append({
-            "start_str": start.strftime('%Hh%M'), "end_str": end.strftime('%Hh%M'),
-            "start_for_form": start.isoformat(), "end_for_form": end.isoformat(),
-            "status": status,
-            "user_name": user_name
-        })
-        
-    for start, end in base_slots_1h15:
-        slot_info = is_slot_occupied(start, end)
-        if slot_info:
-            status = slot_info['status']
-            user_name = slot_info.get('user_name', '')
-        else:
-            status = 'available'
-            user_name = ''
-            
-        slots['1h15'].append({
-            "start_str": start.strftime('%Hh%M'), "end_str": end.strftime('%Hh%M'),
-            "start_for_form": start.isoformat(), "end_for_form": end.isoformat(),
-            "status": status,
-            "user_name": user_name
-        })
-        
-    return slots
+    return with_etag(make_response('', 304), etag)
+def slots_etag(room_versions, grid_versions, holds=None):
+    """ETag forte de um conjunto de grades: combina a versão de cada sala, de cada grade (sala, data) e os holds vivos."""
+    payload = ';'.join(
+        [f'r{room_id}:{version}' for room_id, version in sorted(room_versions.items())] +
+        [f'g{room_id}:{day.isoformat()}:{version}' for (room_id, day), version in sorted(grid_versions.items())] +
+        [holds_signature(holds or {})]
+    )
+    return 'slots-' + hashlib.sha1(payload.encode('utf-8')).hexdigest()
 # --- ROTAS ---
 @main.route('/dashboard')
 @check_contract
+@query_budget(6)
 def dashboard():
     # --- NOVA LÓGICA DE DADOS PARA O PAINEL ---
     level, avatar_filename = get_user_level_and_avatar(current_user)
     
     # Busca configurações do site
-    show_fobs_setting = SiteSettings.query.filter_by(key='show_fobs').first()
-    show_fobs = show_fobs_setting and show_fobs_setting.value == 'true'
-    banner_setting = SiteSettings.query.filter_by(key='banner_gif_url').first()
-    banner_url = banner_setting.value if banner_setting else url_for('static', filename='img/banner.gif')
+    settings = current_settings()
+    show_fobs = settings.get('show_fobs')
+    banner_url = settings.get('banner_gif_url') or url_for('static', filename='img/banner.gif')
     
     # Calcula métricas de desempenho
-    reservas_pagas = Reservation.query.filter_by(user_id=current_user.id, is_paid=True).count()
-    cancelamentos = ApiLog.query.filter_by(user_id=current_user.id, event_type='Cancelamento de Reserva').count()
+    stats = user_stats(current_user.id)
+    reservas_pagas = stats.paid_reservations
+    cancelamentos = stats.cancellations
     linha_media = reservas_pagas - cancelamentos
     
     # Busca e seleciona itens para o banner de destaques
@@ -160,6 +164,7 @@ def dashboard():
                             highlight_items=highlight_items)
 @main.route('/alugar-sala', methods=['GET'])
 @check_contract
+@query_budget(4)
 def rent_room():
     # MODIFICADO: A rota agora passa as datas e a função get_youtube_id para o template
     selected_date_str = request.args.get('date', default=date.today().strftime('%Y-%m-%d'))
@@ -167,7 +172,7 @@ def rent_room():
     prev_date = selected_date - timedelta(days=1)
     next_date = selected_date + timedelta(days=1)
     
-    rooms = Room.query.filter_by(is_active=True, is_visible=True).order_by(Room.name).all()
+    rooms = rooms_for_rent()
     
     # ADICIONADO: Passando a função get_youtube_id para o template
     return render_template('rent_room.html', 
@@ -185,28 +190,116 @@ def get_room_info():
         return jsonify({'error': 'ID da sala não fornecido'}), 400
     
     try:
-        room = Room.query.get_or_404(room_id)
+        # Versão lida sem carregar a entidade: responde 304 antes de montar o JSON
+        info_version = db.session.execute(
+            select(Room.info_version).where(Room.id == int(room_id))
+        ).scalar()
+        etag = f'room-{room_id}-v{info_version}' if info_version is not None else None
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        return jsonify({
-            'id': room.id,
-            'name': room.name,
-            'description': room.description,
-            'price_2h30': room.price_2h30,
-            'price_1h15': room.price_1h15,
-            'video_url': room.video_url,
-            'video_tutorial_url': room.video_tutorial_url,
-            'video_tutorial_autoclave_url': room.video_tutorial_autoclave_url,
-            'video_tutorial_raiox_url': room.video_tutorial_raiox_url,
-            'video_tutorial_plastificadora_url': room.video_tutorial_plastificadora_url,
-            'admin_notice': room.admin_notice,
-            'allow_1h15_rental': room.allow_1h15_rental,
-            'is_visible': room.is_visible,
-            'equipments': [{'id': e.id, 'name': e.name} for e in room.equipments]
-        })
+        room = Room.query.options(*ROOM_DETAIL_OPTIONS).get_or_404(room_id)
+        
+        return with_etag(jsonify(serialize_room(room)), f'room-{room.id}-v{room.info_version}')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+# --- ROTA DE HORÁRIOS EM LOTE (VÁRIAS SALAS, VÁRIOS DIAS) ---
+MAX_BATCH_DAYS = 31
+@main.route('/get-rooms-slots')
+@check_contract
+def get_rooms_slots():
+    room_ids_param = request.args.get('room_ids', 'all')
+    start_str = request.args.get('start') or request.args.get('date')
+    end_str = request.args.get('end') or start_str
+    
+    if not start_str:
+        return jsonify({'error': 'Parâmetros ausentes'}), 400
+    
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Data inválida'}), 400
+    if end_date < start_date or (end_date - start_date).days >= MAX_BATCH_DAYS:
+        return jsonify({'error': f'Período inválido (máximo de {MAX_BATCH_DAYS} dias)'}), 400
+    
+    if room_ids_param == 'all':
+        room_filter = (Room.is_active == True) & (Room.is_visible == True)
+    else:
+        try:
+            room_ids = [int(room_id) for room_id in room_ids_param.split(',') if room_id.strip()]
+        except ValueError:
+            return jsonify({'error': 'Lista de salas inválida'}), 400
+        room_filter = Room.id.in_(room_ids)
+    
+    # Versões das salas e das grades lidas sem o ORM: 304 se nada mudou
+    room_versions = dict(db.session.execute(select(Room.id, Room.info_version).where(room_filter)).all())
+    days = date_range(start_date, end_date)
+    holds = hold_store().holds_for([(room_id, day) for room_id in room_versions for day in days])
+    versions = grid_versions(list(room_versions), start_date, end_date)
+    if versions is not None:
+        cached = not_modified(slots_etag(room_versions, versions, holds))
+        if cached:
+            return cached
+    
+    # Salas com os equipamentos carregados em uma única consulta extra
+    rooms = Room.query.options(*ROOM_DETAIL_OPTIONS, selectinload(Room.equipments)).filter(room_filter).order_by(Room.name).all()
+    
+    availability, versions = grid_snapshot([room.id for room in rooms], start_date, end_date, holds=holds)
+    room_versions = {room.id: room.info_version for room in rooms}
+    
+    return with_etag(jsonify({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'rooms': [
+            dict(serialize_room(room), days={
+                day.isoformat(): availability[(room.id, day)].slot_grid() for day in days
+            })
+            for room in rooms
+        ]
+    }), slots_etag(room_versions, versions, holds))
+# --- ROTA DE BUSCA DO PRÓXIMO HORÁRIO LIVRE ---
+MAX_SEARCH_DAYS = 366
+MAX_SEARCH_RESULTS = 200
+@main.route('/search-openings')
+@check_contract
+def search_openings():
+    """
+    Horários livres em todas as salas visíveis, do mais cedo para o mais tarde.
+    Filtros: duration (2h30/1h15), equipment (nomes separados por vírgula),
+    start (AAAA-MM-DD), days, weekday (ex.: tuesday), period (manha/tarde/noite)
+    ou from/to (HH:MM) e limit.
+    """
+    duration = request.args.get('duration', '2h30')
+    if duration not in ('2h30', '1h15'):
+        return jsonify({'error': 'Duração inválida'}), 400
+    try:
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else date.today()
+        days = request.args.get('days', 30, type=int)
+        limit = request.args.get('limit', 20, type=int)
+        weekdays = parse_weekdays(request.args.get('weekday'))
+        window = parse_window(request.args.get('period'), request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not 1 <= days <= MAX_SEARCH_DAYS or not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return jsonify({'error': f'Use days entre 1 e {MAX_SEARCH_DAYS} e limit entre 1 e {MAX_SEARCH_RESULTS}'}), 400
+    end_date = start_date + timedelta(days=days - 1)
+
+    rooms_query = Room.query.filter_by(is_active=True, is_visible=True)
+    for tag in [tag.strip() for tag in request.args.get('equipment', '').split(',') if tag.strip()]:
+        rooms_query = rooms_query.filter(Room.equipments.any(Equipment.name.ilike(f'%{tag}%')))
+
+    openings = find_openings(rooms_query.all(), start_date, end_date, duration, weekdays, window,
+                             limit=limit, ignore_owner=current_user.id)
+    return jsonify({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'openings': openings
+    })
 @main.route('/book-room', methods=['POST'])
 @check_contract
+@idempotent
 def book_room():
     data = request.json
     room_id = data.get('room_id')
@@ -219,61 +312,41 @@ def book_room():
         start_time = datetime.strptime(start_time_str, '%H:%M:%S').time()
         end_time = datetime.strptime(end_time_str, '%H:%M:%S').time()
         
-        # Verificar se já existe uma reserva para este horário
-        existing_reservation = Reservation.query.filter_by(
-            room_id=room_id,
-            reservation_date=selected_date,
-            start_time=start_time
-        ).first()
+        # Reservas, bloqueios temporários de outros usuários e horários bloqueados vêm da grade da sala/dia
+        grid = grid_for_update(room_id, selected_date)
+        holds = hold_store().holds_for([(int(room_id), selected_date)])
+        day = day_from_entries(grid_entries(grid) + holds.get((int(room_id), selected_date), []),
+                               ignore_owner=current_user.id)
+        status, _ = day.slot_status(to_minutes(start_time), to_minutes(end_time))
         
-        if existing_reservation:
+        if status == 'reserved':
             return jsonify({'success': False, 'message': 'O horário já está reservado.'}), 409
-        
-        # Verificar se há bloqueios temporários para este horário
-        now = datetime.utcnow()
-        existing_lock = TempLock.query.filter(
-            TempLock.room_id == room_id,
-            TempLock.date == selected_date,
-            TempLock.start_time == start_time,
-            TempLock.expires_at > now
-        ).first()
-        
-        if existing_lock:
+        if status == 'locked':
             return jsonify({'success': False, 'message': 'O horário está temporariamente bloqueado.'}), 409
-        
-        # Verificar se há horários bloqueados recorrentes
-        day_of_week = selected_date.strftime('%A').lower()
-        existing_blocked_time = BlockedTime.query.filter_by(
-            room_id=room_id,
-            day_of_week=day_of_week
-        ).filter(
-            (BlockedTime.start_time <= start_time) & (BlockedTime.end_time > start_time) |
-            (BlockedTime.start_time < end_time) & (BlockedTime.end_time >= end_time) |
-            (BlockedTime.start_time >= start_time) & (BlockedTime.end_time <= end_time)
-        ).first()
-        
-        if existing_blocked_time:
+        if status == 'blocked':
             return jsonify({'success': False, 'message': 'Este horário está bloqueado.'}), 409
         
         # Criar a reserva
         new_reservation = Reservation(
             reservation_date=selected_date,
-            start_time=start_time,
-            end_time=end_time,
+            start_time=datetime.combine(selected_date, start_time),
+            end_time=datetime.combine(selected_date, end_time),
             user_id=current_user.id,
-            room_id=room_id
+            room_id=int(room_id)
         )
         
         # Calcular o preço total
         room = Room.query.get(room_id)
-        duration = (datetime.combine(selected_date, end_time) - datetime.combine(selected_date, start_time)).total_seconds() / 3600
-        
-        if duration <= 1.25:  # 1h15
-            new_reservation.total_price = room.price_1h15
-        else:  # 2h30
-            new_reservation.total_price = room.price_2h30
+        new_reservation.total_price = reservation_price(room, start_time, end_time)
         
+        # Os quartos de hora ocupados vão para reservation_slot: o banco recusa a segunda reserva concorrente
+        claim_slots(new_reservation)
         db.session.add(new_reservation)
+        db.session.flush()
+        record_reservation(grid, new_reservation, current_user.nome_completo)
+        record_booking(current_user.id, [new_reservation])
+        # A vaga de garagem já reservada no dia passa a cobrir também esta reserva
+        parking_ok = widen_parking_window(current_user.id, selected_date)
         db.session.commit()
         
         log_event("Reserva de Sala", "SUCCESS", 
@@ -281,9 +354,128 @@ def book_room():
                   user_id=current_user.id, ip_address=request.remote_addr)
         
         # Retorna sucesso para o JavaScript continuar o fluxo
+        if not parking_ok:
+            return jsonify({'success': True, 'parking_warning': True,
+                            'message': f'Reserva criada com sucesso! Atenção: não há vaga de garagem livre neste horário; '
+                                       f'sua vaga do dia {selected_date:%d/%m} continua só no horário anterior.'})
         return jsonify({'success': True, 'message': 'Reserva criada com sucesso!'})
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'O horário já está reservado.'}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'A agenda desta sala acabou de mudar. Tente novamente.'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+@main.route('/book-room-recurring', methods=['POST'])
+@check_contract
+def book_room_recurring():
+    """
+    Reserva o mesmo horário de uma sala em várias semanas de uma vez.
+    JSON: room_id, start_time, end_time, start_date, weeks e, opcionalmente,
+    weekdays (nomes em inglês; padrão, o dia de start_date) e all_or_nothing.
+    Todas as datas são conferidas contra reservas, bloqueios temporários e
+    horários bloqueados em uma única leitura das grades, e as livres são gravadas
+    em uma única transação. Retorna o resultado por data.
+    """
+    data = request.json or {}
+    room_id = data.get('room_id')
+    all_or_nothing = bool(data.get('all_or_nothing'))
+    try:
+        room_id = int(room_id)
+        start_date = datetime.strptime(data.get('start_date'), '%Y-%m-%d').date()
+        start_time = datetime.strptime(data.get('start_time'), '%H:%M:%S').time()
+        end_time = datetime.strptime(data.get('end_time'), '%H:%M:%S').time()
+        weeks = int(data.get('weeks', 1))
+        weekdays = data.get('weekdays') or None
+        if weekdays is not None and (not isinstance(weekdays, list) or set(weekdays) - set(WEEKDAYS)):
+            raise ValueError('weekdays inválido')
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Dados da recorrência inválidos.'}), 400
+    if not 1 <= weeks <= MAX_RECURRING_WEEKS:
+        return jsonify({'success': False, 'message': f'Use entre 1 e {MAX_RECURRING_WEEKS} semanas.'}), 400
+    if end_time <= start_time:
+        return jsonify({'success': False, 'message': 'O horário final deve ser depois do inicial.'}), 400
+    room = Room.query.filter_by(id=room_id, is_active=True).first()
+    if room is None:
+        return jsonify({'success': False, 'message': 'Sala não encontrada.'}), 404
+
+    dates = weekly_occurrences(start_date, weeks, weekdays)
+    start_min, end_min = to_minutes(start_time), to_minutes(end_time)
+    price = reservation_price(room, start_time, end_time)
+    now = datetime.now()
+    try:
+        # Uma leitura das grades do período inteiro (mais os holds de outros backends) valida todas as datas
+        grids = load_grids([room_id], dates[0], dates[-1])
+        holds = hold_store().holds_for([(room_id, day) for day in dates])
+        occurrences = []
+        for day in dates:
+            if datetime.combine(day, start_time) <= now:
+                status = 'past'
+            else:
+                entries = grid_entries(grids[(room_id, day)]) + holds.get((room_id, day), [])
+                status, _ = day_from_entries(entries, ignore_owner=current_user.id).slot_status(start_min, end_min)
+            occurrences.append({'date': day.isoformat(), 'status': status})
+        conflicts = [item['date'] for item in occurrences if item['status'] != 'available']
+        if all_or_nothing and conflicts:
+            return jsonify({'success': False, 'message': 'Algumas datas não estão disponíveis.',
+                            'occurrences': occurrences, 'accepted': [], 'conflicts': conflicts}), 409
+
+        reservations = []
+        for item, day in zip(occurrences, dates):
+            if item['status'] != 'available':
+                continue
+            reservation = Reservation(
+                reservation_date=day,
+                start_time=datetime.combine(day, start_time),
+                end_time=datetime.combine(day, end_time),
+                user_id=current_user.id,
+                room_id=room_id,
+                total_price=price
+            )
+            claim_slots(reservation)
+            reservations.append(reservation)
+        db.session.add_all(reservations)
+        db.session.flush()
+        for reservation in reservations:
+            record_reservation(grids[(room_id, reservation.reservation_date)], reservation, current_user.nome_completo)
+        record_booking(current_user.id, reservations)
+        parking_conflicts = [
+            reservation.reservation_date.isoformat() for reservation in reservations
+            if not widen_parking_window(current_user.id, reservation.reservation_date)
+        ]
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Um dos horários acabou de ser reservado. Tente novamente.'}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'A agenda desta sala acabou de mudar. Tente novamente.'}), 409
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
+
+    by_date = {item['date']: item for item in occurrences}
+    accepted = []
+    for reservation in reservations:
+        accepted.append(reservation.reservation_date.isoformat())
+        by_date[accepted[-1]].update(status='accepted', reservation_id=reservation.id)
+    log_event("Reserva Recorrente de Sala", "SUCCESS",
+              {"room_id": room_id, "start_date": start_date.isoformat(), "weeks": weeks, "weekdays": weekdays,
+               "start_time": data.get('start_time'), "end_time": data.get('end_time'),
+               "accepted": accepted, "conflicts": conflicts},
+              user_id=current_user.id, ip_address=request.remote_addr)
+    return jsonify({
+        'success': bool(accepted),
+        'message': f'{len(accepted)} de {len(dates)} reservas criadas.',
+        'occurrences': occurrences,
+        'accepted': accepted,
+        'conflicts': conflicts,
+        # Datas em que a vaga de garagem já reservada não pôde ser estendida ao novo horário
+        'parking_conflicts': parking_conflicts,
+        'total_price': sum(reservation.total_price or 0 for reservation in reservations)
+    })
 @main.route('/check-tutorials', methods=['POST'])
 @check_contract
 def check_tutorials():
@@ -384,35 +576,68 @@ def delete_account():
     return render_template('delete_account.html')  
 @main.route('/alugar-equipamento', methods=['GET'])
 @check_contract
+@query_budget(4)
 def rent_equipment():
     selected_date_str = request.args.get('date', default=date.today().strftime('%Y-%m-%d'))
     selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
+    # Último dia do aluguel (padrão: aluguel de um dia)
+    end_date_str = request.args.get('end')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else selected_date
+    if not selected_date <= end_date < selected_date + timedelta(days=MAX_RENTAL_DAYS):
+        flash(f'Escolha um período de 1 a {MAX_RENTAL_DAYS} dias.', 'warning')
+        end_date = selected_date
+    rental_days = (end_date - selected_date).days + 1
     
     prev_date = selected_date - timedelta(days=1)
     next_date = selected_date + timedelta(days=1)
     # Busca todos os equipamentos ativos
     equipments = RentableEquipment.query.filter_by(is_active=True).all()
+    # Unidades livres em todos os dias do período, para todos os equipamentos em uma consulta
+    free = free_units(equipments, selected_date, end_date)
     
     equipments_with_availability = []
     for equip in equipments:
-        # Conta quantas reservas existem para este equipamento nesta data
-        reserved_units = db.session.query(func.count(EquipmentReservation.id)).filter_by(
-            equipment_id=equip.id, 
-            reservation_date=selected_date
-        ).scalar()
-        
-        available_units = equip.units_available - reserved_units
+        available_units = free[equip.id]
         
         equipments_with_availability.append({
             'equipment': equip,
             'available': available_units > 0,
-            'available_count': available_units
+            'available_count': available_units,
+            'total_price': equip.daily_price * rental_days
         })
     return render_template('rent_equipment.html', 
                             equipments_data=equipments_with_availability,
                             selected_date=selected_date,
+                            end_date=end_date,
+                            rental_days=rental_days,
+                            max_rental_days=MAX_RENTAL_DAYS,
                             prev_date=prev_date,
                             next_date=next_date)
+@main.route('/alugar-equipamento/calendario', methods=['GET'])
+@check_contract
+@query_budget(4)
+def equipment_calendar():
+    # Mês exibido (AAAA-MM), padrão o mês corrente
+    try:
+        month_start = datetime.strptime(request.args.get('month', ''), '%Y-%m').date()
+    except ValueError:
+        month_start = date.today().replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    prev_month = (month_start - timedelta(days=1)).replace(day=1)
+    month_end = next_month - timedelta(days=1)
+    
+    equipments = RentableEquipment.query.filter_by(is_active=True).order_by(RentableEquipment.name).all()
+    usage = usage_calendar([equip.id for equip in equipments], month_start, month_end)
+    calendar_rows = [
+        {'equipment': equip, 'remaining': [equipment_capacity(equip) - units for units in usage[equip.id]]}
+        for equip in equipments
+    ]
+    return render_template('equipment_calendar.html',
+                            calendar_rows=calendar_rows,
+                            days=date_range(month_start, month_end),
+                            month_start=month_start,
+                            prev_month=prev_month,
+                            next_month=next_month)
 @main.route('/tutoriais')
 @check_contract
 def tutorials():
@@ -420,62 +645,78 @@ def tutorials():
     return render_template('tutorials.html', tutorials=tutorials)
 @main.route('/book-equipment', methods=['POST'])
 @check_contract
+@idempotent
 def book_equipment():
     equipment_id = request.form.get('equipment_id')
     date_str = request.form.get('date')
-    equipment = RentableEquipment.query.get_or_404(equipment_id)
+    equipment = RentableEquipment.query.filter_by(id=equipment_id, is_active=True).first_or_404()
+    try:
+        selected_date = date.fromisoformat(date_str)
+        end_date = date.fromisoformat(request.form.get('end_date') or date_str)
+    except (TypeError, ValueError):
+        flash('Data inválida.', 'danger')
+        return redirect(url_for('main.rent_equipment'))
+    if not selected_date <= end_date < selected_date + timedelta(days=MAX_RENTAL_DAYS):
+        flash(f'Escolha um período de 1 a {MAX_RENTAL_DAYS} dias.', 'danger')
+        return redirect(url_for('main.rent_equipment', date=date_str))
+    period = selected_date.strftime('%d/%m/%Y')
+    if end_date != selected_date:
+        period = f"{period} a {end_date.strftime('%d/%m/%Y')}"
+    
+    # Ocupa uma unidade nos contadores de todos os dias; falha se algum dia já estiver cheio
+    if not reserve_units(equipment.id, selected_date, end_date):
+        db.session.rollback()
+        flash(f'Não há unidades de {equipment.name} disponíveis em todo o período {period}.', 'danger')
+        return redirect(url_for('main.rent_equipment', date=date_str, end=end_date.isoformat()))
     
     # Lógica para criar a reserva do equipamento
     new_reservation = EquipmentReservation(
-        reservation_date=date.fromisoformat(date_str),
+        reservation_date=selected_date,
+        end_date=end_date,
         user_id=current_user.id,
-        equipment_id=equipment_id,
-        price=equipment.daily_price
+        equipment_id=equipment.id,
+        price=equipment.daily_price * ((end_date - selected_date).days + 1)
     )
     db.session.add(new_reservation)
     db.session.commit()
     
-    flash(f'{equipment.name} reservado com sucesso para {date.fromisoformat(date_str).strftime("%d/%m/%Y")}!', 'success')
+    flash(f'{equipment.name} reservado com sucesso para {period}!', 'success')
     return redirect(url_for('main.my_reservations'))
     
 @main.route('/minhas-reservas')
 @check_contract
+@query_budget(4)
 def my_reservations():
     today = date.today()
-    # Query para reservas de sala
-    upcoming_room_reservations = Reservation.query.filter(
-        Reservation.user_id == current_user.id,
-        Reservation.reservation_date >= today
-    ).order_by(Reservation.reservation_date, Reservation.start_time).all()
-    
-    # Query para reservas de equipamento
-    upcoming_equipment_reservations = EquipmentReservation.query.filter(
-        EquipmentReservation.user_id == current_user.id,
-        EquipmentReservation.reservation_date >= today
-    ).order_by(EquipmentReservation.reservation_date).all()
-    # Query para reservas de estacionamento
-    upcoming_parking_reservations = ParkingReservation.query.filter(
-        ParkingReservation.user_id == current_user.id,
-        ParkingReservation.reservation_date >= today
-    ).order_by(ParkingReservation.reservation_date).all()
-    
-    # Combina e ordena as reservas futuras
-    upcoming_reservations = sorted(
-        upcoming_room_reservations + upcoming_equipment_reservations + upcoming_parking_reservations,
-        key=lambda r: r.reservation_date
-    )
-    # Lógica para reservas passadas (pode ser combinada similarmente se necessário)
-    past_reservations = Reservation.query.filter(
-        Reservation.user_id == current_user.id,
-        Reservation.reservation_date < today
-    ).order_by(Reservation.reservation_date.desc(), Reservation.start_time.desc()).all()
+    # Primeira página de cada seção: salas, equipamentos e garagem em uma consulta UNION ALL cada
+    upcoming_reservations, upcoming_cursor = timeline_page(current_user.id, today, 'upcoming')
+    past_reservations, past_cursor = timeline_page(current_user.id, today, 'past')
     
     return render_template('my_reservations.html',
                             upcoming_reservations=upcoming_reservations,
-                            past_reservations=past_reservations)
+                            upcoming_cursor=upcoming_cursor,
+                            past_reservations=past_reservations,
+                            past_cursor=past_cursor)
+@main.route('/minhas-reservas/timeline')
+@check_contract
+@query_budget(2)
+def my_reservations_timeline():
+    """Próxima página ("carregar mais") de uma seção da linha do tempo, a partir do cursor."""
+    section = request.args.get('section', 'upcoming')
+    if section not in ('upcoming', 'past'):
+        return jsonify({'error': 'section deve ser upcoming ou past'}), 400
+    try:
+        items, next_cursor = timeline_page(current_user.id, date.today(), section, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'items': [dict(item, day=item['day'].isoformat(), last_day=item['last_day'].isoformat()) for item in items],
+        'next_cursor': next_cursor
+    })
 # --- ROTA DE OBTENÇÃO DE SLOTS (MODIFICADA) ---
 @main.route('/get-room-slots')
 @login_required
+@query_budget(12)
 def get_room_slots():
     print("Rota /get-room-slots acessada")  # Log para diagnóstico
     room_id = request.args.get('room_id')
@@ -489,67 +730,97 @@ def get_room_slots():
     
     try:
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        room = Room.query.get_or_404(room_id)
-        
-        print(f"Sala encontrada: {room.name}")  # Log para diagnóstico
-        
-        # Verificar reservas existentes
-        reservations_for_room = Reservation.query.filter_by(room_id=room.id, reservation_date=selected_date).all()
-        print(f"Reservas encontradas: {len(reservations_for_room)}")  # Log para diagnóstico
-        
-        # Verificar bloqueios temporários ativos
-        now = datetime.utcnow()
-        temp_locks = TempLock.query.filter(
-            TempLock.room_id == room.id,
-            TempLock.date == selected_date,
-            TempLock.expires_at > now
-        ).all()
-        print(f"Bloqueios temporários encontrados: {len(temp_locks)}")  # Log para diagnóstico
-        
-        # Verificar horários bloqueados
-        blocked_times = BlockedTime.query.filter_by(room_id=room.id).all()
-        print(f"Horários bloqueados encontrados: {len(blocked_times)}")  # Log para diagnóstico
         
-        # Combinar reservas, bloqueios temporários e horários bloqueados
-        reserved_times = {}
-        for res in reservations_for_room:
-            # Obter apenas o primeiro nome do usuário
-            user_name = res.user.name.split()[0] if res.user.name else 'Usuário'
-            reserved_times[(res.start_time, res.end_time)] = {
-                'status': 'reserved',
-                'user_name': user_name
-            }
+        # Versão da grade lida sem o ORM: 304 se o cliente já tem esta versão
+        holds = hold_store().holds_for([(int(room_id), selected_date)])
+        holds_tag = hashlib.sha1(holds_signature(holds).encode('utf-8')).hexdigest()[:12] if holds else ''
+        versions = grid_versions([room_id], selected_date)
+        if versions is not None:
+            cached = not_modified(f'slots-{room_id}-{date_str}-v{versions[(int(room_id), selected_date)]}{holds_tag}')
+            if cached:
+                return cached
         
-        locked_times = {}
-        for lock in temp_locks:
-            locked_times[(lock.start_time, lock.end_time)] = {
-                'status': 'locked'
-            }
-        
-        # Adicionar horários bloqueados recorrentes
-        day_of_week = selected_date.strftime('%A').lower()
-        for blocked in blocked_times:
-            if blocked.day_of_week == day_of_week:
-                reserved_times[(blocked.start_time, blocked.end_time)] = {
-                    'status': 'blocked'
-                }
+        room = Room.query.get_or_404(room_id)
         
-        # Combinar todos os horários indisponíveis
-        all_unavailable = {**reserved_times, **locked_times}
+        print(f"Sala encontrada: {room.name}")  # Log para diagnóstico
         
-        time_slots = generate_time_slots(selected_date, all_unavailable)
+        # Grade materializada da sala/dia: uma busca pela chave primária
+        availability, versions = grid_snapshot([room.id], selected_date, holds=holds)
+        time_slots = availability[(room.id, selected_date)].slot_grid()
         
         print(f"Slots gerados: {time_slots}")  # Log para diagnóstico
         
-        return jsonify({
+        return with_etag(jsonify({
             'room_id': room_id,
             'date': date_str,
             'slots': time_slots
-        })
+        }), f'slots-{room.id}-{date_str}-v{versions[(room.id, selected_date)]}{holds_tag}')
     except Exception as e:
         print(f"Erro na rota /get-room-slots: {str(e)}")  # Log para diagnóstico
         return jsonify({'error': str(e)}), 500
         
+# --- STREAM DE MUDANÇAS DE HORÁRIOS (SSE + LONG-POLL) ---
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300  # O navegador reconecta sozinho (com Last-Event-ID) depois disso
+LONG_POLL_SECONDS = 25
+MAX_EVENT_ROOMS = 50
+def parse_event_channels():
+    """Lê room_ids e date da query string e devolve a lista de canais (sala, data)."""
+    date_str = request.args.get('date')
+    try:
+        selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        room_ids = [int(room_id) for room_id in request.args.get('room_ids', '').split(',') if room_id.strip()]
+    except (TypeError, ValueError):
+        return None
+    if not room_ids or len(room_ids) > MAX_EVENT_ROOMS:
+        return None
+    return [(room_id, selected_date) for room_id in room_ids]
+@main.route('/slot-events')
+@login_required
+def slot_events():
+    channels = parse_event_channels()
+    if channels is None:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    
+    # Devolve a conexão do banco ao pool: o stream fica aberto por minutos
+    db.session.close()
+    
+    def stream():
+        with slot_bus.subscribe(channels, last_event_id) as subscription:
+            yield 'retry: 3000\n\n'
+            deadline = monotonic() + SSE_MAX_SECONDS
+            while monotonic() < deadline:
+                payload = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if payload is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"id: {payload['id']}\nevent: slot\ndata: {json.dumps(payload)}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+@main.route('/slot-events/poll')
+@login_required
+def slot_events_poll():
+    """Alternativa de long-poll para navegadores sem EventSource."""
+    channels = parse_event_channels()
+    if channels is None:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'last_id': slot_bus.last_id(), 'events': []})
+    
+    events = slot_bus.events_since(channels, since)
+    if not events:
+        db.session.close()
+        with slot_bus.subscribe(channels) as subscription:
+            # Confere de novo após a inscrição para não perder um evento publicado no meio
+            events = slot_bus.events_since(channels, since)
+            if not events:
+                payload = subscription.get(timeout=LONG_POLL_SECONDS)
+                events = [payload] if payload else []
+    return jsonify({'last_id': max([event['id'] for event in events], default=since), 'events': events})
+        
 # --- ROTA DE CRIAÇÃO DE BLOQUEIO TEMPORÁRIO (NOVA) ---
 @main.route('/create-temp-lock', methods=['POST'])
 @check_contract
@@ -568,38 +839,29 @@ def create_temp_lock():
         start_time = datetime.strptime(start_time_str, '%H:%M:%S').time()
         end_time = datetime.strptime(end_time_str, '%H:%M:%S').time()
         
-        # Verificar se já existe um bloqueio ou reserva para este horário
-        existing_reservation = Reservation.query.filter_by(
-            room_id=room_id,
-            reservation_date=selected_date,
-            start_time=start_time
-        ).first()
-        
-        existing_lock = TempLock.query.filter(
-            TempLock.room_id == room_id,
-            TempLock.date == selected_date,
-            TempLock.start_time == start_time,
-            TempLock.expires_at > datetime.utcnow()
-        ).first()
-        
-        if existing_reservation or existing_lock:
+        # Verificar na grade da sala/dia (e nos holds) se o horário já está reservado ou bloqueado
+        store = hold_store()
+        room_id = int(room_id)
+        grid = grid_for_update(room_id, selected_date)
+        holds = store.holds_for([(room_id, selected_date)])
+        day = day_from_entries(grid_entries(grid) + holds.get((room_id, selected_date), []))
+        if not day.is_free(to_minutes(start_time), to_minutes(end_time)):
             return jsonify({'success': False, 'message': 'Horário já está reservado ou bloqueado.'}), 409
         
-        # Criar bloqueio temporário (5 minutos)
-        expires_at = datetime.utcnow() + timedelta(minutes=5)
-        new_lock = TempLock(
-            room_id=room_id,
-            date=selected_date,
-            start_time=start_time,
-            end_time=end_time,
-            user_id=current_user.id,
-            expires_at=expires_at
-        )
-        db.session.add(new_lock)
+        # Criar bloqueio temporário (5 minutos) no armazenamento configurado
+        hold = store.create(room_id, selected_date, start_time, end_time, current_user.id)
+        # Grava a grade se ela acabou de ser materializada (nos backends fora do banco)
         db.session.commit()
+        if hold is None:
+            return jsonify({'success': False, 'message': 'Horário já está reservado ou bloqueado.'}), 409
+        count_lock_event('created')
         
-        return jsonify({'success': True, 'lock_id': new_lock.id, 'expires_at': expires_at.isoformat()})
+        return jsonify({'success': True, 'lock_id': hold['id'], 'expires_at': hold['expires_at'].isoformat()})
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Horário já está reservado ou bloqueado.'}), 409
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # --- ROTA DE LIBERAÇÃO DE BLOQUEIO TEMPORÁRIO (NOVA) ---
@@ -614,14 +876,13 @@ def release_temp_lock():
     
     try:
         # Buscar e excluir o bloqueio temporário
-        temp_lock = TempLock.query.get(lock_id)
-        if temp_lock:
-            db.session.delete(temp_lock)
-            db.session.commit()
+        if hold_store().release(int(lock_id)):
+            count_lock_event('released')
             return jsonify({'success': True})
         else:
             return jsonify({'error': 'Bloqueio não encontrado'}), 404
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # --- ROTA DE RENT PARKING (NOVA) ---
@@ -636,18 +897,20 @@ def rent_parking():
     all_spots = ParkingSpot.query.filter_by(is_active=True).all()
     spots_with_availability = []
     
-    reserved_spots_ids = {
-        res.spot_id for res in ParkingReservation.query.filter_by(reservation_date=selected_date).all()
-    }
+    # A vaga está disponível se comporta a janela das reservas de sala do usuário no dia
+    window = room_reservation_window(current_user.id, selected_date) or (PARKING_OPEN_MINUTES, PARKING_CLOSE_MINUTES)
+    allocations = day_allocations(selected_date)
     for spot in all_spots:
-        is_available = spot.id not in reserved_spots_ids
+        is_available = best_fit_spot([spot.id], allocations, *window) is not None
         spots_with_availability.append({
             'spot': spot,
-            'is_available': is_available
+            'is_available': is_available,
+            'occupied': [(minutes_to_time(start), minutes_to_time(end)) for start, end in sorted(allocations.get(spot.id, []))]
         })
     
     return render_template('rent_parking.html',
                             spots_data=spots_with_availability,
+                            window=(minutes_to_time(window[0]), minutes_to_time(window[1])),
                             selected_date=selected_date,
                             prev_date=prev_date,
                             next_date=next_date)
@@ -655,37 +918,53 @@ def rent_parking():
 # --- ROTA DE BOOK PARKING (NOVA) ---
 @main.route('/book-parking', methods=['POST'])
 @check_contract
+@idempotent
 def book_parking():
-    spot_id = request.form.get('spot_id')
+    # A vaga escolhida (opcional) é só uma preferência: o servidor aloca pela janela de horário
+    spot_id = request.form.get('spot_id', type=int)
     date_str = request.form.get('date')
-    selected_date = date.fromisoformat(date_str)
+    try:
+        selected_date = date.fromisoformat(date_str)
+    except (TypeError, ValueError):
+        flash('Data inválida.', 'danger')
+        return redirect(url_for('main.rent_parking'))
     
-    # Verificar se a vaga já está reservada para esta data
-    existing_reservation = ParkingReservation.query.filter_by(
-        spot_id=spot_id,
-        reservation_date=selected_date
-    ).first()
+    if db.session.scalars(user_parking_query(current_user.id, selected_date)).first():
+        flash('Você já tem uma vaga de estacionamento reservada para esta data.', 'warning')
+        return redirect(url_for('main.my_reservations'))
     
-    if existing_reservation:
-        flash('Esta vaga de estacionamento já está reservada para esta data.', 'danger')
-        return redirect(url_for('main.rent_parking', date=date_str))
+    # A vaga fica ocupada só na janela das reservas de sala do dia (sem reserva de sala, o dia inteiro)
+    window = room_reservation_window(current_user.id, selected_date)
     new_reservation = ParkingReservation(
         reservation_date=selected_date,
         user_id=current_user.id,
-        spot_id=spot_id
+        start_time=minutes_to_time(window[0]) if window else None,
+        end_time=minutes_to_time(window[1]) if window else None
     )
+    new_reservation.spot_id = allocate_spot(new_reservation, preferred_spot_id=spot_id)
+    if new_reservation.spot_id is None:
+        db.session.rollback()
+        flash('Não há vaga de estacionamento livre no seu horário nesta data.', 'danger')
+        return redirect(url_for('main.rent_parking', date=date_str))
     
     db.session.add(new_reservation)
+    db.session.flush()
+    # Confere, já com a trava de escrita, que nenhuma reserva concorrente ocupou a mesma vaga no horário
+    if spot_overlaps(new_reservation):
+        db.session.rollback()
+        flash('A vaga acabou de ser reservada por outra pessoa. Tente novamente.', 'danger')
+        return redirect(url_for('main.rent_parking', date=date_str))
     db.session.commit()
     
-    flash('Vaga de estacionamento reservada com sucesso!', 'success')
+    spot = db.session.get(ParkingSpot, new_reservation.spot_id)
+    start, end = parking_window(new_reservation)
+    flash(f'Vaga {spot.name} reservada das {minutes_to_time(start):%H:%M} às {minutes_to_time(end):%H:%M}!', 'success')
     return redirect(url_for('main.my_reservations'))
 @main.route('/contrato', methods=['GET', 'POST'])
 @login_required
 def accept_contract():
     # Lógica para verificar se o contrato já foi aceito
-    current_contract_setting = SiteSettings.query.filter_by(key='contract_version').first()
-    current_version = int(current_contract_setting.value) if current_contract_setting else 1
+    current_version = get_setting('contract_version')
     if current_user.contract_accepted_version >= current_version:
         return redirect(url_for('main.dashboard'))
     
@@ -713,8 +992,7 @@ def accept_contract():
         flash('Contrato aceito com sucesso! Bem-vindo(a) à Odonto Booking.', 'success')
         return redirect(url_for('main.dashboard'))
         
-    contract_setting = SiteSettings.query.filter_by(key='contract_text').first()
-    contract_text = contract_setting.value if contract_setting else "Nenhum contrato definido pelo administrador."
+    contract_text = get_setting('contract_text', "Nenhum contrato definido pelo administrador.")
     return render_template('contract.html', contract_text=contract_text)
 # --- Funções auxiliares para salvar imagens ---
 def save_picture(form_picture, user_id, prefix):
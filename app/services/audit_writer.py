@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Gravação assíncrona e em lote do log de auditoria (ApiLog).
+
+log_event só enfileira o evento (com o horário em que ele aconteceu); uma
+thread do processo grava a fila em INSERTs em lote, a cada
+AUDIT_FLUSH_INTERVAL_MS ou quando AUDIT_BATCH_SIZE eventos se acumulam, em
+uma conexão própria. Assim a rota paga só o próprio commit e a gravação do
+log sai do caminho do clique do usuário.
+
+Na saída do processo a fila é drenada antes de encerrar. Eventos recusados
+por fila cheia (dropped) e lotes que falharam ao gravar (failed) ficam nos
+contadores de audit_metrics().
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from app.models.user import ApiLog
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class AuditWriter:
+    """Fila de eventos do processo e a thread que os grava em lote."""
+
+    def __init__(self, app, batch_size=DEFAULT_BATCH_SIZE, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': None,
+            'last_error': None,
+        }
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._stats[name] += amount
+
+    def enqueue(self, row):
+        """Enfileira uma linha de ApiLog. Retorna False se o evento foi descartado."""
+        if self._closed:
+            self._write([row])
+            return True
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._count(dropped=1)
+            return False
+        self._count(enqueued=1)
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(insert(ApiLog), rows)
+        except Exception as e:
+            self._count(failed=len(rows))
+            with self._lock:
+                self._stats['last_error'] = f'{datetime.utcnow().isoformat()} {e}'
+            self.app.logger.warning(f'Falha ao gravar {len(rows)} evento(s) de auditoria: {e}')
+            return
+        with self._lock:
+            self._stats['written'] += len(rows)
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(rows)
+            self._stats['last_batch_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            rows, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            # Junta eventos até completar o lote ou vencer o intervalo
+            while True:
+                # Um Event na fila é um pedido de flush(): grava o que veio antes e avisa
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if rows:
+                self._write(rows)
+            for waiter in waiters:
+                waiter.set()
+
+    def flush(self, timeout=10):
+        """Bloqueia até que tudo o que foi enfileirado antes da chamada esteja gravado."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Drena a fila na saída do processo; eventos posteriores são gravados direto."""
+        flushed = self.flush(timeout)
+        self._closed = True
+        stats = self.stats()
+        if not flushed or stats['dropped'] or stats['failed']:
+            self.app.logger.warning(
+                f"Log de auditoria encerrado com pendências: dropped={stats['dropped']} "
+                f"failed={stats['failed']} pending={stats['pending']}"
+            )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(stats, pending=self.queue.qsize(), running=self._thread is not None,
+                    batch_size=self.batch_size, flush_interval_ms=int(self.flush_interval * 1000))
+
+
+def init_audit_writer(app):
+    """Cria o gravador do processo quando AUDIT_LOG_MODE='async' e registra a drenagem na saída."""
+    if app.config.get('AUDIT_LOG_MODE', 'async') != 'async':
+        return
+    writer = AuditWriter(
+        app,
+        batch_size=app.config.get('AUDIT_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        flush_interval_ms=app.config.get('AUDIT_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS),
+        queue_size=app.config.get('AUDIT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+    )
+    app.extensions['audit_writer'] = writer
+    atexit.register(writer.close)
+
+
+def audit_metrics(app):
+    """Contadores do gravador assíncrono (ou só o modo, quando a gravação é síncrona)."""
+    writer = app.extensions.get('audit_writer')
+    if writer is None:
+        return {'mode': 'sync'}
+    return dict(writer.stats(), mode='async')
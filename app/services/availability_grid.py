@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Grade de ocupação materializada (RoomDayGrid).
+
+Cada linha guarda, por sala e data, as entradas de ocupação já calculadas
+(reservas, bloqueios temporários e horários bloqueados). As rotas de escrita
+atualizam a linha na mesma transação da escrita original, e as leituras de
+horários viram uma busca pela chave primária (room_id, date).
+
+As leituras nunca fazem commit da sessão da requisição (o que expiraria as
+entidades já carregadas pela rota): as grades ausentes e a limpeza dos
+bloqueios vencidos são gravadas em uma transação própria, em outra conexão.
+Só quando a sessão já está escrevendo (rotas de reserva) elas entram na
+transação dela.
+
+As reservas aparecem na grade com o primeiro nome de quem reservou. Quando
+o nome de um usuário muda, os rótulos das grades com reservas dele são
+regravados no mesmo flush (_relabel_renamed_users).
+"""
+import json
+from datetime import date, datetime
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app import db
+from app.models.availability import RoomDayGrid
+from app.models.user import User, Reservation
+from app.services.slot_events import queue_event, queue_expiry
+from app.services.block_schedule import room_block_schedules, invalidate_room_blocks
+from app.services.availability_service import (
+    load_source_entries, day_from_entries, make_entry, is_expired, date_range, first_name
+)
+
+
+def grid_entries(grid):
+    return json.loads(grid.entries or '[]')
+
+
+def _next_expiry(entries):
+    expiries = [entry[5] for entry in entries if entry[5] is not None]
+    return datetime.fromisoformat(min(expiries)) if expiries else None
+
+
+def _set_entries(grid, entries, now=None):
+    # Descarta bloqueios temporários expirados a cada escrita para manter a linha enxuta
+    now = now or datetime.utcnow()
+    live = [entry for entry in entries if not is_expired(entry, now)]
+    grid.entries = json.dumps(live)
+    grid.next_expiry = _next_expiry(live)
+
+
+def source_entries(room_ids, start_day, end_day=None, now=None, schedules=None):
+    """Entradas calculadas da origem: reservas e bloqueios temporários mais a agenda de bloqueios compilada."""
+    entries = load_source_entries(room_ids, start_day, end_day, now)
+    schedules = schedules or room_block_schedules({room_id for room_id, _ in entries})
+    for (room_id, day), day_entries in entries.items():
+        day_entries.extend(schedules[room_id].entries_for(day))
+    return entries
+
+
+def _session_is_writing():
+    # O driver do SQLite só abre a transação no primeiro comando de escrita
+    return db.session.connection().connection.driver_connection.in_transaction
+
+
+def _insert_missing(keys, now=None, connection=None):
+    """Materializa as grades ausentes a partir das tabelas de origem (INSERT OR IGNORE)."""
+    if not keys:
+        return
+    room_ids = sorted({room_id for room_id, _ in keys})
+    days = sorted({day for _, day in keys})
+    source = source_entries(room_ids, days[0], days[-1], now)
+    rows = [
+        {'room_id': room_id, 'date': day, 'entries': json.dumps(source[(room_id, day)]),
+         'next_expiry': _next_expiry(source[(room_id, day)]), 'version': 1, 'updated_at': datetime.utcnow()}
+        for room_id, day in keys
+    ]
+    (connection or db.session).execute(sqlite_insert(RoomDayGrid).on_conflict_do_nothing(), rows)
+
+
+def _materialize(keys, now=None):
+    """Grava as grades ausentes sem fazer commit da sessão da requisição."""
+    if _session_is_writing():
+        _insert_missing(keys, now)
+        return
+    with db.engine.begin() as connection:
+        _insert_missing(keys, now, connection)
+
+
+def load_grids(room_ids, start_day, end_day=None, now=None):
+    """
+    Lê as grades de várias salas em um período (busca pela chave primária),
+    materializando as que ainda não existem. Retorna {(room_id, data): RoomDayGrid}.
+    """
+    end_day = end_day or start_day
+    room_ids = [int(room_id) for room_id in room_ids]
+    if not room_ids:
+        return {}
+    days = date_range(start_day, end_day)
+    query = RoomDayGrid.query.filter(
+        RoomDayGrid.room_id.in_(room_ids),
+        RoomDayGrid.date.between(start_day, end_day)
+    )
+    grids = {(grid.room_id, grid.date): grid for grid in query.all()}
+    missing = [(room_id, day) for room_id in room_ids for day in days if (room_id, day) not in grids]
+    if missing:
+        _materialize(missing, now)
+        grids.update({(grid.room_id, grid.date): grid for grid in query.all()})
+    return grids
+
+
+def load_grid_entries(room_ids, start_day, end_day=None, now=None, schedules=None):
+    """
+    Entradas de ocupação por (sala, data) lidas direto das colunas (sem montar
+    entidades do ORM). As datas sem grade são calculadas das tabelas de origem,
+    sem gravar nada: usada nas buscas que varrem muitos dias de uma vez.
+    'schedules' reaproveita as agendas de bloqueio já lidas por quem chama.
+    """
+    end_day = end_day or start_day
+    room_ids = [int(room_id) for room_id in room_ids]
+    if not room_ids:
+        return {}
+    query = select(RoomDayGrid.room_id, RoomDayGrid.date, RoomDayGrid.entries).where(
+        RoomDayGrid.room_id.in_(room_ids),
+        RoomDayGrid.date.between(start_day, end_day)
+    )
+    entries = {(room_id, day): json.loads(raw or '[]') for room_id, day, raw in db.session.execute(query)}
+    missing = [(room_id, day) for room_id in room_ids for day in date_range(start_day, end_day)
+               if (room_id, day) not in entries]
+    if missing:
+        days = sorted({day for _, day in missing})
+        source = source_entries(sorted({room_id for room_id, _ in missing}), days[0], days[-1], now, schedules)
+        entries.update({key: source[key] for key in missing})
+    return entries
+
+
+def grid_versions(room_ids, start_day, end_day=None, now=None):
+    """
+    Versões das grades de um período, lidas sem carregar entidades do ORM.
+    Retorna None quando alguma grade ainda não foi materializada ou teve um
+    bloqueio temporário expirado desde a última escrita (nesses casos a
+    resposta precisa ser recalculada).
+    """
+    end_day = end_day or start_day
+    now = now or datetime.utcnow()
+    room_ids = [int(room_id) for room_id in room_ids]
+    rows = db.session.execute(
+        select(RoomDayGrid.room_id, RoomDayGrid.date, RoomDayGrid.version, RoomDayGrid.next_expiry).where(
+            RoomDayGrid.room_id.in_(room_ids),
+            RoomDayGrid.date.between(start_day, end_day)
+        )
+    ).all()
+    if len(rows) != len(room_ids) * len(date_range(start_day, end_day)):
+        return None
+    if any(next_expiry is not None and next_expiry <= now for _, _, _, next_expiry in rows):
+        return None
+    return {(room_id, day): version for room_id, day, version, _ in rows}
+
+
+def prune_expired(grids, now=None):
+    """
+    Remove bloqueios temporários expirados das grades, incrementando a versão
+    de cada uma. Retorna {(room_id, data): versão nova} das grades regravadas.
+    """
+    now = now or datetime.utcnow()
+    expired = [grid for grid in grids.values() if grid.next_expiry is not None and grid.next_expiry <= now]
+    if not expired:
+        return {}
+    if _session_is_writing():
+        for grid in expired:
+            _set_entries(grid, grid_entries(grid), now)
+        return {}
+    versions = {}
+    with db.engine.begin() as connection:
+        for grid in expired:
+            live = [entry for entry in grid_entries(grid) if not is_expired(entry, now)]
+            # Mesma trava otimista do ORM: se outra escrita mudou a grade, a próxima leitura verá a versão nova
+            result = connection.execute(
+                update(RoomDayGrid)
+                .where(RoomDayGrid.room_id == grid.room_id, RoomDayGrid.date == grid.date,
+                       RoomDayGrid.version == grid.version)
+                .values(entries=json.dumps(live), next_expiry=_next_expiry(live),
+                        version=grid.version + 1, updated_at=datetime.utcnow())
+            )
+            if result.rowcount:
+                versions[(grid.room_id, grid.date)] = grid.version + 1
+    return versions
+
+
+def grid_snapshot(room_ids, start_day, end_day=None, now=None, holds=None):
+    """
+    Disponibilidade (DayAvailability) e versão por (sala, data), lidas das grades
+    materializadas. 'holds' traz entradas extras por (sala, data) vindas de um
+    HoldStore fora do banco. Retorna (disponibilidade, versões).
+    """
+    holds = holds or {}
+    grids = load_grids(room_ids, start_day, end_day, now)
+    availability = {
+        key: day_from_entries(grid_entries(grid) + holds.get(key, []), now) for key, grid in grids.items()
+    }
+    versions = {key: grid.version for key, grid in grids.items()}
+    versions.update(prune_expired(grids, now))
+    return availability, versions
+
+
+def grid_availability(room_ids, start_day, end_day=None, now=None, holds=None):
+    """Disponibilidade (DayAvailability) por (sala, data) lida das grades materializadas."""
+    return grid_snapshot(room_ids, start_day, end_day, now, holds)[0]
+
+
+def grid_for_update(room_id, day):
+    """
+    Retorna a grade da sala/dia para ser alterada na transação corrente.
+    Deve ser chamada antes de adicionar a nova linha de origem à sessão, para
+    que uma grade recém-materializada não a inclua duas vezes.
+    """
+    room_id = int(room_id)
+    grid = db.session.get(RoomDayGrid, (room_id, day))
+    if grid is None:
+        _insert_missing([(room_id, day)])
+        grid = db.session.get(RoomDayGrid, (room_id, day))
+    return grid
+
+
+def minutes_to_iso(minutes):
+    """Minutos do dia no formato 'HH:MM:SS' usado pelos botões de horário."""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}:00'
+
+
+def _queue_entry_event(grid, event_type, entry, **extra):
+    queue_event(db.session, event_type, grid.room_id, grid.date,
+                minutes_to_iso(entry[1]), minutes_to_iso(entry[2]), **extra)
+
+
+def add_entry(grid, entry):
+    _set_entries(grid, grid_entries(grid) + [entry])
+
+
+def remove_entry(grid, status, ref_id):
+    entries = grid_entries(grid)
+    for entry in entries:
+        if entry[0] == status and entry[4] == ref_id and status == 'locked':
+            _queue_entry_event(grid, 'released', entry, lock_id=ref_id)
+    _set_entries(grid, [entry for entry in entries if not (entry[0] == status and entry[4] == ref_id)])
+
+
+def record_reservation(grid, reservation, user_name):
+    entry = make_entry('reserved', reservation.start_time, reservation.end_time, first_name(user_name),
+                       reservation.id, owner_id=reservation.user_id)
+    add_entry(grid, entry)
+    _queue_entry_event(grid, 'reserved', entry, user_name=entry[3])
+
+
+@event.listens_for(Session, 'before_flush')
+def _relabel_renamed_users(session, flush_context, instances):
+    # Usuário renomeado (edição no admin): o rótulo das reservas dele nas grades acompanha o novo nome
+    renamed = {
+        user.id: user.nome_completo for user in session.dirty
+        if isinstance(user, User) and user.id is not None and inspect(user).attrs.nome_completo.history.deleted
+    }
+    if not renamed:
+        return
+    keys = set(session.execute(
+        select(Reservation.room_id, Reservation.reservation_date).where(Reservation.user_id.in_(renamed)).distinct()
+    ).all())
+    if not keys:
+        return
+    grids = session.scalars(select(RoomDayGrid).where(
+        RoomDayGrid.room_id.in_({room_id for room_id, _ in keys}),
+        RoomDayGrid.date.in_({day for _, day in keys})
+    ))
+    for grid in grids:
+        if (grid.room_id, grid.date) not in keys:
+            continue
+        entries = grid_entries(grid)
+        changed = False
+        for entry in entries:
+            if entry[0] == 'reserved' and entry[6] in renamed and entry[3] != first_name(renamed[entry[6]]):
+                entry[3] = first_name(renamed[entry[6]])
+                changed = True
+        if changed:
+            _set_entries(grid, entries)
+
+
+def record_temp_lock(grid, lock):
+    entry = make_entry('locked', lock.start_time, lock.end_time, '', lock.id, lock.expires_at, lock.user_id)
+    add_entry(grid, entry)
+    _queue_entry_event(grid, 'locked', entry, lock_id=lock.id)
+    queue_expiry(db.session, lock)
+
+
+def refresh_blocks(room_id):
+    """
+    Recompila a agenda de bloqueios da sala e a reaplica nas grades futuras já
+    materializadas. Só as grades cujos bloqueios mudaram são regravadas (e só
+    elas mudam de versão e geram eventos). Chamar depois de alterar os
+    BlockedTime/exceções na sessão.
+    """
+    invalidate_room_blocks(room_id)
+    schedule = room_block_schedules([room_id])[int(room_id)]
+    grids = RoomDayGrid.query.filter(RoomDayGrid.room_id == room_id, RoomDayGrid.date >= date.today()).all()
+    for grid in grids:
+        entries = grid_entries(grid)
+        current = sorted(entry for entry in entries if entry[0] == 'blocked')
+        block_entries = schedule.entries_for(grid.date)
+        if current == sorted(block_entries):
+            continue
+        kept = [entry for entry in entries if entry[0] != 'blocked']
+        _set_entries(grid, kept + block_entries)
+        for entry in block_entries:
+            if entry not in current:
+                _queue_entry_event(grid, 'blocked', entry)
+        for entry in current:
+            if entry not in block_entries:
+                _queue_entry_event(grid, 'released', entry)
+
+
+def _comparable(entries, now):
+    return sorted(tuple(entry) for entry in entries if not is_expired(entry, now))
+
+
+def check_grids(start_day=None, end_day=None, rebuild=False, room_ids=None):
+    """
+    Recalcula as grades a partir das tabelas de origem e compara com o que está
+    materializado. Com rebuild=True, regrava as divergentes e materializa as
+    ausentes no período. Retorna a lista de divergências (room_id, data, grade, origem).
+    """
+    now = datetime.utcnow()
+    query = RoomDayGrid.query
+    if start_day:
+        query = query.filter(RoomDayGrid.date >= start_day)
+    if end_day:
+        query = query.filter(RoomDayGrid.date <= end_day)
+    if room_ids:
+        query = query.filter(RoomDayGrid.room_id.in_(room_ids))
+    grids = {(grid.room_id, grid.date): grid for grid in query.all()}
+    
+    keys = set(grids)
+    if rebuild and start_day and end_day and room_ids:
+        keys |= {(room_id, day) for room_id in room_ids for day in date_range(start_day, end_day)}
+    if not keys:
+        return []
+    
+    drift = []
+    all_rooms = sorted({room_id for room_id, _ in keys})
+    all_days = sorted({day for _, day in keys})
+    source = source_entries(all_rooms, all_days[0], all_days[-1], now)
+    for key in sorted(keys):
+        expected = source[key]
+        grid = grids.get(key)
+        actual = grid_entries(grid) if grid else None
+        if actual is None or _comparable(actual, now) != _comparable(expected, now):
+            drift.append((key[0], key[1], actual, expected))
+            if rebuild and grid is not None:
+                _set_entries(grid, expected, now)
+    if rebuild:
+        _insert_missing([(room_id, day) for room_id, day, actual, _ in drift if actual is None], now)
+        db.session.commit()
+    return drift
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de disponibilidade das cadeiras.
+
+Cada sala/dia é representada como um bitmap de minutos do dia (um int do
+Python, 1 bit por minuto). Reservas, bloqueios temporários (TempLock) e
+horários bloqueados recorrentes (BlockedTime) são pintados em máscaras
+separadas numa única passada, e o status de cada slot das grades de 2h30 e
+1h15 é respondido com um AND de máscaras: O(slots + intervalos).
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import String, cast, literal, select, union_all
+from app import db
+from app.models.user import User, Reservation, TempLock
+
+# --- GRADES DE HORÁRIOS ---
+BASE_SLOTS_2H30 = [
+    (time(7, 0), time(9, 30)), (time(9, 30), time(12, 0)),
+    (time(12, 0), time(14, 30)), (time(14, 30), time(17, 0)),
+    (time(17, 0), time(19, 30)), (time(19, 30), time(22, 0))
+]
+BASE_SLOTS_1H15 = [
+    (time(7, 0), time(8, 15)), (time(8, 15), time(9, 30)),
+    (time(9, 30), time(10, 45)), (time(10, 45), time(12, 0)),
+    (time(12, 0), time(13, 15)), (time(13, 15), time(14, 30)),
+    (time(14, 30), time(15, 45)), (time(15, 45), time(17, 0)),
+    (time(17, 0), time(18, 15)), (time(18, 15), time(19, 30)),
+    (time(19, 30), time(20, 45)), (time(20, 45), time(22, 0))
+]
+
+# Nomes de dia da semana usados em BlockedTime.day_of_week (independente de locale)
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Ordem de prioridade quando mais de um tipo de ocupação cobre o mesmo slot
+STATUS_PRIORITY = ('reserved', 'blocked', 'locked')
+
+
+def weekday_name(day):
+    """Retorna o nome do dia da semana no formato de BlockedTime.day_of_week."""
+    return WEEKDAYS[day.weekday()]
+
+
+def to_minutes(value):
+    """Converte time, datetime ou string 'HH:MM[:SS]' (com ou sem data) em minutos do dia (int passa direto)."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return value.hour * 60 + value.minute
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    text = str(value).strip()
+    if ' ' in text:
+        text = text.split(' ', 1)[1]
+    hours, minutes = text.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def span_mask(start_min, end_min):
+    """Bitmap com os minutos [start_min, end_min) ligados."""
+    if end_min <= start_min:
+        return 0
+    return ((1 << (end_min - start_min)) - 1) << start_min
+
+
+def _compile_grid(base_slots):
+    # Pré-calcula minutos, máscara e campos textuais de cada slot da grade
+    compiled = []
+    for start, end in base_slots:
+        start_min, end_min = to_minutes(start), to_minutes(end)
+        compiled.append((start_min, end_min, span_mask(start_min, end_min), {
+            "start_str": start.strftime('%Hh%M'), "end_str": end.strftime('%Hh%M'),
+            "start_for_form": start.isoformat(), "end_for_form": end.isoformat(),
+        }))
+    return compiled
+
+
+SLOT_GRIDS = {'2h30': _compile_grid(BASE_SLOTS_2H30), '1h15': _compile_grid(BASE_SLOTS_1H15)}
+
+
+class DayAvailability:
+    """Ocupação de uma sala em um dia, como bitmaps de minutos."""
+
+    __slots__ = ('masks', '_reserved_starts', '_reserved')
+
+    def __init__(self):
+        self.masks = {status: 0 for status in STATUS_PRIORITY}
+        self._reserved_starts = []
+        self._reserved = []
+
+    def add(self, status, start_min, end_min, user_name=''):
+        """Pinta um intervalo ocupado na máscara do status informado."""
+        self.masks[status] |= span_mask(start_min, end_min)
+        if status == 'reserved':
+            # Mantém as reservas ordenadas para recuperar o nome do locatário
+            pos = bisect_right(self._reserved_starts, start_min)
+            self._reserved_starts.insert(pos, start_min)
+            self._reserved.insert(pos, (start_min, end_min, user_name))
+
+    def occupied_mask(self):
+        mask = 0
+        for value in self.masks.values():
+            mask |= value
+        return mask
+
+    def is_free(self, start_min, end_min):
+        return not (self.occupied_mask() & span_mask(start_min, end_min))
+
+    def _reserved_name(self, start_min, end_min):
+        pos = bisect_right(self._reserved_starts, start_min)
+        # Verifica a reserva que começa antes do slot e as que começam dentro dele
+        for res_start, res_end, user_name in self._reserved[max(pos - 1, 0):]:
+            if res_start >= end_min:
+                break
+            if res_end > start_min:
+                return user_name
+        return ''
+
+    def slot_status(self, start_min, end_min, slot_mask=None):
+        """Retorna (status, user_name) de um slot."""
+        if slot_mask is None:
+            slot_mask = span_mask(start_min, end_min)
+        for status in STATUS_PRIORITY:
+            if self.masks[status] & slot_mask:
+                user_name = self._reserved_name(start_min, end_min) if status == 'reserved' else ''
+                return status, user_name
+        return 'available', ''
+
+    def slot_grid(self):
+        """Monta as grades '2h30' e '1h15' no formato consumido pelo front-end."""
+        slots = {}
+        occupied = self.occupied_mask()
+        for grid_name, grid in SLOT_GRIDS.items():
+            slots[grid_name] = grid_slots = []
+            for start_min, end_min, slot_mask, fields in grid:
+                if occupied & slot_mask:
+                    status, user_name = self.slot_status(start_min, end_min, slot_mask)
+                else:
+                    status, user_name = 'available', ''
+                grid_slots.append(dict(fields, status=status, user_name=user_name))
+        return slots
+
+
+def first_name(nome_completo):
+    # Rótulo das reservas na grade: só o primeiro nome de quem reservou
+    return nome_completo.split()[0] if nome_completo else 'Usuário'
+
+
+def _parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def unavailable_intervals_query(room_ids, start_day, end_day=None, now=None):
+    """
+    Uma única consulta (UNION ALL) com reservas e bloqueios temporários vivos
+    das salas informadas no período. Datas e horários vêm como texto para
+    unificar as colunas DateTime, Date e Time. Os horários bloqueados
+    recorrentes vêm da agenda compilada (block_schedule).
+    """
+    end_day = end_day or start_day
+    now = now or datetime.utcnow()
+    reservations = select(
+        Reservation.room_id.label('room_id'),
+        cast(Reservation.reservation_date, String).label('day'),
+        literal('reserved').label('status'),
+        cast(Reservation.start_time, String).label('start'),
+        cast(Reservation.end_time, String).label('end'),
+        User.nome_completo.label('label'),
+        Reservation.id.label('ref_id'),
+        cast(None, String).label('expires_at'),
+        Reservation.user_id.label('owner_id')
+    ).join(User, User.id == Reservation.user_id).where(
+        Reservation.room_id.in_(room_ids),
+        Reservation.reservation_date.between(start_day, end_day)
+    )
+    locks = select(
+        TempLock.room_id, cast(TempLock.date, String), literal('locked'),
+        cast(TempLock.start_time, String), cast(TempLock.end_time, String),
+        literal(''), TempLock.id, cast(TempLock.expires_at, String), TempLock.user_id
+    ).where(
+        TempLock.room_id.in_(room_ids),
+        TempLock.date.between(start_day, end_day),
+        TempLock.expires_at > now
+    )
+    return union_all(reservations, locks)
+
+
+def date_range(start_day, end_day):
+    """Lista de datas de start_day até end_day (inclusive)."""
+    return [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+
+
+def make_entry(status, start, end, label='', ref_id=None, expires_at=None, owner_id=None):
+    """
+    Entrada de ocupação serializável:
+    [status, início, fim, rótulo, id de origem, expiração, id do usuário dono].
+    Início/fim em minutos do dia; expiração (só para TempLock) em ISO 8601.
+    """
+    if isinstance(expires_at, datetime):
+        expires_at = expires_at.isoformat()
+    return [status, to_minutes(start), to_minutes(end), label or '', ref_id, expires_at, owner_id]
+
+
+def group_entries(rows, room_ids, days):
+    """Agrupa as linhas da consulta de origem em listas de entradas por (sala, data)."""
+    entries = {(room_id, day): [] for room_id in room_ids for day in days}
+    for room_id, day, status, start, end, label, ref_id, expires_at, owner_id in rows:
+        target = entries.get((room_id, date.fromisoformat(day[:10])))
+        if target is not None:
+            label = first_name(label) if status == 'reserved' else ''
+            target.append(make_entry(status, start, end, label, ref_id, _parse_datetime(expires_at), owner_id))
+    return entries
+
+
+def load_source_entries(room_ids, start_day, end_day=None, now=None):
+    """Entradas de reservas e bloqueios temporários calculadas direto das tabelas de origem (uma ida ao banco)."""
+    end_day = end_day or start_day
+    room_ids = [int(room_id) for room_id in room_ids]
+    if not room_ids:
+        return {}
+    rows = db.session.execute(unavailable_intervals_query(room_ids, start_day, end_day, now)).all()
+    return group_entries(rows, room_ids, date_range(start_day, end_day))
+
+
+def is_expired(entry, now):
+    """Indica se a entrada é um bloqueio temporário já expirado."""
+    expires_at = entry[5]
+    return expires_at is not None and datetime.fromisoformat(expires_at) <= now
+
+
+def live_entries(entries, now=None, ignore_owner=None):
+    """
+    Entradas que ainda ocupam a agenda: descarta bloqueios temporários expirados
+    e, se informado, os bloqueios temporários do próprio usuário.
+    """
+    now = now or datetime.utcnow()
+    for entry in entries:
+        if is_expired(entry, now):
+            continue
+        if ignore_owner is not None and entry[0] == 'locked' and entry[6] == ignore_owner:
+            continue
+        yield entry
+
+
+def day_from_entries(entries, now=None, ignore_owner=None):
+    """Monta o DayAvailability de uma lista de entradas (ver live_entries)."""
+    day = DayAvailability()
+    for status, start_min, end_min, label, _ref_id, _expires_at, _owner_id in live_entries(entries, now, ignore_owner):
+        day.add(status, start_min, end_min, label)
+    return day
+
+
+def occupied_mask_from_entries(entries, now=None, ignore_owner=None):
+    """Bitmap de minutos ocupados (qualquer status), sem montar o DayAvailability."""
+    mask = 0
+    for entry in live_entries(entries, now, ignore_owner):
+        mask |= span_mask(entry[1], entry[2])
+    return mask
+
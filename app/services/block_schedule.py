@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Horários bloqueados recorrentes compilados por sala.
+
+Os BlockedTime de uma sala (com período de validade e exceções) são
+compilados uma única vez em uma agenda semanal: para cada dia da semana, as
+entradas dos bloqueios que valem sempre, mais a lista curta dos que dependem
+da data. A agenda alimenta as grades materializadas (RoomDayGrid), onde a
+consulta de slots e a checagem de conflito da reserva viram um AND de máscaras.
+
+A agenda fica em cache no processo, validada pela Room.info_version
+(incrementada a cada mudança de bloqueio). Agendas compiladas dentro de uma
+transação que alterou bloqueios não entram no cache até o commit.
+"""
+import threading
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models.user import Room, BlockedTime, BlockedTimeException
+from app.services.availability_service import WEEKDAYS, make_entry
+
+
+class RoomBlockSchedule:
+    """Agenda semanal de bloqueios de uma sala."""
+
+    __slots__ = ('entries', 'dated')
+
+    def __init__(self):
+        # Bloqueios que valem em toda ocorrência do dia da semana
+        self.entries = [[] for _ in WEEKDAYS]
+        # Bloqueios com período de validade ou exceções: (entrada, início, fim, datas de exceção)
+        self.dated = [[] for _ in WEEKDAYS]
+
+    def add(self, weekday, entry, valid_from=None, valid_until=None, exceptions=()):
+        if valid_from or valid_until or exceptions:
+            self.dated[weekday].append((entry, valid_from, valid_until, frozenset(exceptions)))
+        else:
+            self.entries[weekday].append(entry)
+
+    def entries_for(self, day):
+        """Entradas 'blocked' da sala na data."""
+        entries = list(self.entries[day.weekday()])
+        for entry, valid_from, valid_until, exceptions in self.dated[day.weekday()]:
+            if (valid_from is None or day >= valid_from) and (valid_until is None or day <= valid_until) \
+                    and day not in exceptions:
+                entries.append(entry)
+        return entries
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def blocks_query(room_ids):
+    """Bloqueios das salas, em ordem de horário."""
+    return (
+        select(BlockedTime.id, BlockedTime.room_id, BlockedTime.day_of_week, BlockedTime.start_time,
+               BlockedTime.end_time, BlockedTime.valid_from, BlockedTime.valid_until)
+        .where(BlockedTime.room_id.in_(room_ids))
+        .order_by(BlockedTime.start_time)
+    )
+
+
+def block_exceptions_query(room_ids):
+    """Datas de exceção dos bloqueios das salas."""
+    return (
+        select(BlockedTimeException.blocked_time_id, BlockedTimeException.date)
+        .join(BlockedTime, BlockedTime.id == BlockedTimeException.blocked_time_id)
+        .where(BlockedTime.room_id.in_(room_ids))
+    )
+
+
+def duplicate_block_query(room_id, day_of_week, start, end, valid_from=None, valid_until=None):
+    """Bloqueio idêntico já cadastrado na sala (checagem do cadastro no admin)."""
+    return select(BlockedTime).filter_by(
+        room_id=room_id, day_of_week=day_of_week, start_time=start, end_time=end,
+        valid_from=valid_from, valid_until=valid_until
+    )
+
+
+def _compile(room_ids):
+    schedules = {room_id: RoomBlockSchedule() for room_id in room_ids}
+    exceptions = {}
+    for blocked_time_id, day in db.session.execute(block_exceptions_query(room_ids)):
+        exceptions.setdefault(blocked_time_id, []).append(day)
+    blocks = db.session.execute(blocks_query(room_ids))
+    for block_id, room_id, day_of_week, start, end, valid_from, valid_until in blocks:
+        if day_of_week not in WEEKDAYS:
+            continue
+        schedules[room_id].add(WEEKDAYS.index(day_of_week), make_entry('blocked', start, end, '', block_id),
+                               valid_from, valid_until, exceptions.get(block_id, ()))
+    return schedules
+
+
+def room_block_schedules(room_ids):
+    """Agendas de bloqueio das salas, recompilando só as que mudaram desde o último uso."""
+    room_ids = [int(room_id) for room_id in room_ids]
+    if not room_ids:
+        return {}
+    versions = dict(db.session.execute(select(Room.id, Room.info_version).where(Room.id.in_(room_ids))).all())
+    with _cache_lock:
+        cached = {room_id: _cache.get(room_id) for room_id in room_ids}
+    stale = [room_id for room_id in room_ids if not cached[room_id] or cached[room_id][0] != versions.get(room_id)]
+    if stale:
+        compiled = _compile(stale)
+        uncommitted = db.session.info.get('changed_block_rooms', ())
+        with _cache_lock:
+            for room_id in stale:
+                cached[room_id] = (versions.get(room_id), compiled[room_id])
+                if room_id not in uncommitted:
+                    _cache[room_id] = cached[room_id]
+    return {room_id: cached[room_id][1] for room_id in room_ids}
+
+
+def invalidate_room_blocks(room_id):
+    """Marca a agenda de bloqueios da sala como alterada (na transação corrente e no cache local)."""
+    room = db.session.get(Room, room_id)
+    room.info_version = (room.info_version or 0) + 1
+    db.session.info.setdefault('changed_block_rooms', set()).add(int(room_id))
+    with _cache_lock:
+        _cache.pop(int(room_id), None)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_rooms(session):
+    session.info.pop('changed_block_rooms', None)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Reserva de sala com garantia no banco.
+
+Cada reserva ocupa, em reservation_slot, uma linha por quarto de hora
+(room_id, reservation_date, slot). A chave primária dessa tabela faz o banco
+recusar qualquer segunda reserva que toque um quarto de hora já ocupado,
+inclusive um 1h15 sobreposto a um 2h30: das transações concorrentes, só a
+primeira a gravar vence e as demais recebem IntegrityError.
+"""
+from datetime import timedelta
+from app.models.availability import ReservationSlot
+from app.services.availability_service import WEEKDAYS, to_minutes
+
+SLOT_MINUTES = 15
+MAX_RECURRING_WEEKS = 26
+
+
+def slot_indexes(start_min, end_min):
+    """Quartos de hora do dia cobertos pelo intervalo [start_min, end_min)."""
+    return range(start_min // SLOT_MINUTES, -(-end_min // SLOT_MINUTES))
+
+
+def claim_slots(reservation):
+    """Associa à reserva as linhas de reservation_slot que ela ocupa (gravadas no próximo flush)."""
+    reservation.slot_claims = [
+        ReservationSlot(room_id=reservation.room_id, reservation_date=reservation.reservation_date, slot=slot)
+        for slot in slot_indexes(to_minutes(reservation.start_time), to_minutes(reservation.end_time))
+    ]
+
+
+def reservation_price(room, start_time, end_time):
+    """Preço da reserva pela duração: até 1h15 cobra o preço de 1h15, acima disso o de 2h30."""
+    duration = to_minutes(end_time) - to_minutes(start_time)
+    return room.price_1h15 if duration <= 75 else room.price_2h30
+
+
+def weekly_occurrences(start_day, weeks, weekdays=None):
+    """
+    Datas de uma recorrência semanal: os dias da semana informados (nomes de
+    WEEKDAYS; padrão, o dia de start_day) nos 'weeks' * 7 dias a partir de start_day.
+    """
+    weekday_indexes = {WEEKDAYS.index(name) for name in weekdays} if weekdays else {start_day.weekday()}
+    days = (start_day + timedelta(days=offset) for offset in range(weeks * 7))
+    return [day for day in days if day.weekday() in weekday_indexes]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Capacidade diária dos equipamentos para aluguel.
+
+equipment_day_usage guarda, por (equipamento, data), quantas unidades já
+foram reservadas: é o acumulado (soma de prefixos) do vetor de diferenças
+das reservas, em que cada aluguel soma +1 no primeiro dia e -1 no dia
+seguinte ao último. Com o acumulado materializado, "há uma unidade livre em
+todos os dias de 10 a 24 de março?" é o máximo do vetor nesse trecho, lido
+em uma consulta e respondido em O(dias), sem varrer as reservas.
+
+A reserva incrementa os contadores do período com um UPDATE condicional (só
+passa enquanto reserved_units < units_available), na mesma transação da
+EquipmentReservation: no SQLite as escritas são serializadas, então o teste
+e o incremento acontecem juntos e duas reservas concorrentes não conseguem
+ultrapassar o número de unidades.
+"""
+from datetime import timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models.equipment import RentableEquipment, EquipmentReservation, EquipmentDayUsage
+from app.services.availability_service import date_range
+
+MAX_RENTAL_DAYS = 31
+
+
+def _capacity(equipment_id):
+    # units_available nulo vale o padrão da coluna (1 unidade)
+    return (
+        select(func.coalesce(RentableEquipment.units_available, 1))
+        .where(RentableEquipment.id == equipment_id)
+        .scalar_subquery()
+    )
+
+
+def capacity(equipment):
+    return equipment.units_available if equipment.units_available is not None else 1
+
+
+def _in_period(equipment_id, start_day, end_day):
+    return (
+        EquipmentDayUsage.equipment_id == equipment_id,
+        EquipmentDayUsage.date.between(start_day, end_day)
+    )
+
+
+def full_day_query(equipment_id, start_day, end_day):
+    """SELECT de um dia do período em que todas as unidades já estão reservadas."""
+    return select(EquipmentDayUsage.date).where(
+        *_in_period(equipment_id, start_day, end_day), EquipmentDayUsage.reserved_units >= _capacity(equipment_id)
+    ).limit(1)
+
+
+def reserve_units_update(equipment_id, start_day, end_day):
+    """UPDATE condicional que ocupa uma unidade em cada dia do período que ainda tem unidade livre."""
+    return (
+        update(EquipmentDayUsage)
+        .where(*_in_period(equipment_id, start_day, end_day), EquipmentDayUsage.reserved_units < _capacity(equipment_id))
+        .values(reserved_units=EquipmentDayUsage.reserved_units + 1)
+    )
+
+
+def reserve_units(equipment_id, start_day, end_day=None):
+    """
+    Ocupa uma unidade do equipamento em todos os dias de [start_day, end_day],
+    na transação corrente. Retorna False (sem alterar os contadores) se algum
+    dia do período já está com todas as unidades reservadas.
+    """
+    equipment_id = int(equipment_id)
+    end_day = end_day or start_day
+    days = date_range(start_day, end_day)
+    # O INSERT abre a transação de escrita: daqui até o commit nenhuma outra reserva altera os contadores
+    db.session.execute(
+        sqlite_insert(EquipmentDayUsage).on_conflict_do_nothing(),
+        [dict(equipment_id=equipment_id, date=day, reserved_units=0) for day in days]
+    )
+    full_day = db.session.execute(full_day_query(equipment_id, start_day, end_day)).first()
+    if full_day is not None:
+        return False
+    result = db.session.execute(
+        reserve_units_update(equipment_id, start_day, end_day).execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(days)
+
+
+def usage_calendar(equipment_ids, start_day, end_day):
+    """
+    {equipment_id: [unidades reservadas por dia]} de start_day a end_day
+    (índice 0 = start_day), para vários equipamentos em uma consulta.
+    """
+    calendar = {equipment_id: [0] * ((end_day - start_day).days + 1) for equipment_id in equipment_ids}
+    if not calendar:
+        return calendar
+    rows = db.session.execute(
+        select(EquipmentDayUsage.equipment_id, EquipmentDayUsage.date, EquipmentDayUsage.reserved_units)
+        .where(EquipmentDayUsage.equipment_id.in_(list(calendar)), EquipmentDayUsage.date.between(start_day, end_day))
+    )
+    for equipment_id, day, units in rows:
+        calendar[equipment_id][(day - start_day).days] = units
+    return calendar
+
+
+def free_units(equipments, start_day, end_day=None):
+    """{equipment_id: unidades livres em todos os dias do período} (o pior dia do período)."""
+    end_day = end_day or start_day
+    calendar = usage_calendar([equipment.id for equipment in equipments], start_day, end_day)
+    return {equipment.id: capacity(equipment) - max(calendar[equipment.id]) for equipment in equipments}
+
+
+def daily_usage(periods, start_day, end_day):
+    """
+    Unidades em uso por dia de start_day a end_day, a partir de uma lista de
+    períodos (primeiro_dia, último_dia): vetor de diferenças e soma de prefixos.
+    """
+    diff = [0] * ((end_day - start_day).days + 2)
+    for first, last in periods:
+        first, last = max(first, start_day), min(last, end_day)
+        if first > last:
+            continue
+        diff[(first - start_day).days] += 1
+        diff[(last - start_day).days + 1] -= 1
+    usage, running = [], 0
+    for delta in diff[:-1]:
+        running += delta
+        usage.append(running)
+    return usage
+
+
+def check_equipment_usage(rebuild=False):
+    """
+    Compara os contadores com a ocupação calculada a partir das reservas de
+    equipamento e retorna as divergências [(equipment_id, data, contador, reservas)].
+    Com rebuild=True, regrava os contadores a partir das reservas.
+    """
+    periods = {}
+    for equipment_id, first, last in db.session.execute(
+        select(EquipmentReservation.equipment_id, EquipmentReservation.reservation_date,
+               func.coalesce(EquipmentReservation.end_date, EquipmentReservation.reservation_date))
+    ):
+        periods.setdefault(equipment_id, []).append((first, last))
+    counted = {}
+    for equipment_id, equipment_periods in periods.items():
+        start_day = min(first for first, _ in equipment_periods)
+        end_day = max(last for _, last in equipment_periods)
+        for offset, units in enumerate(daily_usage(equipment_periods, start_day, end_day)):
+            if units:
+                counted[(equipment_id, start_day + timedelta(days=offset))] = units
+    stored = {
+        (equipment_id, day): units
+        for equipment_id, day, units in db.session.execute(
+            select(EquipmentDayUsage.equipment_id, EquipmentDayUsage.date, EquipmentDayUsage.reserved_units)
+        )
+    }
+    mismatches = sorted(
+        (equipment_id, day, stored.get((equipment_id, day), 0), counted.get((equipment_id, day), 0))
+        for equipment_id, day in set(counted) | set(stored)
+        if stored.get((equipment_id, day), 0) != counted.get((equipment_id, day), 0)
+    )
+    if rebuild and mismatches:
+        for equipment_id, day, _, total in mismatches:
+            db.session.execute(
+                sqlite_insert(EquipmentDayUsage)
+                .values(equipment_id=equipment_id, date=day, reserved_units=total)
+                .on_conflict_do_update(index_elements=['equipment_id', 'date'], set_={'reserved_units': total})
+            )
+        db.session.commit()
+    return mismatches
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento dos bloqueios temporários ("holds") de horário.
+
+As rotas de bloqueio e as leituras de horários falam com um HoldStore,
+escolhido por HOLD_STORE na configuração:
+
+- 'sql' (padrão): linhas de TempLock refletidas na grade materializada,
+  como antes. As leituras já veem os holds dentro da grade.
+- 'memory': holds em memória no processo, com expiração por TTL. Nenhuma
+  escrita no app.db; serve para um único processo (threads/greenlets).
+- 'redis': holds em um servidor chave-valor compatível com Redis
+  (HOLD_STORE_URL), compartilhado entre processos. O pacote 'redis' é
+  opcional e só é exigido quando este backend é configurado.
+
+Nos backends fora do banco, os eventos de horário são publicados direto no
+barramento (não há commit para esperar), e o conjunto de holds vivos entra
+no ETag das rotas de horários.
+"""
+import heapq
+import itertools
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from app import db
+from app.models.user import TempLock
+from app.services.availability_service import make_entry, to_minutes
+from app.services.availability_grid import grid_for_update, record_temp_lock, remove_entry, minutes_to_iso
+from app.services.slot_events import bus
+from app.services.temp_lock_reaper import ensure_reaper
+
+HOLD_TTL = timedelta(minutes=5)
+
+
+def _publish_created(room_id, day, entry, expires_at):
+    start, end = minutes_to_iso(entry[1]), minutes_to_iso(entry[2])
+    bus.publish('locked', room_id, day, start, end, lock_id=entry[4])
+    bus.schedule_expiry(entry[4], room_id, day, start, end, expires_at)
+
+
+def _publish_released(room_id, day, entry):
+    bus.cancel_expiry(entry[4])
+    bus.publish('released', room_id, day, minutes_to_iso(entry[1]), minutes_to_iso(entry[2]), lock_id=entry[4])
+
+
+def _overlaps(entry, start_min, end_min):
+    return entry[1] < end_min and entry[2] > start_min
+
+
+class SqlHoldStore:
+    """Holds como linhas de TempLock, mantidos dentro das grades materializadas."""
+
+    name = 'sql'
+
+    def holds_for(self, keys, now=None):
+        # Os holds já fazem parte das entradas da grade de cada sala/dia
+        return {}
+
+    def create(self, room_id, day, start_time, end_time, user_id, now=None):
+        expires_at = (now or datetime.utcnow()) + HOLD_TTL
+        grid = grid_for_update(room_id, day)
+        lock = TempLock(room_id=room_id, date=day, start_time=start_time, end_time=end_time,
+                        user_id=user_id, expires_at=expires_at)
+        db.session.add(lock)
+        db.session.flush()
+        record_temp_lock(grid, lock)
+        db.session.commit()
+        ensure_reaper(current_app._get_current_object())
+        return {'id': lock.id, 'expires_at': expires_at}
+
+    def release(self, hold_id):
+        lock = db.session.get(TempLock, hold_id)
+        if lock is None:
+            return False
+        grid = grid_for_update(lock.room_id, lock.date)
+        remove_entry(grid, 'locked', lock.id)
+        db.session.delete(lock)
+        db.session.commit()
+        return True
+
+
+class MemoryHoldStore:
+    """Holds em memória, compartilhados por todas as threads do processo, com expiração por TTL."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._channels = {}
+        self._holds = {}
+        self._expiries = []
+
+    def _purge(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            _, hold_id = heapq.heappop(self._expiries)
+            held = self._holds.pop(hold_id, None)
+            if held:
+                key, _ = held
+                self._channels[key].pop(hold_id, None)
+                if not self._channels[key]:
+                    del self._channels[key]
+
+    def holds_for(self, keys, now=None):
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._purge(now)
+            return {key: list(self._channels[key].values()) for key in keys if key in self._channels}
+
+    def create(self, room_id, day, start_time, end_time, user_id, now=None):
+        now = now or datetime.utcnow()
+        expires_at = now + HOLD_TTL
+        start_min, end_min = to_minutes(start_time), to_minutes(end_time)
+        key = (int(room_id), day)
+        with self._lock:
+            self._purge(now)
+            if any(_overlaps(entry, start_min, end_min) for entry in self._channels.get(key, {}).values()):
+                return None
+            hold_id = next(self._seq)
+            entry = make_entry('locked', start_min, end_min, '', hold_id, expires_at, user_id)
+            self._channels.setdefault(key, {})[hold_id] = entry
+            self._holds[hold_id] = (key, entry)
+            heapq.heappush(self._expiries, (expires_at, hold_id))
+        _publish_created(key[0], day, entry, expires_at)
+        return {'id': hold_id, 'expires_at': expires_at}
+
+    def release(self, hold_id):
+        with self._lock:
+            held = self._holds.pop(hold_id, None)
+            if held is None:
+                return False
+            key, entry = held
+            self._channels[key].pop(hold_id, None)
+            if not self._channels[key]:
+                del self._channels[key]
+        _publish_released(key[0], key[1], entry)
+        return True
+
+
+# Cria o hold de forma atômica no servidor: limpa os vencidos, recusa sobreposição e grava
+_REDIS_CREATE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local held = cjson.decode(member)
+    if held[2] < tonumber(ARGV[3]) and held[3] > tonumber(ARGV[2]) then
+        return false
+    end
+end
+local hold_id = redis.call('INCR', KEYS[2])
+local entry = cjson.encode({'locked', tonumber(ARGV[2]), tonumber(ARGV[3]), '', hold_id, ARGV[6], tonumber(ARGV[5])})
+redis.call('ZADD', KEYS[1], ARGV[4], entry)
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[7]) then
+    redis.call('PEXPIRE', KEYS[1], ARGV[7])
+end
+redis.call('SET', ARGV[8] .. hold_id, KEYS[1] .. '\\n' .. entry, 'PX', ARGV[7])
+return entry
+"""
+
+_REDIS_RELEASE = """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return false
+end
+local separator = string.find(value, '\\n', 1, true)
+redis.call('ZREM', string.sub(value, 1, separator - 1), string.sub(value, separator + 1))
+redis.call('DEL', KEYS[1])
+return value
+"""
+
+
+class RedisHoldStore:
+    """Holds em um servidor compatível com Redis: um sorted set por sala/dia, pontuado pela expiração."""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='odonto:holds:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("HOLD_STORE='redis' exige o pacote 'redis' (pip install redis).") from e
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._create = self.client.register_script(_REDIS_CREATE)
+        self._release = self.client.register_script(_REDIS_RELEASE)
+
+    def _channel_key(self, room_id, day):
+        return f'{self.prefix}ch:{int(room_id)}:{day.isoformat()}'
+
+    @staticmethod
+    def _score(moment):
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+
+    def holds_for(self, keys, now=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = self._score(now or datetime.utcnow())
+        pipeline = self.client.pipeline(transaction=False)
+        for room_id, day in keys:
+            pipeline.zrangebyscore(self._channel_key(room_id, day), f'({now}', '+inf')
+        holds = {}
+        for key, members in zip(keys, pipeline.execute()):
+            if members:
+                holds[key] = [json.loads(member) for member in members]
+        return holds
+
+    def create(self, room_id, day, start_time, end_time, user_id, now=None):
+        now = now or datetime.utcnow()
+        expires_at = now + HOLD_TTL
+        raw = self._create(
+            keys=[self._channel_key(room_id, day), f'{self.prefix}seq'],
+            args=[self._score(now), to_minutes(start_time), to_minutes(end_time), self._score(expires_at),
+                  int(user_id), expires_at.isoformat(), int(HOLD_TTL.total_seconds() * 1000), f'{self.prefix}h:']
+        )
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        _publish_created(int(room_id), day, entry, expires_at)
+        return {'id': entry[4], 'expires_at': expires_at}
+
+    def release(self, hold_id):
+        raw = self._release(keys=[f'{self.prefix}h:{int(hold_id)}'])
+        if not raw:
+            return False
+        channel, member = raw.split('\n', 1)
+        _, room_id, day = channel.rsplit(':', 2)
+        _publish_released(int(room_id), datetime.strptime(day, '%Y-%m-%d').date(), json.loads(member))
+        return True
+
+
+def create_hold_store(config):
+    backend = config.get('HOLD_STORE', 'sql')
+    if backend == 'memory':
+        return MemoryHoldStore()
+    if backend == 'redis':
+        return RedisHoldStore(config.get('HOLD_STORE_URL', 'redis://localhost:6379/0'))
+    if backend != 'sql':
+        raise RuntimeError(f"HOLD_STORE desconhecido: {backend!r} (use 'sql', 'memory' ou 'redis').")
+    return SqlHoldStore()
+
+
+def init_hold_store(app):
+    app.extensions['hold_store'] = create_hold_store(app.config)
+
+
+def hold_store():
+    """HoldStore configurado na aplicação corrente."""
+    return current_app.extensions['hold_store']
+
+
+def holds_signature(holds):
+    """Parte do ETag que identifica os holds vivos (ids são únicos e os holds não mudam depois de criados)."""
+    return ';'.join(
+        f'h{room_id}:{day.isoformat()}:' + ','.join(str(entry[4]) for entry in sorted(entries, key=lambda e: e[4]))
+        for (room_id, day), entries in sorted(holds.items())
+    )
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Idempotency-Key para os POSTs de reserva.
+
+O PWA reenvia /book-room, /book-equipment e /book-parking quando a conexão
+cai. Com a chave (cabeçalho Idempotency-Key ou campo idempotency_key do
+formulário), a primeira requisição grava a resposta em idempotency_key e as
+retentativas do mesmo usuário recebem essa resposta de volta sem executar a
+rota de novo: nenhuma consulta de conflito e nenhuma linha duplicada.
+
+A linha da chave é inserida (flush) antes da rota e vai no mesmo commit da
+reserva, então duas retentativas simultâneas não passam as duas: a segunda
+recebe 409 enquanto a primeira não terminou. Respostas 5xx não são guardadas,
+para que o cliente possa tentar de novo. As chaves expiram depois de
+IDEMPOTENCY_KEY_TTL_HOURS e são apagadas em lotes.
+"""
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, flash, jsonify, make_response, redirect, request, session, url_for
+from flask_login import current_user
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.user import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+DEFAULT_TTL_HOURS = 24
+PURGE_INTERVAL_SECONDS = 300
+PURGE_BATCH_SIZE = 500
+
+_last_purge = None
+
+
+def new_idempotency_key():
+    """Chave nova para um formulário de reserva (uma por tentativa de reserva renderizada)."""
+    return uuid.uuid4().hex
+
+
+def _request_key():
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.form.get(IDEMPOTENCY_FIELD)
+    key = (key or '').strip()
+    return key[:128] or None
+
+
+def request_fingerprint():
+    """Hash do método, caminho e conteúdo da requisição (sem a própria chave nem o token CSRF)."""
+    if request.is_json:
+        payload = request.get_json(silent=True)
+    else:
+        payload = {name: values for name, values in request.form.lists() if name not in (IDEMPOTENCY_FIELD, 'csrf_token')}
+    raw = json.dumps([request.method, request.path, payload], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _find(key):
+    return IdempotencyKey.query.filter_by(user_id=current_user.id, key=key).first()
+
+
+def _refuse(message, status):
+    # Formulários voltam para a página de reservas com a mensagem; o fetch recebe JSON
+    if request.is_json:
+        return jsonify({'success': False, 'message': message}), status
+    flash(message, 'warning')
+    return redirect(url_for('main.my_reservations'))
+
+
+def _replay(record):
+    meta = json.loads(record.response_meta or '{}')
+    for category, message in meta.get('flashes', []):
+        flash(message, category)
+    response = Response(record.response_body, status=record.status_code, mimetype=meta.get('mimetype'))
+    if meta.get('location'):
+        response.headers['Location'] = meta['location']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _forget(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == current_user.id, IdempotencyKey.key == key
+    ))
+    db.session.commit()
+
+
+def _store(key, fingerprint, expires_at, response, flashes):
+    meta = {'mimetype': response.mimetype, 'location': response.headers.get('Location'), 'flashes': flashes}
+    values = dict(status_code=response.status_code, response_body=response.get_data(as_text=True),
+                  response_meta=json.dumps(meta, ensure_ascii=False))
+    # A rota pode ter feito rollback (e levado a linha provisória junto): grava ou completa a linha
+    db.session.execute(
+        sqlite_insert(IdempotencyKey)
+        .values(user_id=current_user.id, key=key, endpoint=request.endpoint, request_hash=fingerprint,
+                created_at=datetime.utcnow(), expires_at=expires_at, **values)
+        .on_conflict_do_update(index_elements=['user_id', 'key'], set_=values)
+    )
+    db.session.commit()
+
+
+def idempotent(f):
+    """Decorador para POSTs de reserva: repete a resposta guardada quando a Idempotency-Key já foi usada."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = _request_key()
+        if key is None:
+            return f(*args, **kwargs)
+        now = datetime.utcnow()
+        fingerprint = request_fingerprint()
+
+        record = _find(key)
+        if record is not None and record.expires_at <= now:
+            db.session.delete(record)
+            db.session.flush()
+            record = None
+        if record is None:
+            expires_at = now + timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', DEFAULT_TTL_HOURS))
+            db.session.add(IdempotencyKey(user_id=current_user.id, key=key, endpoint=request.endpoint,
+                                          request_hash=fingerprint, expires_at=expires_at))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # Outra requisição com a mesma chave chegou primeiro
+                db.session.rollback()
+                record = _find(key)
+            else:
+                return _execute(f, args, kwargs, key, fingerprint, expires_at)
+
+        if record is not None and record.request_hash != fingerprint:
+            return _refuse('Esta chave de requisição já foi usada com outros dados.', 422)
+        if record is None or record.status_code is None:
+            return _refuse('Esta reserva ainda está sendo processada. Aguarde um instante.', 409)
+        return _replay(record)
+    return decorated_function
+
+
+def _execute(f, args, kwargs, key, fingerprint, expires_at):
+    flashes_before = len(session.get('_flashes', []))
+    try:
+        response = make_response(f(*args, **kwargs))
+    except Exception:
+        _forget(key)
+        raise
+    if response.status_code >= 500 or response.is_streamed:
+        _forget(key)
+        return response
+    _store(key, fingerprint, expires_at, response, session.get('_flashes', [])[flashes_before:])
+    _maybe_purge()
+    return response
+
+
+def purge_expired_keys(batch_size=PURGE_BATCH_SIZE, now=None):
+    """Apaga as chaves vencidas em lotes de até batch_size linhas. Retorna o total apagado."""
+    now = now or datetime.utcnow()
+    deleted = 0
+    while True:
+        expired_ids = select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= now).limit(batch_size).scalar_subquery()
+        result = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired_ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+def _maybe_purge():
+    # Limpeza oportunista, no máximo uma vez a cada PURGE_INTERVAL_SECONDS por processo
+    global _last_purge
+    if _last_purge is not None and time.monotonic() - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = time.monotonic()
+    try:
+        purge_expired_keys()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f'Falha na limpeza das chaves de idempotência: {e}')
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Cache do usuário logado para o user_loader do Flask-Login.
+
+Cada requisição autenticada (inclusive as chamadas AJAX de horários)
+carregava a linha inteira de User, com os arquivos do KYC e os dados do
+veículo. Aqui o processo guarda, por alguns segundos, só as colunas que a
+autorização e os templates usam (IDENTITY_FIELDS), em uma cópia desligada
+da sessão; a cada requisição ela é anexada à sessão com merge(load=False),
+sem consulta. As demais colunas continuam acessíveis: são carregadas sob
+demanda na primeira leitura, como colunas adiadas.
+
+Cada entrada tem o carimbo de versão do usuário no momento da leitura.
+Qualquer alteração de User pelo ORM (edição no admin, score do
+mark_as_paid, aceite do contrato) incrementa a versão no flush e de novo no
+commit, então uma leitura feita antes da alteração não volta para o cache.
+Em outros workers a entrada expira pelo TTL (IDENTITY_CACHE_TTL).
+"""
+import threading
+import time
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, load_only, make_transient_to_detached, object_session
+from app import db
+from app.models.user import User
+from app.services.query_stats import cache_fill
+
+IDENTITY_FIELDS = (
+    'id', 'nome_completo', 'email', 'cro', 'uf_cro', 'genero', 'score', 'is_admin', 'is_vip',
+    'is_active', 'contract_accepted_version', 'profile_image'
+)
+MAX_ENTRIES = 5000
+
+
+class IdentityCache:
+    def __init__(self, ttl_seconds=30):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != self.version(user_id):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2]
+
+    def put(self, user_id, version, user):
+        """Guarda a cópia lida com o carimbo `version`; descartada se o usuário mudou desde a leitura."""
+        with self._lock:
+            if version != self.version(user_id):
+                return
+            if len(self._entries) >= MAX_ENTRIES:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] >= now}
+                if len(self._entries) >= MAX_ENTRIES:
+                    self._entries.clear()
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, version, user)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self.version(user_id) + 1
+            self._entries.pop(user_id, None)
+
+
+identity_cache = IdentityCache()
+
+
+def init_identity_cache(app):
+    identity_cache.ttl_seconds = app.config.get('IDENTITY_CACHE_TTL', 30)
+
+
+def _detached_copy(user):
+    copy = User(**{name: getattr(user, name) for name in IDENTITY_FIELDS})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def load_identity(user_id):
+    """Usuário logado (anexado à sessão corrente), do cache ou de uma consulta só com IDENTITY_FIELDS."""
+    if identity_cache.ttl_seconds <= 0:
+        return db.session.get(User, user_id)
+    cached = identity_cache.get(user_id)
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    version = identity_cache.version(user_id)
+    with cache_fill():
+        user = db.session.scalars(
+            select(User).options(load_only(*(getattr(User, name) for name in IDENTITY_FIELDS))).where(User.id == user_id)
+        ).first()
+    if user is not None:
+        identity_cache.put(user_id, version, _detached_copy(user))
+    return user
+
+
+# --- Invalidação: qualquer escrita de User pelo ORM ---
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_flush(mapper, connection, user):
+    identity_cache.invalidate(user.id)
+    object_session(user).info.setdefault('changed_identities', set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop('changed_identities', ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('changed_identities', None)
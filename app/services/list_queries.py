@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Consultas das telas de lista, carregando só as colunas que cada uma mostra.
+
+Room e User têm colunas em grupos adiados (deferred): os vídeos e textos da
+sala ('media', 'notes'), os documentos, dados pessoais e do veículo do
+usuário ('kyc', 'personal', 'vehicle'). Uma tela que precisa deles pede o
+grupo aqui (undefer_group) ou recebe uma projeção com load_only, e as
+relações que os templates percorrem (reserva -> usuário, reserva -> sala,
+sala -> equipamentos) vêm junto, sem uma consulta por linha.
+
+LIST_VIEWS guarda o orçamento de cada tela (colunas do maior SELECT e
+número de consultas); check_list_views o confere ("flask list_views check").
+"""
+from sqlalchemy import event, select
+from sqlalchemy.orm import joinedload, load_only, selectinload, undefer_group
+from app import db
+from app.models.user import User, Room, Reservation
+
+ROOM_DETAIL_OPTIONS = (undefer_group('media'), undefer_group('notes'))
+ROOM_LIST_COLUMNS = (Room.id, Room.name, Room.description, Room.price_2h30, Room.price_1h15)
+USER_LIST_COLUMNS = (User.id, User.nome_completo, User.email, User.cro, User.uf_cro, User.score, User.is_vip)
+
+
+def rooms_for_admin_list():
+    """admin_rooms_list.html: nome, descrição e preços."""
+    return Room.query.options(load_only(*ROOM_LIST_COLUMNS)).order_by(Room.name).all()
+
+
+def rooms_for_rent():
+    """rent_room.html: a ficha completa das salas visíveis, com os equipamentos."""
+    return (
+        Room.query.options(*ROOM_DETAIL_OPTIONS, selectinload(Room.equipments))
+        .filter_by(is_active=True, is_visible=True).order_by(Room.name).all()
+    )
+
+
+def reservation_list_query(query):
+    # Colunas da reserva + nome/score de quem reservou + nome/descrição da sala, no mesmo SELECT
+    return query.options(
+        load_only(Reservation.id, Reservation.start_time, Reservation.end_time, Reservation.reservation_date,
+                  Reservation.is_paid, Reservation.total_price),
+        joinedload(Reservation.booker).load_only(User.nome_completo, User.score),
+        joinedload(Reservation.room).load_only(Room.name, Room.description),
+    )
+
+
+def reservations_for_day_query(day):
+    return reservation_list_query(Reservation.query.filter_by(reservation_date=day)).order_by(Reservation.start_time)
+
+
+def unpaid_reservations_query():
+    return reservation_list_query(Reservation.query.filter_by(is_paid=False)).order_by(Reservation.reservation_date)
+
+
+def reservations_for_day(day):
+    """admin_reservations.html: as reservas do dia com usuário e sala."""
+    return reservations_for_day_query(day).all()
+
+
+def unpaid_reservations():
+    """Painel financeiro: reservas não pagas com usuário e sala."""
+    return unpaid_reservations_query().all()
+
+
+# --- Orçamento das telas de lista: o que cada template lê de cada linha ---
+def _touch_rooms(rooms):
+    return [(room.name, room.description, room.price_2h30, room.price_1h15) for room in rooms]
+
+
+def _touch_rent_rooms(rooms):
+    return [
+        (room.name, room.description, room.admin_notice, room.video_url, room.video_tutorial_url,
+         room.video_tutorial_autoclave_url, room.video_tutorial_raiox_url, room.video_tutorial_plastificadora_url,
+         [equipment.name for equipment in room.equipments])
+        for room in rooms
+    ]
+
+
+def _touch_reservations(reservations):
+    return [
+        (res.start_time, res.end_time, res.booker.nome_completo, res.booker.score, res.room.name, res.room.description)
+        for res in reservations
+    ]
+
+
+def _touch_users(users):
+    return [(user.nome_completo, user.email, user.score, user.is_vip, user.cro, user.uf_cro) for user in users]
+
+
+def _users_page():
+    from app.services.user_search import search_users
+    return search_users()[0]
+
+
+def _busiest_day():
+    return db.session.execute(
+        select(Reservation.reservation_date).group_by(Reservation.reservation_date)
+        .order_by(db.func.count().desc()).limit(1)
+    ).scalar()
+
+
+# tela: (percorre como o template, máximo de colunas por SELECT, máximo de consultas)
+LIST_VIEWS = {
+    'admin.rooms_list': (_touch_rooms, 5, 1),
+    'admin.users_list': (_touch_users, 7, 1),
+    'admin.view_reservations': (_touch_reservations, 14, 1),
+    'admin.financial_panel': (_touch_reservations, 14, 1),
+    'main.rent_room': (_touch_rent_rooms, 16, 2),
+}
+
+
+def check_list_views():
+    """
+    Carrega e percorre cada tela de LIST_VIEWS como o template faz e retorna
+    [(tela, linhas, colunas, consultas, ok)], com as colunas do maior SELECT.
+    """
+    day = _busiest_day()
+    loaders = {
+        'admin.rooms_list': rooms_for_admin_list,
+        'admin.users_list': _users_page,
+        'admin.view_reservations': lambda: reservations_for_day(day),
+        'admin.financial_panel': unpaid_reservations,
+        'main.rent_room': rooms_for_rent,
+    }
+    results = []
+    for name, (touch, max_columns, max_queries) in LIST_VIEWS.items():
+        db.session.expunge_all()
+        widths = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            widths.append(len(cursor.description or ()))
+
+        event.listen(db.engine, 'after_cursor_execute', count)
+        try:
+            touch(loaders[name]())
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', count)
+        columns = max(widths, default=0)
+        results.append((name, columns, len(widths), columns <= max_columns and len(widths) <= max_queries))
+    return results
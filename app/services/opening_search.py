@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Busca de horários livres ("próximo horário disponível") em todas as salas.
+
+A busca lê as grades materializadas (RoomDayGrid) em blocos de dias (os
+dias sem grade são calculados das tabelas de origem, sem gravar nada) e, para
+cada sala/dia, monta o bitmap de minutos livres dentro do expediente. Cada
+slot candidato é testado com um único AND contra esse bitmap, então o custo
+depende de salas x dias pesquisados, não do volume de reservas acumulado.
+A varredura para assim que encontra o número de resultados pedido.
+"""
+from datetime import datetime, timedelta
+from app.services.availability_service import (
+    SLOT_GRIDS, WEEKDAYS, date_range, occupied_mask_from_entries, span_mask, weekday_name
+)
+from app.services.availability_grid import load_grid_entries
+from app.services.block_schedule import room_block_schedules
+from app.services.hold_store import hold_store
+
+# Expediente das cadeiras (07h00 às 22h00)
+OPEN_MINUTES = (7 * 60, 22 * 60)
+OPEN_MASK = span_mask(*OPEN_MINUTES)
+
+# Turnos aceitos no filtro 'period'
+PERIODS = {
+    'manha': (7 * 60, 12 * 60),
+    'tarde': (12 * 60, 17 * 60),
+    'noite': (17 * 60, 22 * 60),
+}
+
+# Dias lidos do banco no primeiro bloco: a busca pelo primeiro horário livre raramente passa dele.
+# Cada bloco seguinte tem o triplo de dias: um ano inteiro sai em 4 blocos (14 + 42 + 126 + 378).
+SEARCH_CHUNK_DAYS = 14
+SEARCH_CHUNK_GROWTH = 3
+
+
+def free_mask(entries, now=None, ignore_owner=None):
+    """Bitmap dos minutos livres de uma sala/dia dentro do expediente."""
+    return OPEN_MASK & ~occupied_mask_from_entries(entries, now, ignore_owner)
+
+
+def _candidate_slots(grid_name, window):
+    start_min, end_min = window or OPEN_MINUTES
+    return [slot for slot in SLOT_GRIDS[grid_name] if slot[0] >= start_min and slot[1] <= end_min]
+
+
+def find_openings(rooms, start_day, end_day, grid_name='2h30', weekdays=None, window=None,
+                  limit=20, now=None, ignore_owner=None):
+    """
+    Lista os slots livres da grade informada, em ordem cronológica (e pelo nome
+    da sala dentro do mesmo horário), até 'limit' resultados.
+
+    rooms: salas candidatas (já filtradas por equipamento/visibilidade).
+    weekdays: nomes de dia da semana aceitos (formato de WEEKDAYS) ou None.
+    window: (início, fim) em minutos do dia que o slot precisa respeitar ou None.
+    """
+    now_utc = now or datetime.utcnow()
+    local_now = datetime.now()
+    if grid_name == '1h15':
+        rooms = [room for room in rooms if room.allow_1h15_rental]
+    rooms = sorted(rooms, key=lambda room: room.name)
+    slots = _candidate_slots(grid_name, window)
+    if not rooms or not slots:
+        return []
+
+    results = []
+    schedules = room_block_schedules([room.id for room in rooms])
+    chunk_start = max(start_day, local_now.date())
+    chunk_days = SEARCH_CHUNK_DAYS
+    while chunk_start <= end_day and len(results) < limit:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_day)
+        days = [day for day in date_range(chunk_start, chunk_end) if not weekdays or weekday_name(day) in weekdays]
+        entries = load_grid_entries([room.id for room in rooms], days[0], days[-1], now_utc, schedules) if days else {}
+        holds = hold_store().holds_for([(room.id, day) for room in rooms for day in days], now_utc)
+        for key, held in holds.items():
+            entries[key] = entries[key] + held
+        for day in days:
+            # Hoje só contam os slots que ainda não começaram
+            earliest = local_now.hour * 60 + local_now.minute if day == local_now.date() else 0
+            free = {room.id: free_mask(entries[(room.id, day)], now_utc, ignore_owner) for room in rooms}
+            for start_min, end_min, slot_mask, fields in slots:
+                if start_min < earliest:
+                    continue
+                for room in rooms:
+                    if free[room.id] & slot_mask == slot_mask:
+                        results.append(dict(
+                            fields,
+                            room_id=room.id,
+                            room_name=room.name,
+                            date=day.isoformat(),
+                            weekday=weekday_name(day),
+                            slot_type=grid_name,
+                            price=room.price_2h30 if grid_name == '2h30' else room.price_1h15
+                        ))
+                        if len(results) >= limit:
+                            return results
+        chunk_start = chunk_end + timedelta(days=1)
+        chunk_days *= SEARCH_CHUNK_GROWTH
+    return results
+
+
+def parse_weekdays(value):
+    """Lê 'tuesday,thursday' em um conjunto de dias; None se vazio. ValueError se inválido."""
+    if not value:
+        return None
+    weekdays = {name.strip().lower() for name in value.split(',') if name.strip()}
+    if not weekdays <= set(WEEKDAYS):
+        raise ValueError('Dia da semana inválido')
+    return weekdays
+
+
+def parse_window(period=None, start_str=None, end_str=None):
+    """Janela de horário a partir do turno ('manha', 'tarde', 'noite') ou de 'HH:MM' início/fim."""
+    if period:
+        if period not in PERIODS:
+            raise ValueError('Turno inválido')
+        return PERIODS[period]
+    if not start_str and not end_str:
+        return None
+    start = datetime.strptime(start_str, '%H:%M') if start_str else None
+    end = datetime.strptime(end_str, '%H:%M') if end_str else None
+    return (
+        start.hour * 60 + start.minute if start else OPEN_MINUTES[0],
+        end.hour * 60 + end.minute if end else OPEN_MINUTES[1]
+    )
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Alocação das vagas de garagem por janela de horário.
+
+Cada ParkingReservation ocupa a vaga só na janela das reservas de sala do
+usuário naquele dia (do início da primeira ao fim da última), e não o dia
+inteiro: a vaga de quem atende de manhã fica livre para quem atende à tarde.
+Reservas antigas, sem janela, continuam valendo pelo dia todo (07h00-22h00).
+
+A vaga é escolhida pelo servidor. Primeiro tenta encaixar a janela na vaga
+em que ela deixa a menor sobra (melhor encaixe). Se nenhuma vaga comporta a
+janela como as reservas estão, as janelas do dia são redistribuídas pelo
+particionamento de intervalos clássico (ordem de início + a vaga que ficou
+livre há mais tempo), que usa o menor número possível de vagas, igual ao
+pico de janelas simultâneas.
+
+Quando o usuário reserva outra sala no mesmo dia, a janela da garagem já
+reservada é alargada (widen_parking_window) na mesma transação e a vaga é
+realocada se a atual não comporta mais a janela.
+"""
+import heapq
+from datetime import time
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm.exc import StaleDataError
+from app import db
+from app.models.user import User, Reservation, ParkingSpot, ParkingReservation
+from app.services.availability_service import to_minutes
+
+# Horário de funcionamento da garagem (janela das reservas antigas de dia inteiro)
+PARKING_OPEN_MINUTES = 7 * 60
+PARKING_CLOSE_MINUTES = 22 * 60
+
+
+def minutes_to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def parking_window(parking_reservation):
+    """(início, fim) em minutos do dia; o dia inteiro quando a reserva não tem janela."""
+    if parking_reservation.start_time is None or parking_reservation.end_time is None:
+        return PARKING_OPEN_MINUTES, PARKING_CLOSE_MINUTES
+    return to_minutes(parking_reservation.start_time), to_minutes(parking_reservation.end_time)
+
+
+def user_parking_query(user_id, day):
+    """Reserva de garagem do usuário no dia."""
+    return select(ParkingReservation).where(ParkingReservation.user_id == user_id, ParkingReservation.reservation_date == day)
+
+
+def room_window_query(user_id, day):
+    """Horários das reservas de sala do usuário no dia."""
+    return select(Reservation.start_time, Reservation.end_time).where(
+        Reservation.user_id == user_id, Reservation.reservation_date == day
+    )
+
+
+def spot_reservations_query(day, spot_id, exclude_id):
+    """Outras reservas da vaga no dia."""
+    return select(ParkingReservation).where(
+        ParkingReservation.reservation_date == day,
+        ParkingReservation.spot_id == spot_id,
+        ParkingReservation.id != exclude_id
+    )
+
+
+def garage_report_query(spot_ids, day):
+    """Reservas de garagem das vagas no dia, com o doutor (e os dados do veículo) no mesmo SELECT."""
+    return (
+        select(ParkingReservation)
+        .join(User, ParkingReservation.user)
+        .options(contains_eager(ParkingReservation.user).undefer_group('vehicle'))
+        .where(ParkingReservation.spot_id.in_(spot_ids), ParkingReservation.reservation_date == day)
+        .order_by(User.nome_completo)
+    )
+
+
+def room_reservation_window(user_id, day):
+    """Janela (início, fim) das reservas de sala do usuário no dia, ou None se ele não tem reserva."""
+    rows = db.session.execute(room_window_query(user_id, day)).all()
+    if not rows:
+        return None
+    return min(to_minutes(start) for start, _ in rows), max(to_minutes(end) for _, end in rows)
+
+
+def _fit_gap(intervals, start, end):
+    """Sobra que a janela deixa na vaga (antes + depois), ou None se ela colide com alguma reserva."""
+    before, after = PARKING_OPEN_MINUTES, PARKING_CLOSE_MINUTES
+    for other_start, other_end in intervals:
+        if other_start < end and other_end > start:
+            return None
+        if other_end <= start:
+            before = max(before, other_end)
+        else:
+            after = min(after, other_start)
+    return (start - before) + (after - end)
+
+
+def best_fit_spot(spot_ids, intervals_by_spot, start, end):
+    """Vaga (na ordem de spot_ids em caso de empate) em que a janela deixa a menor sobra, ou None."""
+    best = None
+    for spot_id in spot_ids:
+        gap = _fit_gap(intervals_by_spot.get(spot_id, []), start, end)
+        if gap is not None and (best is None or gap < best[0]):
+            best = (gap, spot_id)
+    return best[1] if best else None
+
+
+def pack_windows(windows, spot_ids):
+    """
+    Distribui as janelas [(chave, início, fim)] no menor número de vagas.
+    Retorna {chave: spot_id}, ou None se o pico de janelas simultâneas passa do número de vagas.
+    Janelas que já estavam em uma vaga livre tendem a ficar nela (a vaga liberada mais cedo vem primeiro).
+    """
+    free_at = [(PARKING_OPEN_MINUTES, position, spot_id) for position, spot_id in enumerate(spot_ids)]
+    heapq.heapify(free_at)
+    assignment = {}
+    for key, start, end in sorted(windows, key=lambda window: (window[1], window[2])):
+        if not free_at or free_at[0][0] > start:
+            return None
+        _, position, spot_id = heapq.heappop(free_at)
+        assignment[key] = spot_id
+        heapq.heappush(free_at, (end, position, spot_id))
+    return assignment
+
+
+def day_allocations(day, spot_ids=None):
+    """{spot_id: [(início, fim), ...]} das reservas de garagem do dia."""
+    query = select(ParkingReservation).where(ParkingReservation.reservation_date == day)
+    if spot_ids is not None:
+        query = query.where(ParkingReservation.spot_id.in_(spot_ids))
+    intervals = {}
+    for parking_reservation in db.session.scalars(query):
+        intervals.setdefault(parking_reservation.spot_id, []).append(parking_window(parking_reservation))
+    return intervals
+
+
+def allocate_spot(parking_reservation, preferred_spot_id=None):
+    """
+    Escolhe a vaga da reserva de garagem (nova ou com a janela alterada) pela janela dela,
+    redistribuindo as reservas do dia se for preciso. Retorna o spot_id, ou
+    None se não há como acomodar a janela com as vagas ativas.
+    """
+    day = parking_reservation.reservation_date
+    start, end = parking_window(parking_reservation)
+    spot_ids = list(db.session.scalars(select(ParkingSpot.id).where(ParkingSpot.is_active == True).order_by(ParkingSpot.id)))
+    reservations = [
+        other for other in db.session.scalars(select(ParkingReservation).where(ParkingReservation.reservation_date == day))
+        if other is not parking_reservation
+    ]
+    intervals = {}
+    for other in reservations:
+        intervals.setdefault(other.spot_id, []).append(parking_window(other))
+
+    # A vaga pedida tem preferência quando comporta a janela
+    if preferred_spot_id in spot_ids and _fit_gap(intervals.get(preferred_spot_id, []), start, end) is not None:
+        return preferred_spot_id
+    spot_id = best_fit_spot(spot_ids, intervals, start, end)
+    if spot_id is not None:
+        return spot_id
+
+    # Nenhuma vaga comporta a janela como está: redistribui as janelas do dia
+    windows = [(other.id, *parking_window(other)) for other in reservations] + [(None, start, end)]
+    assignment = pack_windows(windows, spot_ids)
+    if assignment is None:
+        return None
+    for other in reservations:
+        other.spot_id = assignment[other.id]
+    return assignment[None]
+
+
+def spot_overlaps(parking_reservation):
+    """Quantas outras reservas da mesma vaga e dia colidem com a janela desta (conferência depois do flush)."""
+    start, end = parking_window(parking_reservation)
+    others = db.session.scalars(spot_reservations_query(
+        parking_reservation.reservation_date, parking_reservation.spot_id, parking_reservation.id
+    ))
+    return sum(1 for other in others if _fit_gap([parking_window(other)], start, end) is None)
+
+
+def widen_parking_window(user_id, day):
+    """
+    Alarga a janela da reserva de garagem do usuário no dia para cobrir as
+    reservas de sala (já gravadas na sessão), realocando a vaga se preciso.
+    Retorna False se a nova janela não cabe em nenhuma vaga: a reserva de
+    garagem fica como estava.
+    """
+    parking_reservation = db.session.scalars(user_parking_query(user_id, day)).first()
+    # Sem garagem no dia, ou reserva antiga de dia inteiro: nada a alargar
+    if parking_reservation is None or parking_reservation.start_time is None or parking_reservation.end_time is None:
+        return True
+    window = room_reservation_window(user_id, day)
+    start, end = parking_window(parking_reservation)
+    new_start, new_end = min(start, window[0]), max(end, window[1])
+    if (new_start, new_end) == (start, end):
+        return True
+
+    previous = (parking_reservation.start_time, parking_reservation.end_time)
+    parking_reservation.start_time, parking_reservation.end_time = minutes_to_time(new_start), minutes_to_time(new_end)
+    spot_id = allocate_spot(parking_reservation, preferred_spot_id=parking_reservation.spot_id)
+    if spot_id is None:
+        parking_reservation.start_time, parking_reservation.end_time = previous
+        return False
+    parking_reservation.spot_id = spot_id
+    db.session.flush()
+    # Mesma conferência do book_parking: outra reserva não pode ter ocupado a vaga na janela nova
+    if spot_overlaps(parking_reservation):
+        raise StaleDataError('A vaga de garagem mudou durante a reserva.')
+    return True
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Conferência dos planos de execução (EXPLAIN QUERY PLAN) das consultas
+quentes de main.py, admin.py, scheduler.py e do comando user_stats.
+
+Cada entrada de HOT_QUERIES monta a consulta pela mesma função que a rota
+(ou o scheduler) chama, para a conferência não divergir do comando real, e
+lista as tabelas que ela precisa acessar por índice. Um "SCAN <tabela>"
+(varredura da tabela ou de um índice inteiro) em uma delas é regressão:
+um índice composto que sumiu ou uma consulta que deixou de usá-lo.
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select
+from app import db
+from app.models.user import UserStats
+from app.services.availability_service import WEEKDAYS, unavailable_intervals_query
+from app.services.block_schedule import blocks_query, block_exceptions_query, duplicate_block_query
+from app.services.equipment_service import full_day_query, reserve_units_update
+from app.services.list_queries import reservations_for_day_query, unpaid_reservations_query
+from app.services.parking_service import user_parking_query, room_window_query, spot_reservations_query, garage_report_query
+from app.services.temp_lock_reaper import expired_locks_query
+from app.services.timeline_service import timeline_query
+from app.services.user_stats import reservations_by_user_query, cancellations_by_user_query
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+
+
+def _today():
+    return date.today()
+
+
+# consulta: (monta o SELECT pela mesma função que a rota chama, tabelas que precisam ser lidas por índice)
+HOT_QUERIES = {
+    'main.room_slots': (
+        lambda: unavailable_intervals_query([1, 2, 3], _today(), _today() + timedelta(days=6)),
+        ('reservation', 'temp_lock'),
+    ),
+    'main.block_schedule': (
+        lambda: blocks_query([1, 2, 3]),
+        ('blocked_time',),
+    ),
+    'main.block_schedule_exceptions': (
+        lambda: block_exceptions_query([1, 2, 3]),
+        ('blocked_time',),
+    ),
+    'main.my_reservations': (
+        lambda: timeline_query(1, _today()).limit(21),
+        ('reservation', 'equipment_reservation', 'parking_reservation'),
+    ),
+    'main.book_parking_user_day': (
+        lambda: user_parking_query(1, _today()),
+        ('parking_reservation',),
+    ),
+    'main.book_parking_room_window': (
+        lambda: room_window_query(1, _today()),
+        ('reservation',),
+    ),
+    'main.book_parking_spot_overlaps': (
+        lambda: spot_reservations_query(_today(), 1, 1),
+        ('parking_reservation',),
+    ),
+    'main.reserve_units_full_day': (
+        lambda: full_day_query(1, _today(), _today() + timedelta(days=6)),
+        ('equipment_day_usage', 'rentable_equipment'),
+    ),
+    'main.reserve_units_update': (
+        lambda: reserve_units_update(1, _today(), _today() + timedelta(days=6)),
+        ('equipment_day_usage', 'rentable_equipment'),
+    ),
+    # user_stats() lê pela chave primária (Session.get)
+    'main.dashboard_user_stats': (
+        lambda: select(UserStats).where(UserStats.user_id == 1),
+        ('user_stats',),
+    ),
+    'main.temp_lock_reaper': (
+        lambda: expired_locks_query(datetime.utcnow()),
+        ('temp_lock',),
+    ),
+    'admin.view_reservations': (
+        lambda: reservations_for_day_query(_today()).statement,
+        ('reservation',),
+    ),
+    'admin.financial_panel': (
+        lambda: unpaid_reservations_query().statement,
+        ('reservation',),
+    ),
+    'admin.block_time_duplicate': (
+        lambda: duplicate_block_query(1, WEEKDAYS[0], time(8, 0), time(12, 0)),
+        ('blocked_time',),
+    ),
+    # Agrupa todas as reservas: varre a tabela por definição, o plano só é listado
+    'cli.user_stats_reservations': (
+        reservations_by_user_query,
+        (),
+    ),
+    'cli.user_stats_cancellations': (
+        cancellations_by_user_query,
+        ('api_log',),
+    ),
+    'scheduler.parking_tomorrow': (
+        lambda: garage_report_query([1, 2], _today() + timedelta(days=1)),
+        ('parking_reservation',),
+    ),
+}
+
+
+def query_plan(statement, connection=None):
+    """Linhas (detail) do EXPLAIN QUERY PLAN do SELECT, com os parâmetros já convertidos pelo dialeto."""
+    connection = connection or db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    processors = compiled._bind_processors
+    params = compiled.construct_params()
+    values = tuple(
+        processors[name](params[name]) if name in processors else params[name]
+        for name in compiled.positiontup
+    )
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', values).all()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans():
+    """[(consulta, plano, tabelas varridas)] de cada consulta de HOT_QUERIES; ok quando a última lista é vazia."""
+    results = []
+    for name, (build, indexed_tables) in HOT_QUERIES.items():
+        plan = query_plan(build())
+        scans = sorted({
+            match.group(1) for match in map(_SCAN.match, plan)
+            if match and match.group(1) in indexed_tables
+        })
+        results.append((name, plan, scans))
+    return results
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Contagem das consultas SQL de cada requisição.
+
+Os eventos before/after_cursor_execute do engine somam, em flask.g, o
+número de comandos e o tempo gasto no banco pela requisição corrente. A
+resposta sai com o cabeçalho Server-Timing (db;dur=...;desc="N consultas"),
+visível na aba de rede do navegador.
+
+O mesmo comando SQL (mesmo texto, parâmetros à parte) repetido
+QUERY_N_PLUS_ONE_THRESHOLD vezes na mesma requisição é registrado no log
+como suspeita de N+1. Uma rota pode declarar o seu orçamento com
+@query_budget(n); com QUERY_BUDGET_STRICT ligado (modo de teste), passar do
+orçamento ou cair na suspeita de N+1 faz a requisição falhar com
+QueryBudgetExceeded.
+
+As consultas que só enchem um cache do processo (retrato das configurações,
+identidade do usuário logado) rodam dentro de cache_fill(): entram no tempo
+do Server-Timing, mas não na contagem nem no orçamento, que assim é o mesmo
+com o cache frio ou quente.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+SERVER_TIMING_METRIC = 'db'
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.cache_fills = 0
+        self._cache_depth = 0
+        self._started = []
+
+    def suspected_n_plus_one(self, threshold):
+        """[(comando, repetições)] dos comandos repetidos pelo menos `threshold` vezes."""
+        return [(statement, count) for statement, count in self.shapes.most_common() if count >= threshold]
+
+
+def query_budget(max_queries):
+    """Declara o máximo de consultas da rota (conferido no modo QUERY_BUDGET_STRICT)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.query_budget = max_queries
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def request_query_stats():
+    """Contagem da requisição corrente (None fora de uma requisição)."""
+    return g.get('query_stats') if has_request_context() else None
+
+
+@contextmanager
+def cache_fill():
+    """Consultas que enchem um cache do processo: fora da contagem e do orçamento da requisição."""
+    stats = request_query_stats()
+    if stats is None:
+        yield
+        return
+    stats._cache_depth += 1
+    try:
+        yield
+    finally:
+        stats._cache_depth -= 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_query_stats()
+    if stats is not None:
+        stats._started.append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_query_stats()
+    if stats is not None and stats._started:
+        stats.duration += time.perf_counter() - stats._started.pop()
+        if stats._cache_depth:
+            stats.cache_fills += 1
+            return
+        stats.count += 1
+        stats.shapes[statement] += 1
+
+
+def _handle_error(context):
+    # O comando falhou: descarta o início registrado em before_cursor_execute
+    stats = request_query_stats()
+    if stats is not None and stats._started:
+        stats._started.pop()
+
+
+def init_query_stats(app):
+    if not app.config.get('QUERY_STATS_ENABLED', True):
+        return
+    from app import db
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = RequestQueryStats()
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        threshold = app.config.get('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+        strict = app.config.get('QUERY_BUDGET_STRICT', False)
+        description = f'{stats.count} consultas' + (f' + {stats.cache_fills} de cache' if stats.cache_fills else '')
+        timing = f'{SERVER_TIMING_METRIC};dur={stats.duration * 1000:.1f};desc="{description}"'
+        response.headers['Server-Timing'] = ', '.join(filter(None, [response.headers.get('Server-Timing'), timing]))
+
+        suspects = stats.suspected_n_plus_one(threshold)
+        for statement, count in suspects:
+            current_app.logger.warning('Possível N+1 em %s: %d execuções de %s', request.endpoint, count, ' '.join(statement.split())[:200])
+        budget = g.get('query_budget')
+        if strict and budget is not None and stats.count > budget:
+            raise QueryBudgetExceeded(f'{request.endpoint}: {stats.count} consultas (orçamento {budget})')
+        if strict and suspects:
+            raise QueryBudgetExceeded(f'{request.endpoint}: possível N+1 ({suspects[0][1]}x {suspects[0][0][:120]})')
+        return response
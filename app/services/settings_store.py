@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Configurações do site (SiteSettings) em memória.
+
+Todas as linhas de site_settings são lidas de uma vez para um retrato
+(snapshot) imutável do processo, já convertidas para o tipo de cada chave.
+As rotas leem do retrato, sem consultas ao banco.
+
+O retrato carrega o número de geração gravado na própria tabela (chave
+settings_generation). Toda alteração feita por update_settings incrementa a
+geração na mesma transação e recarrega o retrato local; os outros processos
+(workers) conferem a geração no máximo a cada SETTINGS_RECHECK_SECONDS e
+recarregam quando ela mudou.
+"""
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models.user import SiteSettings
+from app.services.query_stats import cache_fill
+
+GENERATION_KEY = 'settings_generation'
+DEFAULT_LOGIN_VIDEO_URL = 'https://www.youtube.com/embed/Z0u9_xUv0ms'
+
+
+def _parse_bool(value):
+    return value == 'true'
+
+
+def _format_bool(value):
+    return 'true' if value else 'false'
+
+
+# chave -> (conversão do texto gravado, conversão para gravar, padrão)
+SETTINGS = {
+    'contract_version': (int, str, 1),
+    'contract_text': (str, str, None),
+    'login_video_url': (str, str, DEFAULT_LOGIN_VIDEO_URL),
+    'show_fobs': (_parse_bool, _format_bool, False),
+    'banner_gif_url': (str, str, None),
+    'default_price_2h30': (float, str, 90.0),
+    'default_price_1h15': (float, str, 55.0),
+}
+
+
+class SettingsSnapshot:
+    """Valores já convertidos de uma geração das configurações (não muda depois de criado)."""
+
+    def __init__(self, generation, values):
+        self.generation = generation
+        self.values = values
+
+    def get(self, key, default=None):
+        value = self.values.get(key)
+        if value is not None:
+            return value
+        if default is not None or key not in SETTINGS:
+            return default
+        return SETTINGS[key][2]
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+
+def _parse(key, raw):
+    if raw is None or key not in SETTINGS:
+        return raw
+    try:
+        return SETTINGS[key][0](raw)
+    except (TypeError, ValueError):
+        current_app.logger.warning('Configuração %s com valor inválido: %r', key, raw)
+        return None
+
+
+def _read_generation(connection):
+    raw = connection.execute(select(SiteSettings.value).where(SiteSettings.key == GENERATION_KEY)).scalar()
+    return int(raw) if raw else 0
+
+
+class SettingsStore:
+    def __init__(self, recheck_seconds):
+        self.recheck_seconds = recheck_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _load(self):
+        # Geração e valores lidos na mesma consulta: o retrato nunca mistura duas gerações
+        rows = db.session.execute(select(SiteSettings.key, SiteSettings.value)).all()
+        raw = dict(rows)
+        generation = int(raw.pop(GENERATION_KEY, None) or 0)
+        values = {key: _parse(key, value) for key, value in raw.items()}
+        self._snapshot = SettingsSnapshot(generation, values)
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return self._snapshot
+
+    def snapshot(self):
+        """Retrato atual; recarrega se outro processo gravou uma geração mais nova."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.recheck_seconds:
+            return snapshot
+        with self._lock, cache_fill():
+            if self._snapshot is None:
+                return self._load()
+            if time.monotonic() - self._checked_at >= self.recheck_seconds:
+                if _read_generation(db.session.connection()) != self._snapshot.generation:
+                    return self._load()
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def update(self, **values):
+        """
+        Grava as configurações (None apaga a chave), incrementa a geração e
+        faz o commit. O retrato deste processo é recarregado em seguida.
+        """
+        for key, value in values.items():
+            if value is None:
+                db.session.execute(SiteSettings.__table__.delete().where(SiteSettings.key == key))
+                continue
+            raw = SETTINGS[key][1](value) if key in SETTINGS else str(value)
+            db.session.execute(
+                sqlite_insert(SiteSettings).values(key=key, value=raw)
+                .on_conflict_do_update(index_elements=['key'], set_={'value': raw})
+            )
+        db.session.execute(
+            sqlite_insert(SiteSettings).values(key=GENERATION_KEY, value='0')
+            .on_conflict_do_nothing(index_elements=['key'])
+        )
+        db.session.execute(
+            update(SiteSettings).where(SiteSettings.key == GENERATION_KEY)
+            .values(value=(SiteSettings.value.cast(db.Integer) + 1).cast(db.Text))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+
+def init_settings_store(app):
+    app.extensions['settings_store'] = SettingsStore(app.config.get('SETTINGS_RECHECK_SECONDS', 5))
+
+
+def settings_store():
+    return current_app.extensions['settings_store']
+
+
+def current_settings():
+    """Retrato das configurações do site (sem consulta enquanto a geração não muda)."""
+    return settings_store().snapshot()
+
+
+def get_setting(key, default=None):
+    return current_settings().get(key, default)
+
+
+def update_settings(**values):
+    settings_store().update(**values)
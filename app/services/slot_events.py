@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Barramento de eventos de mudança de horários (SSE / long-poll).
+
+Cada canal é uma sala em uma data. As rotas de escrita enfileiram os eventos
+na sessão do SQLAlchemy e eles só são publicados depois do commit, então um
+assinante nunca vê uma mudança que acabou sendo desfeita. Cada assinante tem
+a sua própria fila: uma conexão ociosa custa apenas uma thread (ou greenlet,
+com um worker gevent) bloqueada em Queue.get, sem varrer canais alheios.
+
+O histórico de cada canal é descartado quando a data já passou ou quando o
+canal fica HISTORY_IDLE_SECONDS sem eventos e sem assinantes; um cliente que
+volte depois disso recebe o estado atual pelo ETag.
+
+O barramento é do processo: com vários workers, cada um entrega os eventos
+das escritas que passaram por ele, e o ETag de /get-rooms-slots continua
+valendo como rede de segurança para os clientes.
+"""
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Eventos recentes guardados por canal para reenvio via Last-Event-ID
+HISTORY_PER_CHANNEL = 200
+# Limite de eventos pendentes por assinante (um cliente travado não segura memória)
+SUBSCRIBER_QUEUE_SIZE = 500
+# Canal sem eventos nem assinantes por este tempo perde o histórico
+HISTORY_IDLE_SECONDS = 3600
+# Intervalo mínimo entre as limpezas do histórico (feitas durante publish)
+HISTORY_PRUNE_INTERVAL = 60
+
+
+class Subscription:
+    """Inscrição de um cliente em um ou mais canais (sala, data)."""
+
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout):
+        """Próximo evento ou None se nada chegar dentro do timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SlotEventBus:
+    """Pub/sub em memória com histórico curto por canal e agendamento de expirações."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._subscribers = {}
+        self._history = {}
+        self._touched = {}
+        self._pruned_at = time.monotonic()
+        self._last_id = 0
+        self._expiries = []
+        self._scheduled = {}
+        self._cancelled = set()
+        self._timer_wakeup = threading.Condition(self._lock)
+        self._timer_thread = None
+        self.published = 0
+
+    @staticmethod
+    def channel(room_id, day):
+        return (int(room_id), day.isoformat() if hasattr(day, 'isoformat') else str(day))
+
+    def subscribe(self, channels, last_event_id=None):
+        """Inscreve nos canais; com last_event_id, reenfileira os eventos perdidos desde ele."""
+        subscription = Subscription(self, [self.channel(*c) for c in channels])
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            if last_event_id is not None:
+                missed = sorted(
+                    (payload for channel in subscription.channels
+                     for payload in self._history.get(channel, ()) if payload['id'] > last_event_id),
+                    key=lambda payload: payload['id']
+                )
+                for payload in missed:
+                    subscription.push(payload)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+    def events_since(self, channels, since_id):
+        """Eventos do histórico posteriores a since_id (usado pelo long-poll)."""
+        channels = [self.channel(*c) for c in channels]
+        with self._lock:
+            return sorted(
+                (payload for channel in channels
+                 for payload in self._history.get(channel, ()) if payload['id'] > since_id),
+                key=lambda payload: payload['id']
+            )
+
+    def last_id(self):
+        with self._lock:
+            return self._last_id
+
+    def publish(self, event_type, room_id, day, start=None, end=None, **extra):
+        """Publica uma mudança de status no canal da sala/dia."""
+        channel = self.channel(room_id, day)
+        with self._lock:
+            payload = dict(extra, id=next(self._seq), type=event_type, room_id=channel[0], date=channel[1],
+                           start=start, end=end)
+            history = self._history.get(channel)
+            if history is None:
+                history = self._history[channel] = deque(maxlen=HISTORY_PER_CHANNEL)
+            history.append(payload)
+            self._touched[channel] = time.monotonic()
+            self._last_id = payload['id']
+            subscribers = list(self._subscribers.get(channel, ()))
+            self.published += 1
+            if self._touched[channel] - self._pruned_at >= HISTORY_PRUNE_INTERVAL:
+                self._prune_history()
+        for subscription in subscribers:
+            subscription.push(payload)
+        return payload
+
+    def _prune_history(self, now=None):
+        # Chamado com o lock: descarta canais de datas passadas e canais ociosos sem assinantes
+        now = now or time.monotonic()
+        today = date.today().isoformat()
+        for channel in list(self._history):
+            idle = now - self._touched.get(channel, 0) >= HISTORY_IDLE_SECONDS
+            if channel[1] < today or (idle and channel not in self._subscribers):
+                del self._history[channel]
+                self._touched.pop(channel, None)
+        self._pruned_at = now
+
+    def channel_count(self):
+        with self._lock:
+            return len(self._history)
+
+    # --- Expiração de bloqueios temporários ---
+    def schedule_expiry(self, lock_id, room_id, day, start, end, expires_at):
+        """Agenda a publicação de um evento 'expired' quando o bloqueio temporário vencer."""
+        with self._lock:
+            heapq.heappush(self._expiries, (expires_at, lock_id, room_id, day, start, end))
+            self._scheduled[lock_id] = self._scheduled.get(lock_id, 0) + 1
+            self._cancelled.discard(lock_id)
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timer, name='slot-expiry-timer', daemon=True)
+                self._timer_thread.start()
+            self._timer_wakeup.notify()
+
+    def cancel_expiry(self, lock_id):
+        # Só marca bloqueios que ainda têm expiração agendada: o conjunto não cresce além da fila
+        with self._lock:
+            if lock_id in self._scheduled:
+                self._cancelled.add(lock_id)
+
+    def _run_timer(self):
+        # Uma única thread para todas as expirações, dormindo até a próxima que vence
+        while True:
+            with self._lock:
+                while not self._expiries:
+                    self._timer_wakeup.wait()
+                expires_at, lock_id, room_id, day, start, end = self._expiries[0]
+                delay = (expires_at - datetime.utcnow()).total_seconds()
+                if delay > 0:
+                    self._timer_wakeup.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._expiries)
+                self._scheduled[lock_id] -= 1
+                if not self._scheduled[lock_id]:
+                    del self._scheduled[lock_id]
+                if lock_id in self._cancelled:
+                    if lock_id not in self._scheduled:
+                        self._cancelled.discard(lock_id)
+                    continue
+            self.publish('expired', room_id, day, start, end, lock_id=lock_id)
+
+
+bus = SlotEventBus()
+
+
+# --- Integração com a sessão: publica só depois do commit ---
+def queue_event(session, event_type, room_id, day, start=None, end=None, **extra):
+    """Enfileira um evento para ser publicado quando a transação da sessão for confirmada."""
+    session.info.setdefault('slot_events', []).append((event_type, room_id, day, start, end, extra))
+
+
+def queue_expiry(session, lock):
+    session.info.setdefault('slot_expiries', []).append(
+        (lock.id, lock.room_id, lock.date, lock.start_time.isoformat(), lock.end_time.isoformat(), lock.expires_at)
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    for event_type, room_id, day, start, end, extra in session.info.pop('slot_events', []):
+        if event_type == 'released':
+            bus.cancel_expiry(extra.get('lock_id'))
+        bus.publish(event_type, room_id, day, start, end, **extra)
+    for lock_id, room_id, day, start, end, expires_at in session.info.pop('slot_expiries', []):
+        bus.schedule_expiry(lock_id, room_id, day, start, end, expires_at)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('slot_events', None)
+    session.info.pop('slot_expiries', None)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Diário das consultas SQL lentas.
+
+Todo comando que passa de SLOW_QUERY_THRESHOLD_MS entra em um buffer
+circular (SLOW_QUERY_JOURNAL_SIZE entradas; as mais antigas saem primeiro)
+com o formato do comando, os tipos dos parâmetros, a duração, a rota e o
+EXPLAIN QUERY PLAN. Os valores dos parâmetros não são guardados.
+
+O formato (fingerprint) é o texto do comando com os espaços normalizados e
+as listas de IN expandidas reduzidas a "(?...)", para que a mesma consulta
+com 3 ou 30 salas caia no mesmo grupo. O plano é capturado na conexão do
+próprio comando (direto no driver, fora dos eventos do SQLAlchemy) no
+máximo uma vez a cada PLAN_REFRESH_SECONDS por formato.
+
+O diário é do processo: com vários workers, cada um tem o seu.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from sqlalchemy import event
+
+PLAN_REFRESH_SECONDS = 300
+OUTSIDE_REQUEST = '(fora de requisição)'
+
+_EXPANDED_IN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+
+def statement_shape(statement):
+    return _EXPANDED_IN.sub('(?...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def fingerprint(shape):
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+def parameter_types(parameters):
+    if isinstance(parameters, dict):
+        return tuple(f'{name}:{type(value).__name__}' for name, value in parameters.items())
+    return tuple(type(value).__name__ for value in parameters or ())
+
+
+def percentile(sorted_values, fraction):
+    """Percentil pelo posto mais próximo de uma lista já ordenada."""
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class SlowQueryJournal:
+    def __init__(self, threshold_ms=100, size=500):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=size)
+        self._plans = {}
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def configure(self, threshold_ms, size):
+        with self._lock:
+            self.threshold_ms = threshold_ms
+            self._entries = deque(self._entries, maxlen=size)
+
+    def needs_plan(self, key, now=None):
+        captured = self._plans.get(key)
+        return captured is None or captured[0] + PLAN_REFRESH_SECONDS < (now or time.monotonic())
+
+    def record(self, shape, types, duration_ms, route, plan=None, executemany=False):
+        key = fingerprint(shape)
+        with self._lock:
+            if plan is not None:
+                self._plans[key] = (time.monotonic(), plan)
+            self._entries.append({
+                'fingerprint': key, 'statement': shape, 'parameter_types': types, 'duration_ms': duration_ms,
+                'route': route, 'executemany': executemany, 'at': datetime.utcnow(),
+            })
+            self.recorded += 1
+            if len(self._plans) > self._entries.maxlen:
+                live = {entry['fingerprint'] for entry in self._entries}
+                self._plans = {k: v for k, v in self._plans.items() if k in live}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def summary(self):
+        """Entradas agrupadas por fingerprint, da maior p95 para a menor."""
+        groups = {}
+        for entry in self.entries():
+            groups.setdefault(entry['fingerprint'], []).append(entry)
+        rows = []
+        for key, entries in groups.items():
+            durations = sorted(entry['duration_ms'] for entry in entries)
+            last = entries[-1]
+            plan = self._plans.get(key)
+            rows.append({
+                'fingerprint': key,
+                'statement': last['statement'],
+                'count': len(entries),
+                'p50_ms': percentile(durations, 0.50),
+                'p95_ms': percentile(durations, 0.95),
+                'max_ms': durations[-1],
+                'routes': sorted({entry['route'] for entry in entries}),
+                'parameter_types': last['parameter_types'],
+                'last_seen': last['at'],
+                'plan': plan[1] if plan else None,
+            })
+        rows.sort(key=lambda row: (row['p95_ms'], row['max_ms']), reverse=True)
+        return rows
+
+
+slow_query_journal = SlowQueryJournal()
+
+
+def _explain(conn, statement, parameters):
+    """Linhas do EXPLAIN QUERY PLAN, executado direto no driver (sem disparar os eventos do engine)."""
+    if conn.dialect.name != 'sqlite' or not _EXPLAINABLE.match(statement):
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'(plano indisponível: {e})']
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('slow_query_started')
+    if not started:
+        return
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+    if duration_ms < slow_query_journal.threshold_ms:
+        return
+    shape = statement_shape(statement)
+    plan = None
+    if not executemany and slow_query_journal.needs_plan(fingerprint(shape)):
+        plan = _explain(conn, statement, parameters)
+    route = (request.endpoint or request.path) if has_request_context() else OUTSIDE_REQUEST
+    types = parameter_types(parameters[0] if executemany and parameters else parameters)
+    slow_query_journal.record(shape, types, round(duration_ms, 2), route, plan, executemany)
+
+
+def _handle_error(context):
+    # O comando falhou: descarta o início registrado em before_cursor_execute
+    started = context.connection.info.get('slow_query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def init_slow_query_journal(app):
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 100)
+    if threshold_ms <= 0:
+        return
+    from app import db
+
+    slow_query_journal.configure(threshold_ms, app.config.get('SLOW_QUERY_JOURNAL_SIZE', 500))
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
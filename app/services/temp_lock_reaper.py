@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Limpeza dos bloqueios temporários (TempLock) vencidos.
+
+Os bloqueios expiram em 5 minutos, mas só eram apagados quando o cliente
+chamava /release-temp-lock. O reaper apaga os vencidos em lotes limitados
+(um commit por lote, para não segurar a trava de escrita do SQLite) e roda
+periodicamente em uma thread do processo que atende os bloqueios. As
+grades materializadas já ignoram entradas vencidas, então apagar a linha de
+origem não exige tocar nas grades.
+"""
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from app import db
+from app.models.user import TempLock
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL_SECONDS = 60
+
+# Contadores de rotatividade dos bloqueios (por processo)
+_stats_lock = threading.Lock()
+_stats = {
+    'created': 0,
+    'released': 0,
+    'reaped': 0,
+    'sweeps': 0,
+    'last_sweep_at': None,
+    'last_sweep_ms': None,
+    'last_sweep_deleted': 0,
+}
+_reaper_thread = None
+
+
+def count_event(name, amount=1):
+    """Incrementa um contador de rotatividade ('created', 'released', ...)."""
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def expired_locks_query(now, batch_size=DEFAULT_BATCH_SIZE):
+    """Ids de um lote de bloqueios vencidos."""
+    return select(TempLock.id).where(TempLock.expires_at <= now).limit(batch_size)
+
+
+def reap_expired_locks(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, now=None):
+    """Apaga os bloqueios vencidos em lotes de até batch_size linhas. Retorna o total apagado."""
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        expired_ids = expired_locks_query(now, batch_size).scalar_subquery()
+        result = db.session.execute(
+            delete(TempLock).where(TempLock.id.in_(expired_ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += result.rowcount
+        batches += 1
+        if result.rowcount < batch_size:
+            break
+    with _stats_lock:
+        _stats['reaped'] += deleted
+        _stats['sweeps'] += 1
+        _stats['last_sweep_at'] = now.isoformat()
+        _stats['last_sweep_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        _stats['last_sweep_deleted'] = deleted
+    return deleted
+
+
+def lock_metrics(now=None):
+    """Contadores do processo mais o retrato atual da tabela (vivos x vencidos aguardando limpeza)."""
+    now = now or datetime.utcnow()
+    live, expired = db.session.execute(
+        select(
+            func.count().filter(TempLock.expires_at > now),
+            func.count().filter(TempLock.expires_at <= now)
+        )
+    ).one()
+    with _stats_lock:
+        stats = dict(_stats)
+    return dict(stats, live=live, expired_pending=expired, reaper_running=_reaper_thread is not None)
+
+
+def _run(app, interval, batch_size):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                reap_expired_locks(batch_size)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning(f'Falha na limpeza de bloqueios temporários: {e}')
+            finally:
+                db.session.remove()
+
+
+def ensure_reaper(app):
+    """Inicia (uma vez por processo) a thread que limpa os bloqueios vencidos periodicamente."""
+    global _reaper_thread
+    interval = app.config.get('TEMP_LOCK_REAPER_INTERVAL', DEFAULT_INTERVAL_SECONDS)
+    if _reaper_thread is not None or not interval:
+        return
+    with _stats_lock:
+        if _reaper_thread is not None:
+            return
+        batch_size = app.config.get('TEMP_LOCK_REAPER_BATCH', DEFAULT_BATCH_SIZE)
+        _reaper_thread = threading.Thread(target=_run, args=(app, interval, batch_size),
+                                          name='temp-lock-reaper', daemon=True)
+        _reaper_thread.start()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Linha do tempo das reservas do usuário (salas, equipamentos e garagem).
+
+As três tabelas entram em uma única consulta UNION ALL, já com o nome da
+sala/equipamento/vaga (join), ordenada por (dia, início, tipo, id). As
+páginas seguintes usam paginação por chave (keyset): o cursor é a chave do
+último item mostrado, então cada página custa uma única consulta,
+independentemente do tamanho do histórico.
+"""
+import base64
+from datetime import date
+from sqlalchemy import func, literal, select, tuple_, union_all
+from app import db
+from app.models.user import Room, Reservation, ParkingSpot, ParkingReservation
+from app.models.equipment import RentableEquipment, EquipmentReservation
+from app.services.parking_service import PARKING_OPEN_MINUTES, PARKING_CLOSE_MINUTES, minutes_to_time
+
+TIMELINE_PAGE_SIZE = 20
+
+_FULL_DAY_START = minutes_to_time(PARKING_OPEN_MINUTES).strftime('%H:%M:%S')
+_FULL_DAY_END = minutes_to_time(PARKING_CLOSE_MINUTES).strftime('%H:%M:%S')
+
+
+def _timeline(user_id):
+    # time() normaliza 'AAAA-MM-DD HH:MM:SS' e 'HH:MM:SS' para a mesma forma, ordenável como texto
+    rooms = (
+        select(
+            literal('room').label('kind'), Reservation.id.label('id'),
+            Reservation.reservation_date.label('day'), Reservation.reservation_date.label('last_day'),
+            func.time(Reservation.start_time).label('start'), func.time(Reservation.end_time).label('end'),
+            Room.name.label('name'), Reservation.total_price.label('price'), Reservation.is_paid.label('is_paid')
+        )
+        .join(Room, Room.id == Reservation.room_id)
+        .where(Reservation.user_id == user_id)
+    )
+    equipments = (
+        select(
+            literal('equipment'), EquipmentReservation.id,
+            EquipmentReservation.reservation_date,
+            func.coalesce(EquipmentReservation.end_date, EquipmentReservation.reservation_date),
+            literal('00:00:00'), literal(None),
+            RentableEquipment.name, EquipmentReservation.price, EquipmentReservation.is_paid
+        )
+        .join(RentableEquipment, RentableEquipment.id == EquipmentReservation.equipment_id)
+        .where(EquipmentReservation.user_id == user_id)
+    )
+    parking = (
+        select(
+            literal('parking'), ParkingReservation.id,
+            ParkingReservation.reservation_date, ParkingReservation.reservation_date,
+            func.coalesce(func.time(ParkingReservation.start_time), _FULL_DAY_START),
+            func.coalesce(func.time(ParkingReservation.end_time), _FULL_DAY_END),
+            ParkingSpot.name, literal(None), literal(None)
+        )
+        .join(ParkingSpot, ParkingSpot.id == ParkingReservation.spot_id)
+        .where(ParkingReservation.user_id == user_id)
+    )
+    return union_all(rooms, equipments, parking).subquery('timeline')
+
+
+def encode_cursor(item):
+    raw = f"{item['day']}|{item['start']}|{item['kind']}|{item['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Chave (dia, início, tipo, id) de um cursor; ValueError se ele é inválido."""
+    try:
+        day, start, kind, item_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return date.fromisoformat(day), start, kind, int(item_id)
+    except Exception as e:
+        raise ValueError('cursor inválido') from e
+
+
+def timeline_query(user_id, today, section='upcoming', cursor=None):
+    """Consulta da seção ('upcoming' ou 'past') a partir do cursor, sem o LIMIT."""
+    timeline = _timeline(user_id)
+    key = tuple_(timeline.c.day, timeline.c.start, timeline.c.kind, timeline.c.id)
+    query = select(timeline)
+    if section == 'past':
+        query = query.where(timeline.c.last_day < today).order_by(
+            timeline.c.day.desc(), timeline.c.start.desc(), timeline.c.kind.desc(), timeline.c.id.desc()
+        )
+        if cursor:
+            query = query.where(key < tuple_(*decode_cursor(cursor)))
+    else:
+        query = query.where(timeline.c.last_day >= today).order_by(
+            timeline.c.day, timeline.c.start, timeline.c.kind, timeline.c.id
+        )
+        if cursor:
+            query = query.where(key > tuple_(*decode_cursor(cursor)))
+    return query
+
+
+def timeline_page(user_id, today, section='upcoming', cursor=None, limit=TIMELINE_PAGE_SIZE):
+    """
+    Uma página da linha do tempo: 'upcoming' (ainda não terminadas, em ordem
+    crescente) ou 'past' (já terminadas, da mais recente para a mais antiga).
+    Retorna (itens, cursor_da_próxima_página ou None).
+    """
+    query = timeline_query(user_id, today, section, cursor)
+    rows = [dict(row._mapping) for row in db.session.execute(query.limit(limit + 1))]
+    items = rows[:limit]
+    return items, (encode_cursor(items[-1]) if len(rows) > limit else None)
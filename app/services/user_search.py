@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Busca de usuários no painel do admin (índice FTS5 do SQLite).
+
+A tabela virtual user_search (rowid = user.id) guarda nome, e-mail, CRO,
+CPF, WhatsApp e placa de cada usuário, tokenizados pelo unicode61 sem
+acentos: "joao" encontra "João". Os campos numéricos entram também só com
+os dígitos, para que "12345678900" e "123.456" encontrem o mesmo CPF. Cada
+termo digitado vira uma busca por prefixo (índice de prefixos de 2 e 3
+letras), o que deixa o autocompletar rápido.
+
+O índice é mantido pelos eventos de mapper de User (inserção, alteração e
+exclusão), na mesma transação da escrita. Os resultados saem em ordem de
+nome e são paginados por chave (nome, id).
+"""
+import base64
+import re
+from sqlalchemy import event, inspect, select, text, tuple_
+from sqlalchemy.orm import load_only
+from app import db
+from app.models.user import User
+from app.services.list_queries import USER_LIST_COLUMNS
+
+SEARCH_PAGE_SIZE = 15
+INDEXED_FIELDS = ('nome_completo', 'email', 'cro', 'uf_cro', 'cpf', 'whatsapp', 'veiculo_placa')
+TYPEAHEAD_LIMIT = 10
+
+_CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+    "nome, email, cro, cpf, whatsapp, placa, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_NON_DIGIT = re.compile(r'\D')
+
+# Bancos já conferidos neste processo (a tabela é criada e preenchida se não existir)
+_ready_engines = set()
+
+
+def _digits_variant(value):
+    # '123.456.789-00' -> '123.456.789-00 12345678900' (o texto original e só os dígitos)
+    value = value or ''
+    digits = _NON_DIGIT.sub('', value)
+    return f'{value} {digits}' if digits and digits != value else value
+
+
+def _document(user):
+    placa = user.veiculo_placa or ''
+    return {
+        'rowid': user.id,
+        'nome': user.nome_completo or '',
+        'email': user.email or '',
+        'cro': f'{_digits_variant(user.cro)} {user.uf_cro or ""}'.strip(),
+        'cpf': _digits_variant(user.cpf),
+        'whatsapp': _digits_variant(user.whatsapp),
+        'placa': f"{placa} {re.sub(r'[^0-9A-Za-z]', '', placa)}".strip(),
+    }
+
+
+def _write_document(connection, user):
+    connection.execute(text("DELETE FROM user_search WHERE rowid = :rowid"), {'rowid': user.id})
+    connection.execute(
+        text("INSERT INTO user_search (rowid, nome, email, cro, cpf, whatsapp, placa) "
+             "VALUES (:rowid, :nome, :email, :cro, :cpf, :whatsapp, :placa)"),
+        _document(user)
+    )
+
+
+def rebuild_search_index(connection=None):
+    """Recria o índice de busca a partir da tabela user. Retorna o número de usuários indexados."""
+    connection = connection or db.session.connection()
+    connection.execute(text(_CREATE_INDEX))
+    connection.execute(text("DELETE FROM user_search"))
+    users = connection.execute(select(User.__table__)).all()
+    for user in users:
+        _write_document(connection, user)
+    return len(users)
+
+
+def ensure_search_index(connection):
+    """Cria e preenche o índice na primeira vez que este processo o usa em um banco sem ele."""
+    key = str(connection.engine.url)
+    if key in _ready_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+    ).first()
+    if not exists:
+        rebuild_search_index(connection)
+    _ready_engines.add(key)
+
+
+@event.listens_for(User, 'after_insert')
+def _index_new_user(mapper, connection, user):
+    ensure_search_index(connection)
+    _write_document(connection, user)
+
+
+@event.listens_for(User, 'after_update')
+def _reindex_user(mapper, connection, user):
+    # Só reescreve o documento quando um campo indexado mudou (last_seen etc. não contam)
+    state = inspect(user)
+    if any(state.attrs[name].history.has_changes() for name in INDEXED_FIELDS):
+        ensure_search_index(connection)
+        # Lê a linha já alterada: colunas adiadas (cpf, placa...) podem não estar carregadas no objeto
+        _write_document(connection, connection.execute(select(User.__table__).where(User.id == user.id)).one())
+
+
+@event.listens_for(User, 'after_delete')
+def _unindex_user(mapper, connection, user):
+    ensure_search_index(connection)
+    connection.execute(text("DELETE FROM user_search WHERE rowid = :rowid"), {'rowid': user.id})
+
+
+def match_expression(query):
+    """
+    Expressão MATCH do FTS5 para o texto digitado: todos os termos, cada um
+    como prefixo ("jo sil" -> "jo"* AND "sil"*). None se não há termo.
+    """
+    terms = _TOKEN.findall(query or '')
+    if len(terms) > 1 and all(term.isdigit() for term in terms):
+        # CPF/telefone digitado com pontuação: busca pela forma só com dígitos
+        terms = [''.join(terms)]
+    if not terms:
+        return None
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(user):
+    raw = f'{user.nome_completo}\x1f{user.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        name, user_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('\x1f', 1)
+        return name, int(user_id)
+    except Exception as e:
+        raise ValueError('cursor inválido') from e
+
+
+def search_users(query=None, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Usuários que casam com a busca (todos, sem busca), em ordem de nome, a
+    partir do cursor. Retorna (usuários, cursor_da_próxima_página ou None).
+    """
+    statement = select(User).options(load_only(*USER_LIST_COLUMNS)).order_by(User.nome_completo, User.id)
+    expression = match_expression(query)
+    if expression:
+        ensure_search_index(db.session.connection())
+        matches = select(text('rowid')).select_from(text('user_search')).where(text('user_search MATCH :match'))
+        statement = statement.where(User.id.in_(matches)).params(match=expression)
+    elif query and query.strip():
+        return [], None
+    if cursor:
+        statement = statement.where(tuple_(User.nome_completo, User.id) > tuple_(*decode_cursor(cursor)))
+    users = db.session.execute(statement.limit(limit + 1)).scalars().all()
+    page = users[:limit]
+    return page, (encode_cursor(page[-1]) if len(users) > limit else None)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas do painel do usuário (reservas, reservas pagas, cancelamentos e
+total gasto) mantidas em uma linha de user_stats por usuário.
+
+As rotas que reservam, marcam como paga ou cancelam somam o incremento na
+mesma transação da alteração, com um UPSERT: o painel lê uma única linha
+pela chave primária em vez de contar reservas e o log de auditoria a cada
+acesso. check_user_stats recalcula tudo a partir do histórico (reservas e
+eventos de cancelamento do ApiLog) para conferir e corrigir os contadores.
+"""
+import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models.user import User, Reservation, ApiLog, UserStats
+
+CANCELLATION_EVENT = 'Cancelamento de Reserva'
+COUNTERS = ('reservations', 'paid_reservations', 'cancellations', 'lifetime_spend')
+
+
+def bump_stats(user_id, **deltas):
+    """Soma os incrementos (reservations=1, lifetime_spend=90.0, ...) à linha do usuário, na transação corrente."""
+    values = {name: deltas.get(name, 0) for name in COUNTERS}
+    now = datetime.datetime.utcnow()
+    db.session.execute(
+        sqlite_insert(UserStats)
+        .values(user_id=user_id, updated_at=now, **values)
+        .on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={**{name: getattr(UserStats, name) + delta for name, delta in deltas.items()}, 'updated_at': now}
+        )
+    )
+
+
+def record_booking(user_id, reservations):
+    bump_stats(user_id, reservations=len(reservations))
+
+
+def record_payment(reservation):
+    bump_stats(reservation.user_id, paid_reservations=1, lifetime_spend=reservation.total_price or 0)
+
+
+def forget_reservations(reservations):
+    """Desfaz os incrementos de reservas apagadas sem cancelamento (limpeza de testes), na transação corrente."""
+    deltas = {}
+    for reservation in reservations:
+        user_deltas = deltas.setdefault(reservation.user_id, {name: 0 for name in COUNTERS})
+        user_deltas['reservations'] -= 1
+        if reservation.is_paid:
+            user_deltas['paid_reservations'] -= 1
+            user_deltas['lifetime_spend'] -= reservation.total_price or 0
+    for user_id, user_deltas in deltas.items():
+        bump_stats(user_id, **user_deltas)
+
+
+def record_cancellation(user_id):
+    """Para a rota de cancelamento chamar na transação que remove a reserva (junto do log_event CANCELLATION_EVENT)."""
+    bump_stats(user_id, cancellations=1)
+
+
+def user_stats(user_id):
+    """Linha de métricas do usuário (uma leitura pela chave primária); zerada se ele ainda não tem nenhuma."""
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id, **{name: 0 for name in COUNTERS})
+    return stats
+
+
+def reservations_by_user_query():
+    """Reservas, reservas pagas e gasto total de cada usuário, calculados das reservas."""
+    return select(
+        Reservation.user_id, func.count(),
+        func.coalesce(func.sum(Reservation.is_paid == True), 0),
+        func.coalesce(func.sum(func.iif(Reservation.is_paid == True, Reservation.total_price, 0)), 0)
+    ).group_by(Reservation.user_id)
+
+
+def cancellations_by_user_query():
+    """Cancelamentos de cada usuário, contados no log de auditoria."""
+    return (
+        select(ApiLog.user_id, func.count())
+        .where(ApiLog.event_type == CANCELLATION_EVENT, ApiLog.user_id.is_not(None))
+        .group_by(ApiLog.user_id)
+    )
+
+
+def _history():
+    # Métricas recalculadas a partir das reservas e do log de auditoria
+    counted = {}
+    for user_id, total, paid, spend in db.session.execute(reservations_by_user_query()):
+        counted[user_id] = {'reservations': total, 'paid_reservations': paid, 'cancellations': 0, 'lifetime_spend': float(spend)}
+    for user_id, cancellations in db.session.execute(cancellations_by_user_query()):
+        counted.setdefault(user_id, {name: 0 for name in COUNTERS})['cancellations'] = cancellations
+    return counted
+
+
+def check_user_stats(rebuild=False):
+    """
+    Compara as linhas de user_stats com o histórico e retorna as divergências
+    [(user_id, métrica, gravado, calculado)]. Com rebuild=True, regrava as
+    linhas divergentes a partir do histórico.
+    """
+    counted = _history()
+    user_ids = db.session.scalars(select(User.id)).all()
+    stored = {stats.user_id: stats for stats in db.session.scalars(select(UserStats))}
+    zero = {name: 0 for name in COUNTERS}
+    mismatches, stale = [], []
+    for user_id in user_ids:
+        expected = counted.get(user_id, zero)
+        row = stored.get(user_id)
+        # Usuário sem linha vale zero em tudo (a linha nasce na primeira reserva)
+        diffs = [
+            (user_id, name, getattr(row, name) if row else 0, expected[name])
+            for name in COUNTERS
+            if abs((getattr(row, name) if row else 0) - expected[name]) > 0.005
+        ]
+        if diffs:
+            mismatches.extend(diffs)
+            stale.append(user_id)
+    if rebuild and stale:
+        now = datetime.datetime.utcnow()
+        for user_id in stale:
+            values = counted.get(user_id, zero)
+            db.session.execute(
+                sqlite_insert(UserStats)
+                .values(user_id=user_id, updated_at=now, **values)
+                .on_conflict_do_update(index_elements=['user_id'], set_={**values, 'updated_at': now})
+            )
+        db.session.commit()
+    return mismatches
@@ -2,20 +2,31 @@ import os
 import requests
 import json
 from datetime import datetime
+from flask import current_app
 from app import db
 from app.models.user import ApiLog
 
 def log_event(event_type, status, details, user_id=None, ip_address=None):
-    """Função central para criar entradas no Templog."""
+    """
+    Função central para criar entradas no Templog.
+    Com o gravador assíncrono (AUDIT_LOG_MODE='async') o evento só entra na fila
+    e é gravado em lote fora da requisição; sem ele, grava e faz commit na hora.
+    """
+    row = dict(
+        timestamp=datetime.utcnow(),
+        event_type=event_type,
+        status=status,
+        details=json.dumps(details, ensure_ascii=False),
+        user_id=user_id,
+        ip_address=ip_address
+    )
+    writer = current_app.extensions.get('audit_writer')
+    if writer is not None:
+        if not writer.enqueue(row):
+            print(f"LOG DESCARTADO (fila cheia): {event_type}")
+        return
     try:
-        log_entry = ApiLog(
-            event_type=event_type,
-            status=status,
-            details=json.dumps(details, ensure_ascii=False),
-            user_id=user_id,
-            ip_address=ip_address
-        )
-        db.session.add(log_entry)
+        db.session.add(ApiLog(**row))
         db.session.commit()
     except Exception as e:
         print(f"ERRO AO SALVAR LOG: {e}")
@@ -19,3 +19,45 @@ class Config:
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    
+    # --- LIMPEZA DOS BLOQUEIOS TEMPORÁRIOS VENCIDOS ---
+    # Intervalo em segundos da thread de limpeza (0 desliga)
+    TEMP_LOCK_REAPER_INTERVAL = int(os.environ.get('TEMP_LOCK_REAPER_INTERVAL', 60))
+    TEMP_LOCK_REAPER_BATCH = 500
+    
+    # --- ARMAZENAMENTO DOS BLOQUEIOS TEMPORÁRIOS (HOLDS) ---
+    # 'sql' (TempLock no app.db), 'memory' (um único processo) ou 'redis' (requer o pacote redis)
+    HOLD_STORE = os.environ.get('HOLD_STORE', 'sql')
+    HOLD_STORE_URL = os.environ.get('HOLD_STORE_URL', 'redis://localhost:6379/0')
+    
+    # --- LOG DE AUDITORIA (ApiLog) ---
+    # 'async' (fila gravada em lote por uma thread) ou 'sync' (commit a cada evento)
+    AUDIT_LOG_MODE = os.environ.get('AUDIT_LOG_MODE', 'async')
+    AUDIT_FLUSH_INTERVAL_MS = 200
+    AUDIT_BATCH_SIZE = 100
+    AUDIT_QUEUE_SIZE = 10000
+    
+    # --- IDEMPOTÊNCIA DOS POSTS DE RESERVA ---
+    # Por quanto tempo a resposta de uma Idempotency-Key é guardada para retentativas
+    IDEMPOTENCY_KEY_TTL_HOURS = 24
+    
+    # --- CONFIGURAÇÕES DO SITE EM MEMÓRIA (SiteSettings) ---
+    # Intervalo em segundos entre as conferências da geração gravada por outros workers
+    SETTINGS_RECHECK_SECONDS = int(os.environ.get('SETTINGS_RECHECK_SECONDS', 5))
+    
+    # --- CACHE DO USUÁRIO LOGADO (user_loader) ---
+    # Segundos que a identidade fica em cache em cada worker (0 desliga)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+    
+    # --- CONTAGEM DE CONSULTAS POR REQUISIÇÃO (Server-Timing) ---
+    QUERY_STATS_ENABLED = True
+    # Execuções do mesmo comando na mesma requisição a partir das quais ele é registrado como possível N+1
+    QUERY_N_PLUS_ONE_THRESHOLD = 5
+    # Modo de teste: a requisição falha se passar do @query_budget da rota ou cair na suspeita de N+1
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+    
+    # --- DIÁRIO DAS CONSULTAS LENTAS (admin) ---
+    # Duração em milissegundos a partir da qual o comando entra no diário (0 desliga)
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    # Entradas guardadas por worker; as mais antigas são descartadas
+    SLOW_QUERY_JOURNAL_SIZE = 500
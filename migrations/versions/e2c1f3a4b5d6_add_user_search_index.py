@@ -0,0 +1,43 @@
+"""Add user search index
+
+Revision ID: e2c1f3a4b5d6
+Revises: d1b0e2f3a4c5
+Create Date: 2026-10-18 15:02:44.613208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c1f3a4b5d6'
+down_revision = 'd1b0e2f3a4c5'
+branch_labels = None
+depends_on = None
+
+
+def _with_digits(column):
+    # Mesmo documento de app/services/user_search.py: o texto original e só os dígitos
+    digits = column
+    for char in ('.', '-', '/', '(', ')', ' ', '+'):
+        digits = f"replace({digits}, '{char}', '')"
+    return f"coalesce({column}, '') || ' ' || coalesce({digits}, '')"
+
+
+def upgrade():
+    # Tabela virtual FTS5 (sem modelo; excluída do autogenerate em migrations/env.py)
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+        "nome, email, cro, cpf, whatsapp, placa, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    op.execute(
+        "INSERT INTO user_search (rowid, nome, email, cro, cpf, whatsapp, placa) "
+        f"SELECT id, coalesce(nome_completo, ''), coalesce(email, ''), "
+        f"{_with_digits('cro')} || ' ' || coalesce(uf_cro, ''), {_with_digits('cpf')}, "
+        f"{_with_digits('whatsapp')}, {_with_digits('veiculo_placa')} FROM user"
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS user_search")
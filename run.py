@@ -1,7 +1,9 @@
 import os
+import click
 from app import create_app, db
 from app.models.user import User, Room, Reservation, SiteSettings, Tutorial, ApiLog, UserTutorialPreference, TempLock, ParkingSpot, ParkingReservation
 from app.models.equipment import RentableEquipment, EquipmentReservation
+from app.models.availability import RoomDayGrid
 
 app = create_app()
 
@@ -18,7 +20,8 @@ def make_shell_context():
         'UserTutorialPreference': UserTutorialPreference,
         'TempLock': TempLock,
         'ParkingSpot': ParkingSpot,
-        'ParkingReservation': ParkingReservation
+        'ParkingReservation': ParkingReservation,
+        'RoomDayGrid': RoomDayGrid
     }
 
 @app.cli.command('seed_db')
@@ -51,3 +54,345 @@ def seed_db_command():
 
     db.session.commit()
     print('Banco de dados populado com salas, configurações, tutoriais e vagas de garagem de exemplo!')
+
+@app.cli.command('bench_availability')
+@click.option('--repeat', default=20, help='Repetições por cenário.')
+def bench_availability_command(repeat):
+    """Micro-benchmark: varredura aninhada antiga x motor de bitmaps de disponibilidade."""
+    import random
+    import timeit
+    from datetime import time
+    from app.services.availability_service import DayAvailability, BASE_SLOTS_2H30, BASE_SLOTS_1H15
+
+    def random_intervals(count):
+        intervals = []
+        for _ in range(count):
+            start = random.randrange(7 * 60, 21 * 60, 15)
+            end = min(start + random.choice([30, 75, 150]), 22 * 60)
+            intervals.append((start, end))
+        return intervals
+
+    def legacy_scan(unavailable):
+        # Reproduz o antigo generate_time_slots: cada slot contra cada intervalo
+        slots = {'2h30': [], '1h15': []}
+        for grid_name, base_slots in (('2h30', BASE_SLOTS_2H30), ('1h15', BASE_SLOTS_1H15)):
+            for start, end in base_slots:
+                status = 'available'
+                for (res_start, res_end), info in unavailable.items():
+                    if max(start, res_start) < min(end, res_end):
+                        status = info['status']
+                        break
+                slots[grid_name].append({
+                    "start_str": start.strftime('%Hh%M'), "end_str": end.strftime('%Hh%M'),
+                    "start_for_form": start.isoformat(), "end_for_form": end.isoformat(),
+                    "status": status, "user_name": ''
+                })
+        return slots
+
+    def engine_scan(intervals):
+        day = DayAvailability()
+        for start, end in intervals:
+            day.add('blocked', start, end)
+        return day.slot_grid()
+
+    print(f"{'salas':>6} {'blocos/sala':>12} {'antigo (ms)':>12} {'motor (ms)':>11} {'ganho':>7}")
+    for rooms in (1, 12, 50, 200):
+        for blocks in (2, 10, 50, 200):
+            per_room = [random_intervals(blocks) for _ in range(rooms)]
+            legacy_input = [
+                {(time(s // 60, s % 60), time(e // 60, e % 60)): {'status': 'blocked'} for s, e in intervals}
+                for intervals in per_room
+            ]
+            legacy = timeit.timeit(lambda: [legacy_scan(u) for u in legacy_input], number=repeat) / repeat
+            engine = timeit.timeit(lambda: [engine_scan(i) for i in per_room], number=repeat) / repeat
+            print(f"{rooms:>6} {blocks:>12} {legacy * 1000:>12.2f} {engine * 1000:>11.2f} {legacy / engine:>6.1f}x")
+
+@app.cli.command('availability_grid')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+@click.option('--start', 'start_str', help='Data inicial (AAAA-MM-DD).')
+@click.option('--end', 'end_str', help='Data final (AAAA-MM-DD).')
+@click.option('--room', 'room_ids', multiple=True, type=int, help='Restringe a uma ou mais salas.')
+def availability_grid_command(action, start_str, end_str, room_ids):
+    """Recalcula as grades de ocupação a partir das reservas/bloqueios e reporta divergências."""
+    import datetime
+    from app.services.availability_grid import check_grids
+
+    start = datetime.date.fromisoformat(start_str) if start_str else None
+    end = datetime.date.fromisoformat(end_str) if end_str else None
+    if action == 'rebuild' and start and end and not room_ids:
+        # Materializa o período inteiro para todas as salas ativas
+        room_ids = [room.id for room in Room.query.filter_by(is_active=True).all()]
+
+    drift = check_grids(start, end, rebuild=(action == 'rebuild'), room_ids=list(room_ids) or None)
+    for room_id, day, actual, expected in drift:
+        if actual is None:
+            print(f"Sala {room_id} em {day}: grade ausente ({len(expected)} entradas na origem)")
+        else:
+            print(f"Sala {room_id} em {day}: grade com {len(actual)} entradas, origem com {len(expected)}")
+    if action == 'rebuild':
+        print(f'{len(drift)} grade(s) regravada(s).')
+    elif drift:
+        print(f'{len(drift)} grade(s) divergente(s). Rode "flask availability_grid rebuild" para corrigir.')
+        raise SystemExit(1)
+    else:
+        print('Nenhuma divergência encontrada.')
+
+@app.cli.command('load_test_slot_events')
+@click.option('--subscribers', default=300, help='Conexões SSE simultâneas.')
+@click.option('--events', 'event_count', default=20, help='Eventos publicados durante o teste.')
+@click.option('--user-id', type=int, help='Usuário usado nas conexões (padrão: o primeiro cadastrado).')
+@click.option('--room', 'room_id', default=1, help='Sala assinada pelos clientes.')
+def load_test_slot_events_command(subscribers, event_count, user_id, room_id):
+    """Teste de carga local: centenas de assinantes SSE em um único worker threaded."""
+    import datetime
+    import http.client
+    import json
+    import threading
+    import time
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app.services.slot_events import bus
+
+    user_id = user_id or db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    if not user_id:
+        print('Nenhum usuário cadastrado para autenticar as conexões.')
+        raise SystemExit(1)
+    cookie_value = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+    cookie = f"{app.config['SESSION_COOKIE_NAME']}={cookie_value}"
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    db.session.remove()
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = f'/slot-events?room_ids={room_id}&date={day.isoformat()}'
+
+    latencies = []
+    received = [0] * subscribers
+    errors = []
+    results_lock = threading.Lock()
+
+    def client(index):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=60)
+            connection.request('GET', path, headers={'Cookie': cookie, 'Accept': 'text/event-stream'})
+            response = connection.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f'HTTP {response.status}')
+            while received[index] < event_count:
+                line = response.fp.readline()
+                if not line:
+                    break
+                if line.startswith(b'data: '):
+                    payload = json.loads(line[len(b'data: '):])
+                    with results_lock:
+                        latencies.append(time.perf_counter() - payload['sent_at'])
+                    received[index] += 1
+            connection.close()
+        except Exception as e:
+            with results_lock:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(subscribers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    while bus.subscriber_count() < subscribers and time.perf_counter() - started < 60 and not errors:
+        time.sleep(0.05)
+    connected = bus.subscriber_count()
+    print(f'{connected} assinantes conectados em {time.perf_counter() - started:.2f}s')
+
+    for _ in range(event_count):
+        bus.publish('locked', room_id, day, '07:00:00', '09:30:00', sent_at=time.perf_counter())
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(timeout=30)
+    server.shutdown()
+
+    delivered = sum(received)
+    latencies.sort()
+    print(f'Eventos entregues: {delivered}/{subscribers * event_count}')
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f'Latência de entrega: p50={p50:.1f}ms p99={p99:.1f}ms máx={latencies[-1] * 1000:.1f}ms')
+    if errors:
+        print(f'{len(errors)} conexão(ões) com erro, ex.: {errors[0]}')
+    if connected < subscribers or delivered < subscribers * event_count:
+        raise SystemExit(1)
+
+@app.cli.command('stress_booking')
+@click.option('--threads', default=16, help='Requisições simultâneas no mesmo horário.')
+@click.option('--rounds', default=5, help='Rodadas (cada uma em uma data diferente).')
+@click.option('--room', 'room_id', type=int, help='Sala usada no teste (padrão: a primeira ativa).')
+@click.option('--user-id', type=int, help='Usuário das reservas (padrão: o primeiro cadastrado).')
+def stress_booking_command(threads, rounds, room_id, user_id):
+    """Teste de estresse: várias threads disputam o mesmo horário (2h30 x 1h15 sobrepostos); só uma pode vencer."""
+    import datetime
+    import threading
+    from app.models.availability import ReservationSlot
+    from app.services.availability_grid import grid_for_update, remove_entry
+    from app.services.user_stats import forget_reservations
+
+    room_id = room_id or db.session.query(Room.id).filter_by(is_active=True).order_by(Room.id).limit(1).scalar()
+    user_id = user_id or db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    if not room_id or not user_id:
+        print('É preciso ao menos uma sala ativa e um usuário cadastrado.')
+        raise SystemExit(1)
+    # Metade disputa o 2h30 das 07h00, metade o 1h15 das 08h15 (que se sobrepõe a ele)
+    candidates = [('07:00:00', '09:30:00'), ('08:15:00', '09:30:00')]
+    failures = 0
+
+    for round_number in range(rounds):
+        # Datas distantes para não tocar a agenda real
+        day = datetime.date.today() + datetime.timedelta(days=3650 + round_number)
+        db.session.remove()
+        barrier = threading.Barrier(threads)
+        statuses = []
+        statuses_lock = threading.Lock()
+
+        def attempt(index):
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            start, end = candidates[index % 2]
+            barrier.wait()
+            response = client.post('/book-room', json={
+                'room_id': room_id, 'date': day.isoformat(), 'start_time': start, 'end_time': end
+            })
+            with statuses_lock:
+                statuses.append(response.status_code)
+
+        workers = [threading.Thread(target=attempt, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        with app.app_context():
+            reservations = Reservation.query.filter_by(room_id=room_id, reservation_date=day).all()
+            claims = ReservationSlot.query.filter_by(room_id=room_id, reservation_date=day).count()
+            winners = statuses.count(200)
+            conflicts = statuses.count(409)
+            ok = winners == 1 and len(reservations) == 1 and conflicts == threads - 1
+            failures += not ok
+            print(f'Rodada {round_number + 1}: {winners} vencedor(es), {conflicts} conflito(s) 409, '
+                  f'outros: {[s for s in statuses if s not in (200, 409)]}, reservas gravadas: {len(reservations)}, '
+                  f'quartos de hora ocupados: {claims} -> {"OK" if ok else "FALHOU"}')
+
+            # Limpa as reservas de teste, as grades correspondentes e as métricas do usuário
+            grid = grid_for_update(room_id, day)
+            forget_reservations(reservations)
+            for reservation in reservations:
+                remove_entry(grid, 'reserved', reservation.id)
+                db.session.delete(reservation)
+            db.session.commit()
+
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('temp_locks')
+@click.argument('action', type=click.Choice(['reap', 'stats']))
+@click.option('--batch-size', default=500, help='Linhas apagadas por lote.')
+def temp_locks_command(action, batch_size):
+    """Apaga os bloqueios temporários vencidos (em lotes) ou mostra as métricas da tabela."""
+    from app.services.temp_lock_reaper import reap_expired_locks, lock_metrics
+
+    if action == 'reap':
+        deleted = reap_expired_locks(batch_size)
+        print(f'{deleted} bloqueio(s) temporário(s) vencido(s) apagado(s).')
+    for name, value in lock_metrics().items():
+        print(f'{name}: {value}')
+
+
+@app.cli.command('idempotency_keys')
+@click.argument('action', type=click.Choice(['purge']))
+@click.option('--batch-size', default=500, help='Linhas apagadas por lote.')
+def idempotency_keys_command(action, batch_size):
+    """Apaga (em lotes) as chaves de idempotência vencidas."""
+    from app.services.idempotency import purge_expired_keys
+
+    deleted = purge_expired_keys(batch_size)
+    print(f'{deleted} chave(s) de idempotência vencida(s) apagada(s).')
+
+
+@app.cli.command('equipment_usage')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+def equipment_usage_command(action):
+    """Confere os contadores diários de equipamentos contra as reservas e reporta divergências."""
+    from app.services.equipment_service import check_equipment_usage
+
+    drift = check_equipment_usage(rebuild=(action == 'rebuild'))
+    for equipment_id, day, stored, counted in drift:
+        print(f'Equipamento {equipment_id} em {day}: contador {stored}, reservas {counted}')
+    if action == 'rebuild':
+        print(f'{len(drift)} contador(es) regravado(s).')
+    elif drift:
+        print(f'{len(drift)} contador(es) divergente(s). Rode "flask equipment_usage rebuild" para corrigir.')
+    else:
+        print('Contadores de equipamentos conferem com as reservas.')
+
+
+@app.cli.command('user_stats')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+def user_stats_command(action):
+    """Confere as métricas do painel (user_stats) contra as reservas e o log de cancelamentos."""
+    from app.services.user_stats import check_user_stats
+
+    drift = check_user_stats(rebuild=(action == 'rebuild'))
+    for user_id, name, stored, counted in drift:
+        print(f'Usuário {user_id}: {name} gravado {stored}, histórico {counted}')
+    stale = len({user_id for user_id, *_ in drift})
+    if action == 'rebuild':
+        print(f'{stale} linha(s) de métricas regravada(s).')
+    elif drift:
+        print(f'{stale} usuário(s) com métricas divergentes. Rode "flask user_stats rebuild" para corrigir.')
+        raise SystemExit(1)
+    else:
+        print('Métricas dos usuários conferem com o histórico.')
+
+
+@app.cli.command('list_views')
+@click.argument('action', type=click.Choice(['check']))
+def list_views_command(action):
+    """Confere colunas e consultas das telas de lista contra o orçamento de cada uma."""
+    from app.services.list_queries import check_list_views, LIST_VIEWS
+
+    results = check_list_views()
+    for name, columns, queries, ok in results:
+        _, max_columns, max_queries = LIST_VIEWS[name]
+        status = 'ok' if ok else 'ACIMA DO ORÇAMENTO'
+        print(f'{name}: {columns}/{max_columns} coluna(s), {queries}/{max_queries} consulta(s) - {status}')
+    if not all(ok for *_, ok in results):
+        raise SystemExit(1)
+
+
+@app.cli.command('query_plans')
+@click.argument('action', type=click.Choice(['check']))
+@click.option('--verbose', is_flag=True, help='Mostra o plano completo de cada consulta.')
+def query_plans_command(action, verbose):
+    """Confere (EXPLAIN QUERY PLAN) que as consultas quentes usam índice, sem varrer as tabelas."""
+    from app.services.query_plans import check_query_plans
+
+    results = check_query_plans()
+    for name, plan, scans in results:
+        print(f'{name}: ' + (f'VARRE {", ".join(scans)}' if scans else 'ok'))
+        if verbose or scans:
+            for line in plan:
+                print(f'    {line}')
+    if any(scans for _, _, scans in results):
+        raise SystemExit(1)
+
+
+@app.cli.command('user_search')
+@click.argument('action', type=click.Choice(['rebuild']))
+def user_search_command(action):
+    """Recria o índice de busca de usuários (FTS5) a partir da tabela user."""
+    from app.services.user_search import rebuild_search_index
+
+    indexed = rebuild_search_index()
+    db.session.commit()
+    print(f'{indexed} usuário(s) indexado(s).')
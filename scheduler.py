@@ -1,6 +1,7 @@
 import os
 from app import create_app, db
-from app.models.user import ParkingReservation, ParkingSpot, User
+from app.models.user import ParkingSpot
+from app.services.parking_service import garage_report_query, parking_window, minutes_to_time
 from datetime import datetime, timedelta
 
 # --- CONFIGURAÇÃO DA APLICAÇÃO ---
@@ -25,21 +26,24 @@ def send_daily_garage_report():
     
     report_by_spot = {}
     
-    # 3. Para cada vaga, buscar as reservas de amanhã
+    # 3. Buscar as reservas de amanhã de todas as vagas de uma vez
+    reservations_by_spot = {}
+    # O doutor (com os dados do veículo) vem no mesmo SELECT, sem uma consulta por reserva
+    for res in db.session.scalars(garage_report_query([spot.id for spot in active_spots], tomorrow)):
+        reservations_by_spot.setdefault(res.spot_id, []).append(res)
+    
     for spot in active_spots:
-        reservations = ParkingReservation.query.join(User).filter(
-            ParkingReservation.spot_id == spot.id,
-            ParkingReservation.reservation_date == tomorrow
-        ).order_by(User.nome_completo).all() # Idealmente, ordenar por horário da reserva de sala
+        # Cada vaga pode atender vários doutores no dia: lista em ordem de horário
+        reservations = sorted(reservations_by_spot.get(spot.id, []), key=parking_window)
         
         if reservations:
             report_by_spot[spot.name] = []
             for res in reservations:
                 user = res.user
-                # Formata a linha para cada doutor
-                # Futuramente, podemos adicionar o horário da reserva da sala aqui
+                start, end = (minutes_to_time(minutes) for minutes in parking_window(res))
+                # Formata a linha para cada doutor com a janela de uso da vaga
                 report_line = (
-                    f"- 07h00-22h00 • {user.nome_completo} - "
+                    f"- {start:%Hh%M}-{end:%Hh%M} • {user.nome_completo} - "
                     f"modelo: {user.veiculo_modelo or 'Não informado'} | "
                     f"PLACA: {user.veiculo_placa or 'Não informada'}"
                 )